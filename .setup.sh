@@ -14,5 +14,15 @@ echo "    \"meta_appname\" : \"$meta_appname\"," >> Config.json
 read -p "Enter twitter profile URL: " twitter_url
 echo "    \"twitter_url\" : \"$twitter_url\"," >> Config.json
 read -p "Enter Instagram profile URL: " insta_url
-echo "    \"insta_url\" : \"$insta_url\"" >> Config.json
+echo "    \"insta_url\" : \"$insta_url\"," >> Config.json
+read -p "Enter posts per page for the archive and category pages, or 0 for one page each: " posts_per_page
+echo "    \"posts_per_page\" : \"${posts_per_page:-0}\"," >> Config.json
+read -p "Enter number of posts in the feeds, or all for every post: " feed_items
+echo "    \"feed_items\" : \"${feed_items:-25}\"," >> Config.json
+read -p "Keep a gzipped copy of each page for your web server, yes or no: " gzip
+echo "    \"gzip\" : \"${gzip:-no}\"," >> Config.json
+read -p "Minify each page and the stylesheet, yes or no: " minify
+echo "    \"minify\" : \"${minify:-no}\"," >> Config.json
+read -p "Inline the styles the top of each page needs, yes or no: " inline_css
+echo "    \"inline_css\" : \"${inline_css:-no}\"" >> Config.json
 echo "}" >> Config.json
\ No newline at end of file
@@ -0,0 +1,106 @@
+# Purpose: Fingerprint the static assets the main template links to. Each
+# {{/assets/...}} placeholder becomes the path of a copy of the asset named
+# for a digest of its contents, like /assets/main.0123456789.css, so browsers
+# can cache it for good: a changed asset gets a new name. Stylesheets' copies
+# can be minified. Record each asset's stat data with its fingerprint, so an
+# unchanged asset isn't hashed again.
+
+# Import methods. hashlib, json, and the output helpers are imported when the
+# assets are fingerprinted, so checking for a no-op build doesn't load them.
+from os import stat # Asset changes
+from os.path import join, exists, splitext # Asset paths
+
+# Constants
+## STATE_FILE: Location of each asset's stat data and fingerprint (String)
+## MANIFEST: Name of the file in the assets directory that maps each asset to
+## its fingerprinted copy (String)
+## DIGITS: Hex digits in a fingerprint (Int)
+STATE_FILE = "./.cache/fingerprints.json"
+MANIFEST = "fingerprints.json"
+DIGITS = 10
+
+# Method: Fingerprinted
+# Purpose: Tell whether a file name has a fingerprint in it, like
+# main.0123456789.css.
+# Parameters:
+# - name: File name (String)
+# Return: True (Fingerprinted), False (Not)
+def Fingerprinted(name):
+    parts = name.split(".")
+    return (len(parts) >= 3 and len(parts[-2]) == DIGITS and all(x in "0123456789abcdef" for x in parts[-2]))
+
+class Fingerprints:
+    # Method: __init__
+    # Purpose: Load each asset's stat data and fingerprint from the last build.
+    # Parameters:
+    # - self: Class namespace
+    # - root: Assets directory (String)
+    # - minify: Minify the copies of stylesheets (Boolean)
+    # - path: Path to the state file (String)
+    # Return: none
+    def __init__(self, root, minify=False, path=STATE_FILE):
+        from BuildState import LoadCache # Cache files
+        self.__root = root
+        self.__minify = minify
+        self.__path = path
+        state = LoadCache(path, {})
+        self.__assets = state.get("assets", {})
+        self.__copies = state.get("copies", [])
+        self.__used = {}
+
+    # Method: get
+    # Purpose: Find an asset's fingerprinted copy. Hash the asset, and copy it,
+    # only if its size or mtime changed since the last build, its copy is
+    # missing, or minifying was turned on or off.
+    # Parameters:
+    # - self: Class namespace
+    # - name: Path to the asset, relative to the assets directory (String)
+    # Return: Path to the copy, relative to the assets directory, or None if
+    # there is no such asset (String)
+    def get(self, name):
+        from hashlib import sha1 # Fingerprints
+        from Output import Replace # Output files
+        from Minify import MinifyCSS # Minified stylesheets
+        try:
+            info = stat(join(self.__root, name))
+        except OSError:
+            return None
+        entry = self.__assets.get(name)
+        minify = (self.__minify and name.endswith(".css"))
+        if (entry is None or entry[0] != info.st_size or entry[1] != info.st_mtime_ns or entry[3:] != [minify] or not exists(join(self.__root, entry[2]))):
+            with open(join(self.__root, name), "rb") as fd:
+                data = fd.read()
+            if (minify):
+                data = MinifyCSS(data.decode("utf-8")).encode("utf-8")
+            stem, extension = splitext(name)
+            copy = f"{stem}.{sha1(data).hexdigest()[:DIGITS]}{extension}"
+            if (not exists(join(self.__root, copy))):
+                Replace(join(self.__root, copy), data)
+            entry = [info.st_size, info.st_mtime_ns, copy, minify]
+            self.__assets[name] = entry
+            if (copy not in self.__copies):
+                self.__copies.append(copy)
+        self.__used[name] = entry[2]
+        return entry[2]
+
+    # Method: save
+    # Purpose: Write the manifest of the assets used in this build, delete
+    # copies no page links to anymore, and save the state file.
+    # Parameters:
+    # - self: Class namespace
+    # - root: Assets directory the build wrote to, which may be a staging
+    #   directory (String)
+    # Return: none
+    def save(self, root):
+        from json import dumps # Manifest format
+        from BuildState import SaveCache # Cache files
+        from Output import WriteIfChanged, RemoveOutput # Output files
+        if (len(self.__used) != 0 or exists(join(root, MANIFEST))):
+            WriteIfChanged(join(root, MANIFEST), dumps(self.__used, indent=4, sort_keys=True)+"\n")
+        current = set(self.__used.values())
+        for copy in self.__copies:
+            if (copy not in current):
+                RemoveOutput(join(root, copy))
+        self.__copies = sorted(current)
+        self.__assets = {x:self.__assets[x] for x in self.__used}
+        SaveCache(self.__path, {"assets":self.__assets, "copies":self.__copies})
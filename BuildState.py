@@ -0,0 +1,289 @@
+# Purpose: Persist what First Crack knows about each content file between
+# builds, so an unchanged file costs one stat call instead of a read and a
+# Markdown render. Also record which global inputs--template halves, config
+# keys, the parser, and series index files--each output was built from, so a
+# change to one of them invalidates exactly the outputs that depend on it.
+
+# Import methods
+from os import stat, replace, makedirs # File operations
+from os.path import isfile, dirname, join # File operations
+from hashlib import sha1 # Content digests
+from json import load, dump # State file format
+from time import mktime, strptime # Pubdate header parsing
+
+# Constants
+## STATE_FILE: Default location of the build state file (String)
+## VERSION: State file format version. Bump to discard old state. (Int)
+STATE_FILE = "./.cache/buildstate.json"
+VERSION = 3
+
+# Method: Digest
+# Purpose: Hash the contents of a file.
+# Parameters:
+# - path: Path to the file to hash (String)
+# Return: Hex digest of the file's bytes (String)
+def Digest(path):
+    with open(path, "rb") as fd:
+        return sha1(fd.read()).hexdigest()
+
+# Method: LoadCache
+# Purpose: Load a JSON cache file from the cache directory.
+# Parameters:
+# - path: Path to the cache file (String)
+# - default: Value to return if the file is missing or corrupt (Any)
+# Return: Cached value (Any)
+def LoadCache(path, default):
+    if (not isfile(path)):
+        return default
+    try:
+        with open(path, "r", encoding="utf-8") as fd:
+            return load(fd)
+    except ValueError:
+        return default
+
+# Method: SaveCache
+# Purpose: Write a JSON cache file, by writing a temporary file and renaming
+# it over the old one.
+# Parameters:
+# - path: Path to the cache file (String)
+# - data: Value to cache (Any)
+# Return: none
+def SaveCache(path, data):
+    if (dirname(path) != ""):
+        makedirs(dirname(path), exist_ok=True)
+    with open(path+".tmp", "w", encoding="utf-8") as fd:
+        dump(data, fd, separators=(",", ":"))
+    replace(path+".tmp", path)
+
+class BuildState:
+    # Method: __init__
+    # Purpose: Load the persisted build state, or start with an empty one.
+    # Parameters:
+    # - self: Class namespace
+    # - path: Path to the state file (String)
+    # Return: none
+    def __init__(self, path=STATE_FILE):
+        self.__path = path
+        # Each entry maps a content file name to [size, mtime, content digest,
+        # output digest, publication time, dependency set, dependency digest,
+        # output path, output size, output mtime in nanoseconds]
+        self.__files = {}
+        # Each entry maps another output, like a template page, to
+        # [dependency set, dependency digest]
+        self.__outputs = {}
+        # Each entry maps a global input file to [size, mtime, digest]
+        self.__stats = {}
+        # Dependency sets: sorted lists of input keys, shared between outputs
+        self.__depsets = []
+        self.__depset_ids = {}
+        # Current digest of each global input, and memoized digests of each
+        # dependency set over them
+        self.__inputs = {}
+        self.__combined = {}
+        self.__dirty = False
+        # A missing, old, or corrupt state file only costs a full rebuild.
+        state = LoadCache(path, {})
+        if (state.get("version") == VERSION):
+            self.__files = state["files"]
+            self.__outputs = state["outputs"]
+            self.__stats = state["stats"]
+            self.__depsets = state["depsets"]
+        self.__depset_ids = {tuple(keys):i for i,keys in enumerate(self.__depsets)}
+
+    # Method: __pubdate
+    # Purpose: Read the Pubdate header out of a content file's raw bytes.
+    # Parameters:
+    # - self: Class namespace
+    # - __data: Raw content file (Bytes)
+    # Return: Pubdate as seconds since the epoch, or None (Float)
+    def __pubdate(self, __data):
+        for line in __data.split(b"\n", 6)[0:6]:
+            if (line[0:9] == b"Pubdate: "):
+                try:
+                    return mktime(strptime(line[9:].decode("utf-8").strip(), "%Y/%m/%d %H:%M:%S"))
+                except ValueError:
+                    return None
+        return None
+
+    # Method: __depset
+    # Purpose: Intern a list of input keys as a shared dependency set.
+    # Parameters:
+    # - self: Class namespace
+    # - __keys: Input keys an output was built from (List)
+    # Return: Index of the dependency set (Int)
+    def __depset(self, __keys):
+        __keys = tuple(sorted(set(__keys)))
+        if (__keys not in self.__depset_ids):
+            self.__depset_ids[__keys] = len(self.__depsets)
+            self.__depsets.append(list(__keys))
+        return self.__depset_ids[__keys]
+
+    # Method: __current
+    # Purpose: Tell whether a content file's output is still the file its
+    # last build wrote. Compare the stat data first, and only hash the output
+    # when its mtime moved but its size didn't.
+    # Parameters:
+    # - self: Class namespace
+    # - __entry: The content file's entry (List)
+    # - __root: Output directory (String)
+    # Return: True (Output intact), False (Output missing or changed)
+    def __current(self, __entry, __root):
+        try:
+            info = stat(join(__root, __entry[7]))
+        except OSError:
+            return False
+        if (info.st_size != __entry[8]):
+            return False
+        if (info.st_mtime_ns != __entry[9]):
+            if (Digest(join(__root, __entry[7])) != __entry[3]):
+                return False
+            __entry[9] = info.st_mtime_ns
+            self.__dirty = True
+        return True
+
+    # Method: __combine
+    # Purpose: Digest the current value of every input in a dependency set.
+    # Parameters:
+    # - self: Class namespace
+    # - __depset: Index of the dependency set (Int)
+    # Return: Combined digest (String)
+    def __combine(self, __depset):
+        if (__depset not in self.__combined):
+            self.__combined[__depset] = sha1("\n".join(f"{key}={self.__inputs.get(key, '')}" for key in self.__depsets[__depset]).encode("utf-8")).hexdigest()
+        return self.__combined[__depset]
+
+    # Method: digest
+    # Purpose: Digest a global input file, like a template or a series index,
+    # hashing it only when its stat data changed since the last build.
+    # Parameters:
+    # - self: Class namespace
+    # - path: Path to the input file (String)
+    # Return: Hex digest of the file, or an empty string if it is missing (String)
+    def digest(self, path):
+        try:
+            info = stat(path)
+        except OSError:
+            return ""
+        entry = self.__stats.get(path)
+        if (entry is None or entry[0] != info.st_size or entry[1] != info.st_mtime):
+            entry = [info.st_size, info.st_mtime, Digest(path)]
+            self.__stats[path] = entry
+            self.__dirty = True
+        return entry[2]
+
+    # Method: inputs
+    # Purpose: Set the current digest of each global input.
+    # Parameters:
+    # - self: Class namespace
+    # - inputs: Input keys mapped to digests (Dictionary)
+    # Return: none
+    def inputs(self, inputs):
+        self.__inputs = inputs
+        self.__combined = {}
+
+    # Method: check
+    # Purpose: Decide whether a content file needs to be rendered. Compare the
+    # stat data first, and only hash the file when the stat data disagrees.
+    # Then check the global inputs the file was last built from, and that its
+    # output is still there, as it was written.
+    # Parameters:
+    # - self: Class namespace
+    # - name: Content file name (String)
+    # - path: Path to the content file (String)
+    # - info: Result of os.stat on the content file (os.stat_result)
+    # - root: Output directory (String)
+    # Return: [publication time (Float), needs render (Boolean)] (List)
+    def check(self, name, path, info, root):
+        entry = self.__files.get(name)
+        if (entry is None):
+            return [info.st_mtime, True]
+        fresh = (self.__combine(entry[5]) == entry[6] and self.__current(entry, root))
+        if (entry[0] == info.st_size and entry[1] == info.st_mtime):
+            return [entry[4], not fresh]
+
+        # The stat data moved. Hash the file to see whether its content did.
+        with open(path, "rb") as fd:
+            data = fd.read()
+        digest = sha1(data).hexdigest()
+        if (entry[2] != digest):
+            return [info.st_mtime, True]
+
+        # Same content, new mtime. A checkout or copy keeps the post where it
+        # was; a revert to the Pubdate header (-r) moves it.
+        if (info.st_mtime != entry[4] and info.st_mtime == self.__pubdate(data)):
+            return [info.st_mtime, True]
+        entry[0] = info.st_size
+        entry[1] = info.st_mtime
+        self.__dirty = True
+        return [entry[4], not fresh]
+
+    # Method: stale
+    # Purpose: Decide whether an output other than a post, like a template
+    # page, needs to be built again.
+    # Parameters:
+    # - self: Class namespace
+    # - name: Output name (String)
+    # - deps: Input keys the output is built from (List)
+    # Return: True (Build again), False (Up to date)
+    def stale(self, name, deps):
+        entry = self.__outputs.get(name)
+        depset = self.__depset(deps)
+        return (entry is None or entry[0] != depset or entry[1] != self.__combine(depset))
+
+    # Method: built
+    # Purpose: Record that an output other than a post was built from the
+    # current global inputs.
+    # Parameters:
+    # - self: Class namespace
+    # - name: Output name (String)
+    # - deps: Input keys the output was built from (List)
+    # Return: none
+    def built(self, name, deps):
+        depset = self.__depset(deps)
+        self.__outputs[name] = [depset, self.__combine(depset)]
+        self.__dirty = True
+
+    # Method: record
+    # Purpose: Record the result of rendering a content file.
+    # Parameters:
+    # - self: Class namespace
+    # - name: Content file name (String)
+    # - info: Result of os.stat on the content file, after rendering (os.stat_result)
+    # - digest: Digest of the content file (String)
+    # - output: Digest of the rendered structure file (String)
+    # - pubtime: Publication time the file was rendered with (Float)
+    # - deps: Global input keys the file was rendered with (List)
+    # - page: Path to the rendered structure file, relative to root (String)
+    # - root: Output directory (String)
+    # Return: none
+    def record(self, name, info, digest, output, pubtime, deps, page, root):
+        depset = self.__depset(deps)
+        written = stat(join(root, page))
+        self.__files[name] = [info.st_size, info.st_mtime, digest, output, pubtime, depset, self.__combine(depset), page, written.st_size, written.st_mtime_ns]
+        self.__dirty = True
+
+    # Method: prune
+    # Purpose: Forget content files that no longer exist.
+    # Parameters:
+    # - self: Class namespace
+    # - names: Content file names seen during this build (Set)
+    # Return: Names of the removed files (List)
+    def prune(self, names):
+        removed = [name for name in self.__files if name not in names]
+        for name in removed:
+            del self.__files[name]
+        if (len(removed) != 0):
+            self.__dirty = True
+        return removed
+
+    # Method: save
+    # Purpose: Write the state file, if anything changed, by writing a
+    # temporary file and renaming it over the old one.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    def save(self):
+        if (not self.__dirty):
+            return
+        SaveCache(self.__path, {"version": VERSION, "files": self.__files, "outputs": self.__outputs, "stats": self.__stats, "depsets": self.__depsets})
+        self.__dirty = False
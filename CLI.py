@@ -2,16 +2,13 @@
 # as possible command line interface. Simply paste in this block, then edit.
 
 ### Import modules
+### tty, termios, re, and webbrowser are imported where they are used, so a
+### build that never enters the interface doesn't pay to load them.
 from sys import exit, argv, stdout, stdin # Command line interface
-from tty import setraw, setcbreak # Raw input
-from termios import tcgetattr, tcsetattr, TCSAFLUSH # Backup/resume shell
 from os.path import exists # Reading input files
-from os import popen, remove # Detect terminal size
-from re import sub # Change menu to try to avoid text wrapping
+from os import remove # Build state
 from os import listdir, stat, utime # Directory traversal
-from os.path import isfile # Web server
-from time import localtime, mktime, strptime # Timestamping logs
-from webbrowser import open_new_tab # Preview
+from time import mktime, strptime # Reverting timestamps
 
 # Class: c(olors)
 # Purpose: provide access to ANSI escape codes for styling output
@@ -27,8 +24,10 @@ class c():
 
 # Method: ActivateInterface
 # Purpose: Activate the command line interface.
-# Parameters: none.
-def ActivateInterface():
+# Parameters:
+# - server: Preview server engine, from Server.ENGINES (String)
+# Return: True (Full rebuild requested), False (Build as usual)
+def ActivateInterface(server="thread"):
     # If the user just runs the file, or only includes "-v" verbose flag, notify
     # them that "-a" enters command line interface, then build the site.
     if (len(argv) == 1 or len(argv) == 2 and "-v" in argv):
@@ -36,19 +35,72 @@ def ActivateInterface():
     # If they have run the program with up to 2 parameters other than "-v",
     # open the command line interface.
     elif (len(argv) < 4):
-        DisplayInterface(argv[1:])
+        return DisplayInterface(argv[1:], server)
     else: # Too many parameters
         print(c.FAIL+"Too many parameters"+c.ENDC)
         exit(0)
+    return False
+
+# Method: GetOption
+# Purpose: Remove an option that takes a value, like "--jobs 4" or
+# "--jobs=4", from the command line parameters, so the rest of them can be
+# handled as usual. If the default is a number, the value must be a positive
+# whole number.
+# Parameters:
+# - name: Option name, like "--jobs" (String)
+# - default: Value to use if the option is absent (Int or String)
+# Return: Option value (Int or String)
+def GetOption(name, default):
+    value = None
+    for i,each in enumerate(argv):
+        if (each == name):
+            value = argv[i+1] if i+1 < len(argv) else ""
+            del argv[i:i+2]
+            break
+        elif (each.startswith(name+"=")):
+            value = each[len(name)+1:]
+            del argv[i]
+            break
+    if (value is None):
+        return default
+    if (not isinstance(default, int)):
+        if (value == ""):
+            print(f"{c.FAIL}Error:{c.ENDC} {name} requires a value.")
+            exit(0)
+        return value
+    if (not value.isdigit() or int(value) == 0):
+        print(f"{c.FAIL}Error:{c.ENDC} {name} requires a positive whole number.")
+        exit(0)
+    return int(value)
+
+# Method: GetFlag
+# Purpose: Remove an option that takes no value, like "--deterministic", from
+# the command line parameters, so the rest of them can be handled as usual.
+# Parameters:
+# - name: Option name (String)
+# Return: True (Option given), False (Option absent)
+def GetFlag(name):
+    if (name not in argv):
+        return False
+    while (name in argv):
+        argv.remove(name)
+    return True
 
 # Method: DisplayInterface
 # Purpose: Provide a command line interface for the script, for more granular control
 # of its operation.
-# Parameters: params: command line parameters (String)
-def DisplayInterface(params):
+# Parameters:
+# - params: command line parameters (String)
+# - server: Preview server engine, from Server.ENGINES (String)
+# Return: True (Full rebuild requested), False (Build as usual)
+def DisplayInterface(params, server="thread"):
+    from re import sub # Change menu to try to avoid text wrapping
+    from shutil import get_terminal_size # Detect terminal size
+
     # Store the menu in a variable so as to provide easy access at any point in time.
     menu = f"""
-    * To clear all structure files:                    {c.OKGREEN}-R{c.ENDC}
+    * To rebuild every structure file:                 {c.OKGREEN}-R{c.ENDC}
+    * To roll back to the site before the last -R:     {c.OKGREEN}-U{c.ENDC}
     * To revert post timestamps:                       {c.OKGREEN}-r{c.ENDC}
     * To display this menu:                            {c.WARNING}-h{c.ENDC}
     
@@ -60,9 +112,8 @@ def DisplayInterface(params):
     """
 
     # If the terminal window is less than 59 characters wide, resize the menu
-    # to better fit.
-    rows, columns = popen('stty size', 'r').read().split()
-    if (int(columns) < 59):
+    # to better fit. Without a terminal, like under make, assume it is wide enough.
+    if (get_terminal_size().columns < 59):
         menu = sub(":\s+", ":\n        ", menu)
 
     # Continue prompting the user for input until they enter a valid argument
@@ -71,15 +122,26 @@ def DisplayInterface(params):
             print(menu)
             params = GetUserInput("#: ")
         if ("-R" in params): # Rebuild all structure files
-            print(" - Clearing structure files... ", end="", flush=True)
-            for file in listdir("./html"):
-                if (file.endswith(".html")):
-                    remove("./html/"+file)
-            for file in listdir("./html/blog"):
-                if (file.endswith(".html")):
-                    remove("./html/blog/"+file)
+            # Forget the build state and manifest, so every post is rendered
+            # again. The build renders the site into a staging directory and
+            # swaps it in once it's done, so the live site stays whole.
+            print(" - Clearing build state... ", end="", flush=True)
+            ClearState()
             print(f"{c.OKGREEN}done.{c.ENDC}")
-            break
+            return True
+        elif ("-U" in params): # Roll back the last full rebuild
+            from Stage import Rollback # Previous generation
+
+            # The build state describes the site just rolled back from, so
+            # forget it, too; otherwise the next build would only write the
+            # pages whose inputs changed, and leave the rest as they were in
+            # the older site.
+            print(" - Rolling back to the previous site... ", end="", flush=True)
+            if (Rollback("./html")):
+                ClearState()
+                print(f"{c.OKGREEN}done.{c.ENDC}")
+            else:
+                print(f"{c.WARNING}no previous site to roll back to.{c.ENDC}")
         elif ("-r" in params): # Revert post timestamps
             print(" - Reverting post timestamps... ", end="", flush=True)
             for files in listdir("./content"):
@@ -89,91 +151,17 @@ def DisplayInterface(params):
         elif ("-h" in params or "help" in params): # Print help menu
             print(f'Entering "-h" at any time will display the menu below.\n{menu}')
         elif ("-p" in params or "-P" in params): # Web server
-            from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
-            
-            # Clear log file
-            open("./server.log", "w").close()
-
-            # Setup the request handler
-            class GetHandler(BaseHTTPRequestHandler):
-                def do_GET(self): # Handle GET requests
-                    # Transform request for root to request for index.html
-                    if (self.path == "/"):
-                        self.path = "/index.html"
-                    
-                    # Strip leading / from request
-                    resource = self.path[1:]
-                    
-                    # Test for file existence
-                    if (isfile(f"./html/{resource}")):
-                        # If file exists, send 200 code and appropriate content
-                        # header based on file type.
-                        self.send_response(200)
-                        extension = resource.rsplit(".", 1)[-1]
-                        if (extension == "css"):
-                            self.send_header('Content-Type','text/css; charset=utf-8')
-                        elif (extension == "html"):
-                            self.send_header('Content-Type','text/html; charset=utf-8')
-                        elif (extension == "xml"):
-                            self.send_header('Content-Type','text/xml; charset=utf-8')
-                        elif (extension == "jpg"):
-                            self.send_header('Content-Type','image/jpg')
-                        elif (extension == "ico"):
-                            self.send_header('Content-Type','image/ico')
-                        else:
-                            self.send_header('Content-Type','text/plain; charset=utf-8')
-                        self.end_headers()
-
-                        # Serve file
-                        fd = open(f"./html/{resource}", "rb")
-                        for i,line in enumerate(fd):
-                            self.wfile.write(line)
-                        fd.close()
-                    # If file does not exist, send 404 code and serve 404 page.
-                    else:
-                        self.send_response(404)
-                        self.send_header('Content-Type','text/html; charset=utf-8')
-                        self.end_headers()
-                        fd = open(f"./html/404.html", "rb")
-                        for i,line in enumerate(fd):
-                            self.wfile.write(line)
-                        fd.close()
+            from webbrowser import open_new_tab # Preview
+            from Server import PreviewServer # Web server
 
-                # Send nothing if client uses a valid but unsupported HTTP methods.
-                def do_HEAD(self): return False
-                def do_POST(self): return False
-                def do_PUT(self): return False
-                def do_DELETE(self): return False
-                def do_CONNECT(self): return False
-                def do_OPTIONS(self): return False
-                def do_TRACE(self): return False
-                def do_PATCH(self): return False
-
-                # Custom log handler that prints log message and writes to log file.
-                def log_request(self, code):
-                    server_fd = open("./server.log", "a")
-                    server_fd.write(f"{self.client_address[0]} - - [{self.log_date_time_string()}] {self.requestline} {code} -\n")
-                    server_fd.close()
-                    print(f"{self.client_address[0]} - - [{self.log_date_time_string()}] {self.requestline} {code} -")
-
-            # Make web server public or private, and notify user
-            if ("-P" in argv):
-                server_address = ("0.0.0.0", 8000)
-                print(f"Serving {c.WARNING}public{c.ENDC} web server at port {c.OKGREEN}8000{c.ENDC}. Use {c.BOLD}CTRL-C{c.ENDC} to exit.")
-            else:
-                server_address = ("127.0.0.1", 8000)
-                print(f"Serving {c.OKGREEN}private{c.ENDC} web server at port {c.OKGREEN}8000{c.ENDC}. Use {c.BOLD}CTRL-C{c.ENDC} to exit.")
             # Create the server, and serve it until the user issues an interrupt.
-            httpd = ThreadingHTTPServer(server_address, GetHandler)
+            httpd = PreviewServer("-P" in argv, server)
             try:
                 open_new_tab("http://localhost:8000")
                 httpd.serve_forever()
-            # On interrupt, close the log file and gracefully shutdown web server.
+            # On interrupt, gracefully shutdown web server and close the log file.
             except KeyboardInterrupt:
                 print(f"\r{c.OKGREEN}Exiting.{c.ENDC}")
-                server_fd = open("./server.log", "a")
-                server_fd.write(f"- - - [{localtime().tm_mday}/{localtime().tm_mon}/{localtime().tm_year} {localtime().tm_hour}:{localtime().tm_min}:{localtime().tm_sec}] Graceful shutdown - -\n")
-                server_fd.close()
                 httpd.shutdown()
                 exit(0)
         elif ("!exit" in params): # Exit without building site
@@ -185,6 +173,7 @@ def DisplayInterface(params):
         if ("--exit" in params):
             exit(0)
         params = GetUserInput("#: ")
+    return False
 
 # Method: GetUserInput
 # Purpose: Accept user input and perform basic bounds checking
@@ -217,6 +206,9 @@ def GetUserInput(prompt):
 # Parameters:
 # - prompt: Text to prompt the user for input (String)
 def GetLine(prompt):
+    from tty import setraw # Raw input
+    from termios import tcgetattr, tcsetattr, TCSAFLUSH # Backup/resume shell
+
     # Backup the shell session, to restore it later.
     backup = tcgetattr(stdin)
 
@@ -277,6 +269,16 @@ def GetLine(prompt):
     # Return the string the user's input.
     return input
 
+# Method: ClearState
+# Purpose: Forget the build state and manifest, so the next build renders
+# every page again.
+# Parameters: none
+# Return: none
+def ClearState():
+    for each in ["./.cache/buildstate.json", "./.cache/manifest"]:
+        if (exists(each)):
+            remove(each)
+
 # Method: Revert
 # Purpose: Check file timestamp against article timestamp. Correct if necessary.
 # Parameters:
@@ -0,0 +1,246 @@
+# Purpose: Keep a persistent, queryable catalog of every post in an SQLite
+# database, so archive, category, blog, and feed pages can be generated with
+# indexed queries instead of sweeps over the content directory.
+
+# Import methods
+from sqlite3 import connect, Row # Catalog database
+from os import makedirs # Cache directory
+from os.path import dirname # Cache directory
+
+# Constants
+## CATALOG_FILE: Default location of the catalog database (String)
+## VERSION: Schema version. Bump to rebuild the catalog. (Int)
+## COLUMNS: Post record fields stored in the catalog (List)
+CATALOG_FILE = "./.cache/catalog.db"
+VERSION = 1
+COLUMNS = ["type", "title", "link", "pubdate", "category", "author", "output", "excerpt", "datetime"]
+
+class Catalog:
+    # Method: __init__
+    # Purpose: Open the catalog, creating it if necessary.
+    # Parameters:
+    # - self: Class namespace
+    # - path: Path to the catalog database (String)
+    # Return: none
+    def __init__(self, path=CATALOG_FILE):
+        if (dirname(path) != ""):
+            makedirs(dirname(path), exist_ok=True)
+        self.__db = connect(path, timeout=60)
+        self.__db.row_factory = Row
+        if (self.__db.execute("PRAGMA user_version").fetchone()[0] != VERSION):
+            self.__db.execute("DROP TABLE IF EXISTS posts")
+            self.__db.execute("DROP TABLE IF EXISTS fragments")
+            self.__db.execute(f"""CREATE TABLE posts (content TEXT PRIMARY KEY, {", ".join(x+" TEXT" for x in COLUMNS)}, pubtime REAL, year TEXT, month TEXT, category_file TEXT)""")
+            self.__db.execute("CREATE INDEX posts_pubtime ON posts (pubtime)")
+            self.__db.execute("CREATE INDEX posts_month ON posts (year, month, pubtime)")
+            self.__db.execute("CREATE INDEX posts_category ON posts (category_file, pubtime)")
+            self.__db.execute(f"PRAGMA user_version = {VERSION}")
+            self.__db.commit()
+        self.__db.execute("CREATE TABLE IF NOT EXISTS fragments (content TEXT PRIMARY KEY, key TEXT, rss TEXT, atom TEXT)")
+
+    # Method: __rows
+    # Purpose: Run a query and return its rows as dictionaries.
+    # Parameters:
+    # - self: Class namespace
+    # - __query: SQL query (String)
+    # - __args: Query parameters (Tuple)
+    # Return: Matching rows (List)
+    def __rows(self, __query, __args=()):
+        return [dict(x) for x in self.__db.execute(__query, __args)]
+
+    # Method: update
+    # Purpose: Add or replace a post's record.
+    # Parameters:
+    # - self: Class namespace
+    # - content: Content file name (String)
+    # - record: Post record, from TestAndBuild (Dict)
+    # - pubtime: Publication time, in seconds since the epoch (Float)
+    # Return: none
+    def update(self, content, record, pubtime):
+        self.__db.execute(f"INSERT OR REPLACE INTO posts VALUES ({', '.join(['?']*(len(COLUMNS)+5))})", [content]+[record[x] for x in COLUMNS]+[pubtime, record["datetime"][0:4], record["datetime"][5:7], CategoryFile(record["category"])])
+
+    # Method: remove
+    # Purpose: Remove a post's record.
+    # Parameters:
+    # - self: Class namespace
+    # - content: Content file name (String)
+    # Return: none
+    def remove(self, content):
+        self.__db.execute("DELETE FROM posts WHERE content = ?", (content,))
+        self.__db.execute("DELETE FROM fragments WHERE content = ?", (content,))
+
+    # Method: commit
+    # Purpose: Commit pending updates, so worker processes can see them.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    def commit(self):
+        self.__db.commit()
+
+    # Method: get
+    # Purpose: Look up a post's record.
+    # Parameters:
+    # - self: Class namespace
+    # - content: Content file name (String)
+    # Return: Post record, or None (Dict)
+    def get(self, content):
+        rows = self.__rows("SELECT * FROM posts WHERE content = ?", (content,))
+        return rows[0] if len(rows) != 0 else None
+
+    # Method: files
+    # Purpose: List every content file in the catalog.
+    # Parameters:
+    # - self: Class namespace
+    # Return: Content file names (Set)
+    def files(self):
+        return set(x[0] for x in self.__db.execute("SELECT content FROM posts"))
+
+    # Method: posts
+    # Purpose: List posts, newest first.
+    # Parameters:
+    # - self: Class namespace
+    # - limit: Maximum number of posts, or -1 for all of them (Int)
+    # - offset: Number of newest posts to skip (Int)
+    # Return: Post records (List)
+    def posts(self, limit=-1, offset=0):
+        return self.__rows("SELECT * FROM posts ORDER BY pubtime DESC, content DESC LIMIT ? OFFSET ?", (limit, offset))
+
+    # Method: newest
+    # Purpose: List the newest posts' content file names.
+    # Parameters:
+    # - self: Class namespace
+    # - limit: Maximum number of posts, or -1 for all of them (Int)
+    # Return: Content file names, newest first (List)
+    def newest(self, limit):
+        return [x[0] for x in self.__db.execute("SELECT content FROM posts ORDER BY pubtime DESC, content DESC LIMIT ?", (limit,))]
+
+    # Method: feed
+    # Purpose: List the newest posts with their cached feed fragments.
+    # Parameters:
+    # - self: Class namespace
+    # - limit: Maximum number of posts, or -1 for all of them (Int)
+    # Return: Post records, with "key", "rss", and "atom" fields that are None
+    # if the post's fragments were never cached (List)
+    def feed(self, limit):
+        return self.__rows("SELECT posts.*, fragments.key, fragments.rss, fragments.atom FROM posts LEFT JOIN fragments USING (content) ORDER BY pubtime DESC, content DESC LIMIT ?", (limit,))
+
+    # Method: save_fragments
+    # Purpose: Cache a post's rendered feed fragments.
+    # Parameters:
+    # - self: Class namespace
+    # - content: Content file name (String)
+    # - key: Digest of everything the fragments were rendered from (String)
+    # - rss: RSS item (String)
+    # - atom: Atom entry (String)
+    # Return: none
+    def save_fragments(self, content, key, rss, atom):
+        self.__db.execute("INSERT OR REPLACE INTO fragments VALUES (?, ?, ?, ?)", (content, key, rss, atom))
+
+    # Method: years
+    # Purpose: Count posts by year.
+    # Parameters:
+    # - self: Class namespace
+    # Return: [year, count] pairs, newest first (List)
+    def years(self):
+        return [list(x) for x in self.__db.execute("SELECT year, COUNT(*) FROM posts GROUP BY year ORDER BY year DESC")]
+
+    # Method: months
+    # Purpose: Count a year's posts by month.
+    # Parameters:
+    # - self: Class namespace
+    # - year: Year, like "2020" (String)
+    # Return: [month, count] pairs, newest first (List)
+    def months(self, year):
+        return [list(x) for x in self.__db.execute("SELECT month, COUNT(*) FROM posts WHERE year = ? GROUP BY month ORDER BY month DESC", (year,))]
+
+    # Method: month
+    # Purpose: List the posts published in a month, newest first.
+    # Parameters:
+    # - self: Class namespace
+    # - year: Year, like "2020" (String)
+    # - month: Month, like "02" (String)
+    # Return: Post records (List)
+    def month(self, year, month):
+        return self.__rows("SELECT * FROM posts WHERE year = ? AND month = ? ORDER BY pubtime DESC, content DESC", (year, month))
+
+    # Method: category_files
+    # Purpose: List the category pages with posts in them.
+    # Parameters:
+    # - self: Class namespace
+    # Return: Category page file names, like "tech.html" (List)
+    def category_files(self):
+        return [x[0] for x in self.__db.execute("SELECT DISTINCT category_file FROM posts ORDER BY category_file")]
+
+    # Method: category
+    # Purpose: List the posts in a category, newest first.
+    # Parameters:
+    # - self: Class namespace
+    # - category_file: Category page file name, like "tech.html" (String)
+    # Return: Post records (List)
+    def category(self, category_file):
+        return self.__rows("SELECT * FROM posts WHERE category_file = ? ORDER BY pubtime DESC, content DESC", (category_file,))
+
+    # Method: count
+    # Purpose: Count the posts in the catalog.
+    # Parameters:
+    # - self: Class namespace
+    # Return: Number of posts (Int)
+    def count(self):
+        return self.__db.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+    # Method: counts
+    # Purpose: Count the posts in each category.
+    # Parameters:
+    # - self: Class namespace
+    # Return: Category page file names mapped to numbers of posts (Dict)
+    def counts(self):
+        return dict(list(x) for x in self.__db.execute("SELECT category_file, COUNT(*) FROM posts GROUP BY category_file"))
+
+    # Method: rank
+    # Purpose: Find a post's position among every post, or among the posts in
+    # its category, counting from the oldest.
+    # Parameters:
+    # - self: Class namespace
+    # - content: Content file name (String)
+    # - category_file: Category page file name, to count only its posts, or
+    #   None to count every post (String)
+    # Return: Number of older posts (Int), or None if the post isn't in the
+    # catalog
+    def rank(self, content, category_file=None):
+        row = self.__db.execute("SELECT pubtime FROM posts WHERE content = ?", (content,)).fetchone()
+        if (row is None):
+            return None
+        if (category_file is None):
+            return self.__db.execute("SELECT COUNT(*) FROM posts WHERE pubtime < ? OR (pubtime = ? AND content < ?)", (row[0], row[0], content)).fetchone()[0]
+        return self.__db.execute("SELECT COUNT(*) FROM posts WHERE category_file = ? AND (pubtime < ? OR (pubtime = ? AND content < ?))", (category_file, row[0], row[0], content)).fetchone()[0]
+
+    # Method: oldest
+    # Purpose: List a range of posts, oldest first, to split a listing into
+    # pages that stay put as new posts come in.
+    # Parameters:
+    # - self: Class namespace
+    # - limit: Maximum number of posts (Int)
+    # - offset: Number of older posts to skip (Int)
+    # - category_file: Category page file name, to list only its posts, or
+    #   None to list every post (String)
+    # Return: Post records (List)
+    def oldest(self, limit, offset=0, category_file=None):
+        if (category_file is None):
+            return self.__rows("SELECT * FROM posts ORDER BY pubtime ASC, content ASC LIMIT ? OFFSET ?", (limit, offset))
+        return self.__rows("SELECT * FROM posts WHERE category_file = ? ORDER BY pubtime ASC, content ASC LIMIT ? OFFSET ?", (category_file, limit, offset))
+
+    # Method: close
+    # Purpose: Close the database connection.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    def close(self):
+        self.__db.close()
+
+# Method: CategoryFile
+# Purpose: Transform a category name into its page's file name.
+# Parameters:
+# - category: Category name, from a post's header (String)
+# Return: Category page file name, like "life-notes.html" (String)
+def CategoryFile(category):
+    return category.lower().replace(" ", "-")+".html"
@@ -0,0 +1,187 @@
+# Purpose: Run the tasks in each stage of a build serially, on a pool of
+# threads, or on a pool of processes, behind one interface. Unless told
+# otherwise, pick the cheapest backend for a stage from the kind of work it
+# does and how many tasks it has.
+
+# Import methods. multiprocessing is imported when a pool starts, so builds
+# that run serially don't load it.
+try:
+    from sys import _is_gil_enabled # Free-threaded builds
+except ImportError:
+    _is_gil_enabled = lambda: True
+
+# Constants
+## KINDS: Backend names (List)
+## STAGES: Build stages mapped to the kind of work they do: "cpu" for
+## rendering Markdown, "io" for writing pages from the catalog and gzipping
+## assets, which zlib does outside the GIL (Dictionary)
+## SERIAL_LIMIT: Kinds of work mapped to the number of tasks below which a
+## stage runs serially, since starting a pool would cost more (Dictionary)
+## CHUNK_SIZE: Maximum number of tasks sent to a worker at once (Int)
+## FREE_THREADED: Whether threads run Python code in parallel (Boolean)
+KINDS = ["serial", "thread", "process"]
+STAGES = {"posts":"cpu", "years":"io", "archives":"io", "categories":"io", "pages":"io", "assets":"io"}
+SERIAL_LIMIT = {"cpu":32, "io":4}
+CHUNK_SIZE = 16
+FREE_THREADED = not _is_gil_enabled()
+
+# Method: Call
+# Purpose: Run a task packed for a pool.
+# Parameters:
+# - task: Function, followed by its arguments (List)
+# Return: Function's return value (Any)
+def Call(task):
+    return task[0](*task[1:])
+
+# Method: ParseKinds
+# Purpose: Parse a backend choice from the command line: one backend for
+# every stage, like "thread", or a backend per stage, like
+# "posts=process,years=serial". "auto" leaves the choice to Executor.
+# Parameters:
+# - spec: Backend choice (String)
+# Return: Stage names mapped to backend names (Dict)
+def ParseKinds(spec):
+    kinds = {}
+    for each in spec.split(","):
+        stage, kind = each.split("=", 1) if "=" in each else [None, each]
+        if (kind != "auto" and kind not in KINDS):
+            raise ValueError(f"Unknown backend: {kind}")
+        if (stage is not None and stage not in STAGES):
+            raise ValueError(f"Unknown stage: {stage}")
+        for each in ([stage] if stage is not None else STAGES):
+            if (kind == "auto"): kinds.pop(each, None)
+            else: kinds[each] = kind
+    return kinds
+
+class SerialPool:
+    # Method: __init__
+    # Purpose: Set up the calling thread as the only worker.
+    # Parameters:
+    # - self: Class namespace
+    # - initializer: Function to set up a worker (Function)
+    # - initargs: Arguments to initializer (Tuple)
+    # Return: none
+    def __init__(self, initializer=None, initargs=()):
+        if (initializer is not None):
+            initializer(*initargs)
+
+    # Method: imap_unordered
+    # Purpose: Run each task as its result is requested, like Pool's method
+    # of the same name.
+    # Parameters:
+    # - self: Class namespace
+    # - fn: Function to run (Function)
+    # - tasks: Arguments to fn, one per task (List)
+    # - chunksize: Ignored (Int)
+    # Return: Results (Iterator)
+    def imap_unordered(self, fn, tasks, chunksize=1):
+        return map(fn, tasks)
+
+    # Method: close
+    # Purpose: Match Pool's interface. Nothing to clean up.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    def close(self):
+        pass
+
+    # Method: join
+    # Purpose: Match Pool's interface. Nothing to wait for.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    def join(self):
+        pass
+
+class Executor:
+    # Method: __init__
+    # Purpose: Describe the backends. Each is started the first time a stage
+    # uses it, and reused by later stages.
+    # Parameters:
+    # - self: Class namespace
+    # - workers: Number of threads or processes in a pool (Int)
+    # - initializer: Function to set up each worker, in each backend (Function)
+    # - initargs: Arguments to initializer (Tuple)
+    # - kinds: Stage names mapped to the backend to use for them. Stages left
+    #   out are chosen automatically. (Dict)
+    # Return: none
+    def __init__(self, workers, initializer=None, initargs=(), kinds={}):
+        self.__workers = workers
+        self.__initializer = initializer
+        self.__initargs = initargs
+        self.__kinds = kinds
+        self.__pools = {}
+        self.__used = {}
+
+    # Method: __pool
+    # Purpose: Start a backend, if it is not already running.
+    # Parameters:
+    # - self: Class namespace
+    # - __kind: Backend name (String)
+    # Return: Pool (Pool, ThreadPool, or SerialPool)
+    def __pool(self, __kind):
+        if (__kind not in self.__pools):
+            if (__kind == "process"):
+                from multiprocessing import Pool # Process backend
+                self.__pools[__kind] = Pool(self.__workers, self.__initializer, self.__initargs)
+            elif (__kind == "thread"):
+                from multiprocessing.pool import ThreadPool # Thread backend
+                self.__pools[__kind] = ThreadPool(self.__workers, self.__initializer, self.__initargs)
+            else:
+                self.__pools[__kind] = SerialPool(self.__initializer, self.__initargs)
+        return self.__pools[__kind]
+
+    # Method: choose
+    # Purpose: Pick the backend for a stage. A handful of tasks, or a single
+    # worker, runs serially. Rendering runs on processes, or on threads if
+    # this Python runs them in parallel. Writing pages runs on threads, which
+    # spend most of their time in system calls and SQLite, outside the GIL.
+    # Parameters:
+    # - self: Class namespace
+    # - stage: Stage name, from STAGES (String)
+    # - size: Number of tasks in the stage (Int)
+    # Return: Backend name (String)
+    def choose(self, stage, size):
+        if (stage in self.__kinds):
+            return self.__kinds[stage]
+        if (self.__workers == 1 or size < SERIAL_LIMIT[STAGES[stage]]):
+            return "serial"
+        if (STAGES[stage] == "cpu" and not FREE_THREADED):
+            return "process"
+        return "thread"
+
+    # Method: run
+    # Purpose: Run a stage's tasks, sending them to workers in chunks small
+    # enough that every worker gets several.
+    # Parameters:
+    # - self: Class namespace
+    # - stage: Stage name, from STAGES (String)
+    # - fn: Function to run (Function)
+    # - tasks: Arguments to fn, one list per task (List)
+    # Return: Results, in the order tasks finish (Iterator)
+    def run(self, stage, fn, tasks):
+        kind = self.choose(stage, len(tasks))
+        self.__used[stage] = kind
+        if (len(tasks) == 0):
+            return iter([])
+        chunksize = max(1, min(CHUNK_SIZE, len(tasks)//(self.__workers*4)))
+        return self.__pool(kind).imap_unordered(Call, [[fn]+list(x) for x in tasks], chunksize)
+
+    # Method: used
+    # Purpose: Report the backend each stage ran on.
+    # Parameters:
+    # - self: Class namespace
+    # Return: Stage names mapped to backend names (Dict)
+    def used(self):
+        return dict(self.__used)
+
+    # Method: close
+    # Purpose: Stop every backend, after its tasks finish.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    def close(self):
+        for pool in self.__pools.values():
+            pool.close()
+            pool.join()
+        self.__pools = {}
@@ -0,0 +1,149 @@
+# Purpose: Write the RSS and Atom feeds with a streaming XML writer. Each
+# post's <item> and <entry> are rendered once and cached in the catalog, so
+# a new post only renders its own fragments at the head of each feed, and
+# the rest are copied straight from the cache.
+
+# Import methods
+from xml.sax.saxutils import XMLGenerator # Feed output
+from io import StringIO # Fragment output
+from hashlib import sha1 # Fragment keys
+from time import strptime, strftime, gmtime, mktime # Publication dates
+from Output import WriteIfChanged # Output files
+
+# Constants
+## FEED_ITEMS: Default number of posts in the feeds (Int)
+## FIELDS: Post record fields the fragments are made from (List)
+FEED_ITEMS = 25
+FIELDS = ["title", "link", "excerpt", "datetime", "output"]
+
+# Method: Element
+# Purpose: Write an element holding only text, on its own indented line.
+# Parameters:
+# - gen: Output (XMLGenerator)
+# - depth: Indentation, in levels of four spaces (Int)
+# - name: Tag name (String)
+# - text: Contents, escaped as they are written (String)
+# - attrs: Attributes (Dictionary)
+# Return: none
+def Element(gen, depth, name, text, attrs={}):
+    gen.ignorableWhitespace("\n"+" "*4*depth)
+    gen.startElement(name, attrs)
+    gen.characters(text)
+    gen.endElement(name)
+
+# Method: Key
+# Purpose: Identify the fragments a post's record renders to.
+# Parameters:
+# - record: Post record (Dict)
+# - baseurl: Site's base URL, with a trailing slash (String)
+# Return: Hex digest (String)
+def Key(record, baseurl):
+    return sha1("\0".join([baseurl]+[record[x] for x in FIELDS]).encode("utf-8", "surrogateescape")).hexdigest()
+
+# Method: Fragments
+# Purpose: Render a post's RSS <item> and Atom <entry>.
+# Parameters:
+# - record: Post record (Dict)
+# - baseurl: Site's base URL, with a trailing slash (String)
+# Return: [RSS item, Atom entry] (List)
+def Fragments(record, baseurl):
+    published = gmtime(mktime(strptime(record["datetime"], '%Y-%m-%d %H:%M:%S-0400')))
+    link = record["link"] if record["link"][0] != "/" else baseurl+record["link"][1:]
+    permalink = f"{baseurl}blog/{record['output']}"
+    if ("<html>" in record["excerpt"]):
+        description = "<p>This post must be viewed online.</p>"
+    else:
+        description = "\n".join(record["excerpt"].split("\n")[5:-2]).replace('href="/', 'href="'+baseurl).replace("src='/", "src='"+baseurl)+f"\n<p><a href=\"{permalink}\">Permalink.</a></p>"
+
+    rss = StringIO()
+    gen = XMLGenerator(rss, "utf-8", short_empty_elements=True)
+    gen.ignorableWhitespace("\n"+" "*4)
+    gen.startElement("item", {})
+    Element(gen, 2, "title", record["title"])
+    Element(gen, 2, "link", link)
+    Element(gen, 2, "guid", link, {"isPermaLink":"true"})
+    Element(gen, 2, "pubDate", strftime('%a, %d %b %Y %H:%M:%S GMT', published))
+    Element(gen, 2, "description", description)
+    gen.ignorableWhitespace("\n"+" "*4)
+    gen.endElement("item")
+
+    atom = StringIO()
+    gen = XMLGenerator(atom, "utf-8", short_empty_elements=True)
+    gen.ignorableWhitespace("\n"+" "*4)
+    gen.startElement("entry", {})
+    Element(gen, 2, "title", record["title"])
+    Element(gen, 2, "link", "", {"rel":"alternate", "href":link})
+    Element(gen, 2, "id", permalink)
+    Element(gen, 2, "updated", strftime('%Y-%m-%dT%H:%M:%SZ', published))
+    Element(gen, 2, "content", description, {"type":"html"})
+    gen.ignorableWhitespace("\n"+" "*4)
+    gen.endElement("entry")
+    return [rss.getvalue(), atom.getvalue()]
+
+# Method: WriteFeeds
+# Purpose: Write the RSS and Atom feeds side by side, one post at a time,
+# rendering and caching the fragments of posts that changed since they were
+# last rendered. Save each feed only if it changed.
+# Parameters:
+# - catalog: Post catalog (Catalog)
+# - config: Site configuration (Dictionary)
+# - limit: Number of posts in the feeds, or -1 for all of them (Int)
+# - built: Build time, in seconds since the epoch (Float)
+# - rss_path: Path to the RSS feed (String)
+# - atom_path: Path to the Atom feed (String)
+# Return: none
+def WriteFeeds(catalog, config, limit, built, rss_path="./html/rss.xml", atom_path="./html/atom.xml"):
+    baseurl = config["meta_baseurl"]
+    rss_fd = StringIO()
+    atom_fd = StringIO()
+    rss = XMLGenerator(rss_fd, "utf-8", short_empty_elements=True)
+    rss.startDocument()
+    rss.startElement("rss", {"version":"2.0", "xmlns:atom":"http://www.w3.org/2005/Atom"})
+    rss.ignorableWhitespace("\n")
+    rss.startElement("channel", {})
+    Element(rss, 1, "title", config["byline"])
+    Element(rss, 1, "link", baseurl)
+    Element(rss, 1, "description", f"RSS feed for {config['byline']}'s website, found at {baseurl}")
+    Element(rss, 1, "language", "en-us")
+    Element(rss, 1, "copyright", f"Copyright 2012-{strftime('%Y', gmtime(built))}, {config['byline']}. All rights reserved.")
+    Element(rss, 1, "atom:link", "", {"href":baseurl+"rss.xml", "rel":"self", "type":"application/rss+xml"})
+    Element(rss, 1, "lastBuildDate", strftime('%a, %d %b %Y %H:%M:%S GMT', gmtime(built)))
+    Element(rss, 1, "ttl", "5")
+    Element(rss, 1, "generator", "First Crack")
+
+    atom = XMLGenerator(atom_fd, "utf-8", short_empty_elements=True)
+    atom.startDocument()
+    atom.startElement("feed", {"xmlns":"http://www.w3.org/2005/Atom"})
+    Element(atom, 1, "title", config["byline"])
+    Element(atom, 1, "link", "", {"href":baseurl})
+    Element(atom, 1, "link", "", {"href":baseurl+"atom.xml", "rel":"self", "type":"application/atom+xml"})
+    Element(atom, 1, "id", baseurl)
+    Element(atom, 1, "updated", strftime('%Y-%m-%dT%H:%M:%SZ', gmtime(built)))
+    atom.ignorableWhitespace("\n"+" "*4)
+    atom.startElement("author", {})
+    Element(atom, 2, "name", config["byline"])
+    atom.ignorableWhitespace("\n"+" "*4)
+    atom.endElement("author")
+    Element(atom, 1, "generator", "First Crack")
+
+    # Copy each post's fragments into the feeds as they are, since they
+    # are already escaped.
+    for record in catalog.feed(limit):
+        key = Key(record, baseurl)
+        if (record["key"] != key):
+            record["rss"], record["atom"] = Fragments(record, baseurl)
+            catalog.save_fragments(record["content"], key, record["rss"], record["atom"])
+        rss.ignorableWhitespace(record["rss"])
+        atom.ignorableWhitespace(record["atom"])
+
+    rss.ignorableWhitespace("\n")
+    rss.endElement("channel")
+    rss.ignorableWhitespace("\n")
+    rss.endElement("rss")
+    rss.endDocument()
+    atom.ignorableWhitespace("\n")
+    atom.endElement("feed")
+    atom.endDocument()
+    WriteIfChanged(rss_path, rss_fd.getvalue())
+    WriteIfChanged(atom_path, atom_fd.getvalue())
+    catalog.commit()
@@ -0,0 +1,79 @@
+# Purpose: Tell whether anything a build reads changed since the last one,
+# from directory listings and stat data alone, so a build with nothing to do
+# can stop before loading the parser, the build state, or any workers. Keep
+# this module's imports light; it runs before everything else.
+
+# Import methods
+from os import scandir, stat, replace, makedirs # File operations
+from os.path import isdir, dirname # File operations
+from Assets import Fingerprinted, MANIFEST as ASSET_MANIFEST # Fingerprinted assets
+
+# Constants
+## MANIFEST_FILE: Default location of the manifest (String)
+MANIFEST_FILE = "./.cache/manifest"
+
+# Method: Walk
+# Purpose: List the size and mtime of every file in a directory and its
+# subdirectories, like html/assets/images, skipping the files a build writes
+# there.
+# Parameters:
+# - path: Directory (String)
+# Return: One line per file (List)
+def Walk(path):
+    lines = []
+    with scandir(path) as entries:
+        for entry in entries:
+            if (entry.is_dir()):
+                lines += Walk(entry.path)
+                continue
+            if (entry.name.endswith(".gz") or entry.name == ASSET_MANIFEST or Fingerprinted(entry.name)): continue # Outputs
+            info = entry.stat()
+            lines.append(f"{entry.path}\t{info.st_size}\t{info.st_mtime_ns}")
+    return lines
+
+# Method: Snapshot
+# Purpose: List the size and mtime of a set of files, and of every file in a
+# set of directories and their subdirectories.
+# Parameters:
+# - paths: Files and directories the build reads (List)
+# Return: One line per file (String)
+def Snapshot(paths):
+    lines = []
+    for path in paths:
+        try:
+            if (isdir(path)):
+                lines += Walk(path)
+            else:
+                info = stat(path)
+                lines.append(f"{path}\t{info.st_size}\t{info.st_mtime_ns}")
+        except OSError:
+            lines.append(f"{path}\t-")
+    return "\n".join(lines)
+
+# Method: Unchanged
+# Purpose: Compare a snapshot to the one saved after the last build.
+# Parameters:
+# - snapshot: Result of Snapshot (String)
+# - path: Path to the manifest (String)
+# Return: True (Nothing changed), False (Something changed, or no manifest)
+def Unchanged(snapshot, path=MANIFEST_FILE):
+    try:
+        with open(path, "r", encoding="utf-8", errors="surrogateescape") as fd:
+            return (fd.read() == snapshot)
+    except OSError:
+        return False
+
+# Method: SaveManifest
+# Purpose: Save a snapshot taken before a build, once the build succeeds, by
+# writing a temporary file and renaming it over the old one. A file changed
+# during the build no longer matches it, so the next build picks it up.
+# Parameters:
+# - snapshot: Result of Snapshot (String)
+# - path: Path to the manifest (String)
+# Return: none
+def SaveManifest(snapshot, path=MANIFEST_FILE):
+    if (dirname(path) != ""):
+        makedirs(dirname(path), exist_ok=True)
+    with open(path+".tmp", "w", encoding="utf-8", errors="surrogateescape") as fd:
+        fd.write(snapshot)
+    replace(path+".tmp", path)
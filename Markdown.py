@@ -1,8 +1,31 @@
 #!/usr/local/bin/python3
 
 # Import methods
-from re import findall, sub # for links and ampersands
-from os.path import isfile
+from re import compile, sub # for inline tags, links, and ampersands
+from os import stat # for series index files
+from stat import S_ISREG # for series index files
+from itertools import cycle # for paired tags
+from operator import add # for paired tags
+
+# Constants
+## TRIGGERS: Characters that start any inline Markdown (Pattern)
+## APOSTROPHE, SINGLE_QUOTES, DOUBLE_QUOTES: Quotation marks (Pattern)
+## LINK: Links, with title and URL groups (Pattern)
+## FOOTNOTE: Footnote references, with mark group (Pattern)
+## PAIRS: Each pattern above mapped to one that finds overlapping matches (Dictionary)
+## CHUNK_SIZE: Characters of HTML render() collects before yielding them (Int)
+## BLOCKS: Blocks render() looks up in the render cache at once (Int)
+## SERIES: Series index file paths mapped to [mtime, size, list of links] (Dictionary)
+TRIGGERS = compile("[-*`'\"\\[]")
+APOSTROPHE = compile("(\\w)'(\\w)")
+SINGLE_QUOTES = compile("'([^']+)'")
+DOUBLE_QUOTES = compile('"([^"]+)"')
+LINK = compile("\\[([^\\]]+)\\]\\(([^\\)]*)\\)")
+FOOTNOTE = compile("\\[\\^([0-9]+)\\]")
+PAIRS = {x:compile("(?=("+x.pattern+"))") for x in [APOSTROPHE, SINGLE_QUOTES, DOUBLE_QUOTES, LINK]}
+CHUNK_SIZE = 65536
+BLOCKS = 256
+SERIES = {}
 
 class Markdown:
     # Method: __init__
@@ -20,6 +43,75 @@ class Markdown:
         self.__close_out = [] # List of block-level elements that still need closed out.
         self.__pre = False # Yes/no, is the parser in a <pre> tag?
         self.__html = False # Yes/no, is this an HTML file?
+        self.__includes = [] # Series index files referenced by this document.
+
+    # Method: __toggle
+    # Purpose: Replace a paired marker with alternating opening and closing
+    # tags, in one split over the line. An unpaired last marker still opens.
+    # Parameters:
+    # - self: Class namespace
+    # - __line: Input line to process, mangled (String)
+    # - __marker: Marker, like ** (String)
+    # - __tags: Opening and closing tag (List)
+    # Return:
+    # - Line with markers replaced. (String)
+    def __toggle(self, __line, __marker, __tags):
+        parts = __line.split(__marker)
+        return parts[0]+"".join(map(add, cycle(__tags), parts[1:]))
+
+    # Method: __pairs
+    # Purpose: Replace every match of a pattern, with the same result as
+    # replacing each match's text throughout the line, one match at a time.
+    # That costs a pass over the line per match, so take one pass instead
+    # when it gives the same result: when every occurrence of a match's text
+    # is itself a match, and the line does not already hold text that the
+    # replacements add, which could form new matches.
+    # Parameters:
+    # - self: Class namespace
+    # - __pattern: Compiled pattern, a key of PAIRS (re.Pattern)
+    # - __line: Input line to process, mangled (String)
+    # - __render: Function from a match to its replacement (Function)
+    # - __added: Text every replacement adds (Tuple)
+    # Return:
+    # - Line with matches replaced. (String)
+    def __pairs(self, __pattern, __line, __render, __added):
+        # Each pattern matches exactly one text at a position, so scanning for
+        # overlapping matches finds every occurrence of every match's text.
+        # The ones that do not overlap an earlier match are the matches.
+        matches = set()
+        skipped = []
+        end = 0
+        for each in PAIRS[__pattern].finditer(__line):
+            start, stop = each.span(1)
+            if (start < end):
+                skipped.append(each.group(1))
+            else:
+                matches.add(each.group(1))
+                end = stop
+        if (len(matches) == 0):
+            return __line
+        if (not any(each in matches for each in skipped) and not any(each in __line for each in __added)):
+            return __pattern.sub(__render, __line)
+        for each in __pattern.finditer(__line):
+            __line = __line.replace(each.group(0), __render(each))
+        return __line
+
+    # Method: __link
+    # Purpose: Render a Markdown link as an anchor tag. Links without a URL,
+    # or to a .txt file, point to another post.
+    # Parameters:
+    # - self: Class namespace
+    # - __match: Match of LINK (re.Match)
+    # Return:
+    # - Anchor tag. (String)
+    def __link(self, __match):
+        title = __match.group(1)
+        url = __match.group(2)
+        if (len(url) == 0):
+            url = title.replace("<em>", "").replace("</em>", "")+".txt"
+        if (url[-4:] == ".txt"):
+            url = self.__base_url+"blog/"+url.lower().replace("&#8217;", "").replace(" ", "-").replace(".txt", ".html")
+        return "<a href=\""+url+"\">"+title+"</a>"
 
     # Method: __parseInlineMD
     # Purpose: Turn all inline Markdown tags into HTML.
@@ -40,186 +132,261 @@ class Markdown:
         if (len(__line) == 0):
             return ""
 
-        # Parse  emdashes
-        __line = __line.replace("--", "&#160;&#8212;&#160;")
-
-        ## Prase **, or <strong>, tags first, to keep them from being
-        ## interpreted as <em> tags...
-        while ("**" in __line):
-            __line = __line.replace("**", "<strong>", 1).replace("**", "</strong>", 1)
+        # Most lines hold no inline Markdown at all.
+        if (TRIGGERS.search(__line) is None):
+            return __line
 
-        # Performance test to this point
+        # Parse emdashes.
+        if ("-" in __line):
+            __line = __line.replace("--", "&#160;&#8212;&#160;")
 
-        ## ... then parse the remaining <em> tags. Make sure there is an even
-        # number of * to parse as <em> ... </em>.
-        if (__line.count("*") != 1):
-            while ("*" in __line):
-                __line = __line.replace("*", "<em>", 1).replace("*", "</em>", 1)
+        if ("*" in __line):
+            ## Parse **, or <strong>, tags first, to keep them from being
+            ## interpreted as <em> tags...
+            if ("**" in __line):
+                __line = self.__toggle(__line, "**", ["<strong>", "</strong>"])
+            ## ... then parse the remaining <em> tags. Make sure there is an even
+            # number of * to parse as <em> ... </em>.
+            if (__line.count("*") != 1):
+                __line = self.__toggle(__line, "*", ["<em>", "</em>"])
 
         ## Parse inline code with <code> ... </code> tags.
-        while ("`" in __line):
-            __line = __line.replace("`", "<code>", 1).replace("`", "</code>", 1)
-
-        ## Parse aposrophes.
-        for each in findall("\w'\w", __line):
-            __line = __line.replace(each, each.replace("'", "&#8217;"))
-
-        ## Parse single quotatin marks.
-        for each in findall("\'[^\']+\'", __line):
-            __line = __line.replace(each, each.replace("'", "&#8216;", 1).replace("'", "&#8217;", 1))
-
+        if ("`" in __line):
+            __line = self.__toggle(__line, "`", ["<code>", "</code>"])
+
+        # Without a pair of single quotes, every ' becomes an apostrophe.
+        if ("'" in __line and SINGLE_QUOTES.search(__line) is not None):
+            ## Parse aposrophes.
+            __line = self.__pairs(APOSTROPHE, __line, lambda x: x.group(1)+"&#8217;"+x.group(2), ())
+            ## Parse single quotatin marks.
+            __line = self.__pairs(SINGLE_QUOTES, __line, lambda x: "&#8216;"+x.group(1)+"&#8217;", ("&#8216;",))
         ## Catch apostrophes without the trailing conjugation
         __line = __line.replace("'", "&#8217;")
 
         ## Parse double quotation marks.
-        for each in findall("\"[^\"]+\"", __line):
-            __line = __line.replace(each, each.replace('"', "&#8220;", 1).replace('"', "&#8221;", 1))
-        if (__line[0] == '"'):
-            __line = __line.replace('"', "&#8220;", 1)
-        if (__line[-1] == '"'):
-            __line = __line[0:-1]+"&#8221;"
-
-        ## Parse links.
-        for each in findall("\[([^\]]+)\]\(([^\)]*)\)", __line):
-            title = each[0]
-            url = each[1]
-
-            if (len(url) == 0):
-                url = title.replace("<em>", "").replace("</em>", "")+".txt"
-            if (url[-4:] == ".txt"):
-                url = self.__base_url+"blog/"+url.lower().replace("&#8217;", "").replace(" ", "-").replace(".txt", ".html")
-
-            __line = __line.replace("["+each[0]+"]("+each[1]+")", "<a href=\""+url+"\">"+title+"</a>")
-
-        # Parse footnotes
-        for each in findall("(\[\^[0-9]+\])", __line):
-            mark = each[2:-1]
-            url = """<sup id="fnref"""+mark+""""><a href="#fn"""+mark+"""" rel="footnote">"""+mark+"""</a></sup>"""
-            __line = __line.replace(each, url)
+        if ('"' in __line):
+            __line = self.__pairs(DOUBLE_QUOTES, __line, lambda x: "&#8220;"+x.group(1)+"&#8221;", ("&#8220;",))
+            if (__line[0] == '"'):
+                __line = "&#8220;"+__line[1:]
+            if (__line[-1] == '"'):
+                __line = __line[0:-1]+"&#8221;"
+
+        if ("[" in __line):
+            ## Parse links.
+            __line = self.__pairs(LINK, __line, self.__link, ("<a href=", "\">", "</a>"))
+            # Parse footnotes
+            if ("[^" in __line):
+                __line = FOOTNOTE.sub("""<sup id="fnref\\1"><a href="#fn\\1" rel="footnote">\\1</a></sup>""", __line)
 
         return __line
 
-    # Method: __updateLineTracker
-    # Purpose: Keep track of raw lines.
+    # Method: __track
+    # Purpose: Shift a new line into the raw line, indent, and line type
+    # trackers. Each tracker holds the last three lines, oldest first, and is
+    # shifted in place.
     # Parameters:
     # - self: Class namespace
-    # - __line: Raw Markdown line, mangled.
+    # - __line: Raw Markdown line, mangled. (String)
+    # - __stripped: Line without leading spaces. (String)
     # Return: None.
-    def __updateLineTracker(self, __line):
-        self.__line_tracker.append(__line)
-        if (len(self.__line_tracker) > 3):
-            self.__line_tracker.pop(0)
-
-    # Method: __updateLineTypeTracker
-    # Purpose: Determine type of line, and whether it is part of a larger
-    # block-level element, and annotate that in the line type tracker.
-    # Parameters:
-    # - self: Class namespace
-    # - __line: Input line to process, mangled. (String)
-    # Return: None.
-    def __updateLineTypeTracker(self, __line):
-        # Parser tracks leading whitespace, so remove it.
-        __line = __line.lstrip(' ')
+    def __track(self, __line, __stripped):
+        lines = self.__line_tracker
+        lines[0] = lines[1]
+        lines[1] = lines[2]
+        lines[2] = __line
+
+        # Count leading spaces. Blank lines have no indent.
+        indents = self.__line_indent_tracker
+        indents[0] = indents[1]
+        indents[1] = indents[2]
+        if (len(__stripped) == 0 or __stripped.isspace()):
+            indents[2] = 0
+            kind = "blank"
+        else:
+            indents[2] = len(__line) - len(__stripped)
+            kind = None
 
-        if (__line == "<html>"):
-            if (self.__line_type_tracker[-2] == "" and self.__line_type_tracker[-3] == ""):
+        types = self.__line_type_tracker
+        if (__stripped == "<html>"):
+            if (types[1] == "" and types[0] == ""):
                 self.__html = True
-
-        if (len(__line.strip()) == 0): # Blank line.
-            self.__line_type_tracker.append("blank")
-        elif (__line == "{EOF}"): # End of file
-            self.__line_type_tracker.append("EOF")
-        elif (__line[0] == "<" and (__line[0:4] != "<pre" and __line[0:5] != "</pre")): # Raw HTML
-            self.__line_type_tracker.append("raw")
-        elif (__line[0] == "#"): # Header.
-            self.__line_type_tracker.append("header")
-        elif (__line[0:4] == "---" or __line[0:7] == "* * *"): # Horizontal rule.
-            self.__line_type_tracker.append("hr")
-        elif (__line[0:2] == "!["): # Image.
-            self.__line_type_tracker.append("img")
-        elif (__line[0] == "{" and self.__pre == False): # Post index, with remote content.
-            self.__line_type_tracker.append("idx")
-        # Unordered list, as evidenced by a line starting with *, +, or -
-        elif (__line[0] in ['*', '+', '-'] and __line[1] == ' '):
-            # If the line is indented from the previous one, start a new list
-            if (self.__line_indent_tracker[-1] > self.__line_indent_tracker[-2]):
-                self.__line_type_tracker.append("ul")
-            # If a line is un-indented from the previous one, close out a list.
-            elif (self.__line_indent_tracker[-1] < self.__line_indent_tracker[-2]):
-                self.__line_type_tracker.append("/ul")
-            # If the parser finds a list element preceeded by another list
-            # element or an opening list tag, treat this line as a list element
-            elif (self.__line_type_tracker[-1] == "ul" or self.__line_type_tracker[-1] == "li"):
-                self.__line_type_tracker.append("li")
-            # If the line is for an unordered list and there is still an active
-            # list, treat it as a list element.
-            elif (len(self.__close_out) != 0):
-                self.__line_type_tracker.append("li")
-            # Otherwise, treat the line as the first in a new list.
-            else:
-                self.__line_type_tracker.append("ul")
-        # Ordered list, as evidenced by [0-9]\. or [0-9]{2}\.
-        elif (__line[0].isdigit() and __line[1] == ".") or (__line[0:1].isdigit() and __line[2] == "."):
-            # If the line is indented from the previous one, start a new list
-            if (self.__line_indent_tracker[-1] > self.__line_indent_tracker[-2]):
-                self.__line_type_tracker.append("ol")
-            # If a line is un-indented from the previous one, close out a list.
-            elif (self.__line_indent_tracker[-1] < self.__line_indent_tracker[-2]):
-                self.__line_type_tracker.append("/ol")
-            # If the parser finds a list element preceeded by another list
-            # element or an opening list tag, treat this line as a list element
-            elif (self.__line_type_tracker[-1] == "ol" or self.__line_type_tracker[-1] == "li"):
-                self.__line_type_tracker.append("li")
-            # If the line is for an unordered list and there is still an active
-            # list, treat it as a list element.
-            elif (self.__line_type_tracker[-1] == "/ol" and len(self.__close_out) != 0):
-                self.__line_type_tracker.append("li")
-            # Otherwise, treat the line as the first in a new list.
-            else:
-                self.__line_type_tracker.append("ol")
-        elif (__line[0] == "+" and __line[1] == "-"): # Table
-            if (self.__line_type_tracker[-1] != "tr"):
-                self.__line_type_tracker.append("table")
-            else:
-                self.__line_type_tracker.append("tr")
-        elif  (__line[0] == "|"): # Table rows
-            self.__line_type_tracker.append("tr")
-        elif (__line[0] == ">"): # Blockquote
-            # If the line is preceeded by a blockquote tag or the parser
-            # is already in a blockquote, continue parsing the existing
-            # blockquote
-            if (self.__line_type_tracker[-1] == "blockquote" or self.__line_type_tracker[-1] == "bqt"):
-                self.__line_type_tracker.append("bqt")
-            # Otherwise, treat this line as the opening of a new blockquote
+        types[0] = types[1]
+        types[1] = types[2]
+        if (kind is None):
+            # Dispatch on the first significant character. Lines that start
+            # with anything else are paragraphs, or ordered list items.
+            block = self.__blocks.get(__stripped[0])
+            if (block is not None):
+                kind = block(self, __stripped)
+            elif (__stripped[0].isdigit()):
+                kind = self.__ol(__stripped)
             else:
-                self.__line_type_tracker.append("blockquote")
-        elif (__line[0:3] == "```" or __line[0:4] == "<pre" or __line[0:5] == "</pre"): # Preformatted code block
-            self.__line_type_tracker.append("pre")
+                kind = "p"
             # Toggle the boolean for tracking if the parser is in a code block
-            self.__pre = not self.__pre
-        elif (__line[0:2] == "[>"): # Footnote
-            self.__line_type_tracker.append("fn")
-        else: # Default to handling the line as a paragraph
-            self.__line_type_tracker.append("p")
-
-        # Trim the tracker to a max of 3 elements.
-        if (len(self.__line_type_tracker) > 3):
-            self.__line_type_tracker.pop(0)
-
-    # Method: __updateIndentTracker
-    # Purpose: Keep track of the indentation level.
+            if (kind == "pre"):
+                self.__pre = not self.__pre
+        types[2] = kind
+
+    # Method: __ul
+    # Purpose: Classify an unordered list item, as evidenced by a line starting
+    # with *, +, or -, as the start of a new list, the end of a nested list, or
+    # an item in the current list.
     # Parameters:
     # - self: Class namespace
-    # - __line: Input line to process, mangled. (String)
-    # Return: None
-    def __updateIndentTracker(self, __line):
-        if (__line.strip() == ""):
-            self.__line_indent_tracker.append(0)
-        # Count leading spaces, and append to the line tracker list
-        else:
-            self.__line_indent_tracker.append(len(__line) - len(__line.lstrip(' ')))
-        if (len(self.__line_indent_tracker) > 3):
-            self.__line_indent_tracker.pop(0)
+    # Return: Line type. (String)
+    def __ul(self):
+        # If the line is indented from the previous one, start a new list
+        if (self.__line_indent_tracker[2] > self.__line_indent_tracker[1]):
+            return "ul"
+        # If a line is un-indented from the previous one, close out a list.
+        elif (self.__line_indent_tracker[2] < self.__line_indent_tracker[1]):
+            return "/ul"
+        # If the parser finds a list element preceeded by another list
+        # element or an opening list tag, treat this line as a list element
+        elif (self.__line_type_tracker[1] == "ul" or self.__line_type_tracker[1] == "li"):
+            return "li"
+        # If the line is for an unordered list and there is still an active
+        # list, treat it as a list element.
+        elif (len(self.__close_out) != 0):
+            return "li"
+        # Otherwise, treat the line as the first in a new list.
+        return "ul"
+
+    # Method: __ol
+    # Purpose: Classify a line starting with a digit. Ordered lists are
+    # evidenced by [0-9]\. or [0-9].\.
+    # Parameters:
+    # - self: Class namespace
+    # - __line: Line without leading spaces, mangled. (String)
+    # Return: Line type. (String)
+    def __ol(self, __line):
+        if (__line[1] != "." and __line[2] != "."):
+            return "p"
+        # If the line is indented from the previous one, start a new list
+        if (self.__line_indent_tracker[2] > self.__line_indent_tracker[1]):
+            return "ol"
+        # If a line is un-indented from the previous one, close out a list.
+        elif (self.__line_indent_tracker[2] < self.__line_indent_tracker[1]):
+            return "/ol"
+        # If the parser finds a list element preceeded by another list
+        # element or an opening list tag, treat this line as a list element
+        elif (self.__line_type_tracker[1] == "ol" or self.__line_type_tracker[1] == "li"):
+            return "li"
+        # If the line is for an unordered list and there is still an active
+        # list, treat it as a list element.
+        elif (self.__line_type_tracker[1] == "/ol" and len(self.__close_out) != 0):
+            return "li"
+        # Otherwise, treat the line as the first in a new list.
+        return "ol"
+
+    # Methods: __angle, __dash, __star, __plus, __bang, __brace, __quote,
+    # __tick, __bracket
+    # Purpose: Classify a line by its first significant character: <, -, *, +,
+    # !, {, >, `, or [.
+    # Parameters:
+    # - self: Class namespace
+    # - __line: Line without leading spaces, mangled. (String)
+    # Return: Line type. (String)
+    def __angle(self, __line):
+        # Raw HTML, or a preformatted code block
+        if (__line[0:4] == "<pre" or __line[0:5] == "</pre"):
+            return "pre"
+        return "raw"
+
+    def __dash(self, __line):
+        # Horizontal rule.
+        if (__line == "---"):
+            return "hr"
+        if (__line[1] == " "):
+            return self.__ul()
+        return "p"
+
+    def __star(self, __line):
+        # Horizontal rule.
+        if (__line == "* * *"):
+            return "hr"
+        if (__line[1] == " "):
+            return self.__ul()
+        return "p"
+
+    def __plus(self, __line):
+        if (__line[1] == " "):
+            return self.__ul()
+        # Table
+        if (__line[1] == "-"):
+            if (self.__line_type_tracker[1] != "tr"):
+                return "table"
+            return "tr"
+        return "p"
+
+    def __bang(self, __line):
+        # Image.
+        if (__line[1:2] == "["):
+            return "img"
+        return "p"
+
+    def __brace(self, __line):
+        # End of file
+        if (__line == "{EOF}"):
+            return "EOF"
+        # Post index, with remote content.
+        if (self.__pre == False):
+            return "idx"
+        return "p"
+
+    def __quote(self, __line):
+        # If the line is preceeded by a blockquote tag or the parser is
+        # already in a blockquote, continue parsing the existing blockquote
+        if (self.__line_type_tracker[1] == "blockquote" or self.__line_type_tracker[1] == "bqt"):
+            return "bqt"
+        # Otherwise, treat this line as the opening of a new blockquote
+        return "blockquote"
+
+    def __tick(self, __line):
+        # Preformatted code block
+        if (__line[0:3] == "```"):
+            return "pre"
+        return "p"
+
+    def __bracket(self, __line):
+        # Footnote
+        if (__line[1:2] == ">"):
+            return "fn"
+        return "p"
+
+    # Block classifiers, by first significant character.
+    __blocks = {"<":__angle, "#":lambda self, line: "header", "-":__dash, "*":__star, "+":__plus, "!":__bang, "{":__brace, "|":lambda self, line: "tr", ">":__quote, "`":__tick, "[":__bracket}
+
+    # Method: __series
+    # Purpose: Build the list of links in a series index file. Every parser in
+    # a process shares the lists in SERIES, so a series with many parts is
+    # read once, not once per part. A list is built again when its file's
+    # mtime or size changes.
+    # Parameters:
+    # - self: Class namespace
+    # - __name: Name of a file in ./Content/System (String)
+    # Return:
+    # - List of links, or None if the file does not exist. (String)
+    def __series(self, __name):
+        path = "./Content/System/"+__name
+        try:
+            info = stat(path)
+        except OSError:
+            return None
+        if (not S_ISREG(info.st_mode)):
+            return None
+        cached = SERIES.get(path)
+        if (cached is None or cached[0] != info.st_mtime_ns or cached[1] != info.st_size):
+            # Open the target file, write the opening <ul> tag, and add each
+            # link in the file to the new index.
+            with open(path, "r") as fd:
+                html = "<ul style=\"border:1px dashed gray\" id=\"series_index\">\n"
+                for each in fd:
+                    html += "    <li>"+each.strip()+"</li>\n"
+                html += "</ul>"
+            cached = [info.st_mtime_ns, info.st_size, html]
+            SERIES[path] = cached
+        return cached[2]
 
     # Method: __closeOut
     # Purpose: Write closing HTML tags for any open block-level elements.
@@ -273,9 +440,9 @@ class Markdown:
         __line = __line.rstrip('\n')
 
         # Update trackers
-        self.__updateIndentTracker(__line)
-        self.__updateLineTracker(__line)
-        self.__updateLineTypeTracker(__line)
+        stripped = __line.lstrip(' ')
+        self.__track(__line, stripped)
+        kind = self.__line_type_tracker[2]
 
         # Print statements, for debugging.
         # print(self.__line_tracker)
@@ -285,7 +452,7 @@ class Markdown:
 
         # Handle preformatted code blocks. First write the opening <pre> tag,
         # then return the unprocessed line.
-        if (self.__line_type_tracker[-1] == "pre"):
+        if (kind == "pre"):
             if (self.__pre == True):
                 if ("shell" in __line):
                     # return "<pre class='shell'>"
@@ -304,18 +471,18 @@ class Markdown:
         if (self.__pre == True):
             return "<span class='pre_line_wrap'>"+__line.replace("<", "&lt;").replace(">", "&gt;").replace(" ", "&nbsp;")+"</span>"
 
-        if (self.__line_type_tracker[-1] == "raw"):
+        if (kind == "raw"):
             return __line
 
         # Parser tracks leading whitespace, so remove it.
-        __line = __line.lstrip(' ')
+        __line = stripped
 
         # Escape &, *, <, and > characters. Also escape inline code blocks.
         __line = self.__escapeCharacters(__line)
 
         # If the parser finds a blank line, close open block-level elements,
         # reset the block-level element tracker, and return the blank line.
-        if (len(__line) == 0 or self.__line_type_tracker[-1] == "EOF"):
+        if (len(__line) == 0 or kind == "EOF"):
             __line = self.__closeOut()
             self.__close_out = []
             return __line
@@ -323,49 +490,49 @@ class Markdown:
         # Handle unorered lists
         ## Write opening tag and append the closing tag to the block-level
         ## element tracker.
-        if (self.__line_type_tracker[-1] == "ul"):
+        if (kind == "ul"):
             __line = "<ul>"+'\n'+"    <li>"+__line[2:]+"</li>"
             self.__close_out.append("</ul>\n")
         ## Write closing tag and remove a closing tag from the block-level
         ## element tracker.
-        elif (self.__line_type_tracker[-1] == "/ul"):
+        elif (kind == "/ul"):
             __line = "</ul>\n<li>"+__line[2:]+"</li>"
             self.__close_out.remove("</ul>\n")
         # Handle ordered lists
         ## Write opening tag and append the closing tag to the block-level
         ## element tracker.
-        elif (self.__line_type_tracker[-1] == "ol"):
+        elif (kind == "ol"):
             __line = "<ol>"+'\n'+"    <li>"+". ".join(__line.split(". ")[1:])+"</li>"
             self.__close_out.append("</ol>\n")
         ## Write closing tag and remove a closing tag from the block-level
         ## element tracker.
-        elif (self.__line_type_tracker[-1] == "/ol"):
+        elif (kind == "/ol"):
             __line = "</ol>\n<li>"+__line[2:]+"</li>"
             self.__close_out.remove("</ol>\n")
         # Handle list elements for both unordered and ordered lists.
-        elif (self.__line_type_tracker[-1] == "li"):
+        elif (kind == "li"):
             __line = "    <li>"+__line.split(" ", 1)[1]+"</li>"
         # Handle tables
-        elif (self.__line_type_tracker[-1] == "table"):
+        elif (kind == "table"):
             __line = "<table>\n"
             self.__close_out.append("</table>\n")
         # Handle table rows
-        elif (self.__line_type_tracker[-1] == "tr"):
+        elif (kind == "tr"):
             if (__line[0] == "+"):
                 __line = ""
             else:
                 __line = "<tr>\n    <td>"+__line.lstrip("|").rstrip("|").replace("|", "</td><td>")+"</td>\n</tr>"
         # Handle blockquotes, new and a continuation of an existing one.
-        elif (self.__line_type_tracker[-1] == "blockquote"):
+        elif (kind == "blockquote"):
             __line = "<blockquote>\n    <p>"+self.__parseInlineMD(__line[5:])+"</p>"
             self.__close_out.append("</blockquote>\n")
-        elif (self.__line_type_tracker[-1] == "bqt"):
+        elif (kind == "bqt"):
             if (__line[5:] == ''):
                 __line = ''
             else:
                 __line = "    <p>"+self.__parseInlineMD(__line[5:])+"</p>"
         # Handle header elements
-        elif (self.__line_type_tracker[-1] == "header"):
+        elif (kind == "header"):
             # Count the number of # at the beginning of the line.
             l = len(__line) - len(__line.lstrip("#"))
             anchor = ''.join(ch for ch in __line.split(":")[0] if ch.isalnum())
@@ -373,10 +540,10 @@ class Markdown:
             __line = "<h"+str(l)+" class=\"headers\" id=\""+anchor+"\">"+__line.strip("#").strip()+"<span>&nbsp;<a href=\"#"+anchor+"\">#</a></span></h"+str(l)+">"
             return __line
         # Handle horizontal rules
-        elif (self.__line_type_tracker[-1] == "hr"):
+        elif (kind == "hr"):
             return "<hr style='margin:50px auto;width:50%;border:0;border-bottom:1px dashed #ccc;background:#999;' />"
         # Handle images
-        elif (self.__line_type_tracker[-1] == "img"):
+        elif (kind == "img"):
             # This feels a bit clunky, but seems like the best alternative to
             # regex capture groups, which seem unreliable.
             __line = __line.split("]")
@@ -394,19 +561,16 @@ class Markdown:
         # lets the writer reference an external file that contains a list of
         # links to other articles in a related series, and include them
         # automatically.
-        elif (self.__line_type_tracker[-1] == "idx"):
-            # Open the target file, write the opening <ul> tag, and add each
-            # link in the file to the new index.
-            if (not isfile("./Content/System/"+__line[1:-1])):
+        elif (kind == "idx"):
+            # Record the file name, even if it does not exist yet, since the
+            # document depends on it.
+            self.__includes.append(__line[1:-1])
+            __line = self.__series(__line[1:-1])
+            if (__line is None):
                 return "<blink>ERROR: Index file does not exist.</blink>"
-            with open("./Content/System/"+__line[1:-1], "r") as fd:
-                __line = "<ul style=\"border:1px dashed gray\" id=\"series_index\">\n"
-                for each in fd:
-                    __line += "    <li>"+each.strip()+"</li>\n"
-                __line += "</ul>"
             return __line
         # Handle footnotes
-        elif (self.__line_type_tracker[-1] == "fn"):
+        elif (kind == "fn"):
             # line = line.replace("div ", "div id=\"fn"+str(mark)+"\" ")+"""<a class="fn" title="return to article" href="#fnref"""+str(mark)+"""\">&#x21a9;</a>"""
             mark = __line.split("]", 1)[0][5:]
             __line = f"<p id='fn{mark}'><a class='fn' title='return to article' href='#fnref{mark}'>&#x21a9;</a>&nbsp;{self.__parseInlineMD(__line[8:])}</p>"
@@ -419,7 +583,7 @@ class Markdown:
 
         # Once all the block-level parsing is done, parse the inline Markdown
         # tags.
-        if (self.__line_type_tracker[-1] not in ["blockquote", "bqt", "fn"]):
+        if (kind not in ["blockquote", "bqt", "fn"]):
             __line = self.__parseInlineMD(__line)
 
         return __line
@@ -436,6 +600,141 @@ class Markdown:
         self.__line_indent_tracker = [0, 0, 0] # Indent level of last three lines.
         self.__close_out = [] # List of block-level elements that still need closed out.
         self.__pre = False # Yes/no, is the parser in a <pre> tag?
+        self.__html = False # Yes/no, is this an HTML file?
+        self.__includes = [] # Series index files referenced by this document.
+
+    # Method: render
+    # Purpose: Render a whole document, starting from a clear parser. Each
+    # line is rendered and followed by a newline, then the closing tags of
+    # any open block-level elements follow a blank line.
+    # Parameters:
+    # - self: Class namespace
+    # - lines: Markdown lines, like a file object (Iterable)
+    # - size: Characters of HTML to collect before yielding them (Int)
+    # - cache: Rendered blocks to reuse, or None (RenderCache)
+    # Return:
+    # - Generator of HTML chunks, each of about size characters (Generator)
+    def render(self, lines, size=CHUNK_SIZE, cache=None):
+        self.clear()
+        chunk = []
+        length = 0
+        for html in (self.__renderLines(lines) if cache is None else self.__renderBlocks(lines, cache)):
+            chunk.append(html)
+            length += len(html)
+            if (length >= size):
+                yield "".join(chunk)
+                chunk = []
+                length = 0
+        chunk.append("\n")
+        chunk.append(self.html("{EOF}"))
+        yield "".join(chunk)
+
+    # Method: __renderLines
+    # Purpose: Render each line, followed by a newline.
+    # Parameters:
+    # - self: Class namespace
+    # - __lines: Markdown lines, mangled (Iterable)
+    # Return:
+    # - Generator of rendered lines (Generator)
+    def __renderLines(self, __lines):
+        for line in __lines:
+            yield self.html(line)+"\n"
+
+    # Method: __renderBlocks
+    # Purpose: Render each line, followed by a newline, a block at a time.
+    # Blocks run through the next blank line. Reuse a block's HTML from the
+    # cache when it starts in the same parser state as it did before, then
+    # pick up in the state it ended in. Look blocks up BLOCKS at a time.
+    # Blocks that include a series index, which can change on its own, or
+    # that are in an HTML file, are always rendered.
+    # Parameters:
+    # - self: Class namespace
+    # - __lines: Markdown lines, mangled (Iterable)
+    # - __cache: Rendered blocks (RenderCache)
+    # Return:
+    # - Generator of rendered blocks (Generator)
+    def __renderBlocks(self, __lines, __cache):
+        blocks = []
+        block = []
+        for line in __lines:
+            block.append(line)
+            if (len(line.strip()) == 0):
+                blocks.append(block)
+                block = []
+                if (len(blocks) == BLOCKS):
+                    yield from self.__renderBatch(blocks, __cache)
+                    blocks = []
+        if (len(block) != 0):
+            blocks.append(block)
+        yield from self.__renderBatch(blocks, __cache)
+
+    # Method: __renderBatch
+    # Purpose: Render a batch of blocks for __renderBlocks.
+    # Parameters:
+    # - self: Class namespace
+    # - __blocks: Blocks of Markdown lines, mangled (List)
+    # - __cache: Rendered blocks (RenderCache)
+    # Return:
+    # - Generator of rendered blocks (Generator)
+    def __renderBatch(self, __blocks, __cache):
+        keys = [None if any(x.lstrip(' ')[0:1] == "{" for x in block) else __cache.key(block) for block in __blocks]
+        found = __cache.fetch([x for x in keys if x is not None])
+        hits = []
+        misses = []
+        for key,block in zip(keys, __blocks):
+            if (key is None or self.__html):
+                yield "".join(self.html(x)+"\n" for x in block)
+                continue
+            state = self.__state()
+            cached = found.get(key, {}).get(state)
+            if (cached is not None):
+                self.__restore(cached[1], block)
+                hits.append([key, state])
+                yield cached[0]
+                continue
+            html = "".join(self.html(x)+"\n" for x in block)
+            if (not self.__html):
+                misses.append([key, state, html, self.__state()])
+            yield html
+        if (len(hits) != 0):
+            __cache.touch(hits)
+        if (len(misses) != 0):
+            __cache.store(misses)
+        __cache.commit()
+
+    # Method: __state
+    # Purpose: Describe the parser state that the next line's HTML depends on.
+    # Parameters:
+    # - self: Class namespace
+    # Return:
+    # - Line type and indent trackers, whether the parser is in a <pre> tag,
+    #   and open block-level elements, separated by tabs (String)
+    def __state(self):
+        return "\t".join(self.__line_type_tracker+[str(x) for x in self.__line_indent_tracker]+["1" if self.__pre else "0"]+self.__close_out)
+
+    # Method: __restore
+    # Purpose: Put the parser in the state a cached block ended in.
+    # Parameters:
+    # - self: Class namespace
+    # - __state: Parser state, from __state() (String)
+    # - __block: Markdown lines in the block, mangled (List)
+    # Return: none
+    def __restore(self, __state, __block):
+        state = __state.split("\t")
+        self.__line_type_tracker = state[0:3]
+        self.__line_indent_tracker = [int(x) for x in state[3:6]]
+        self.__pre = (state[6] == "1")
+        self.__close_out = state[7:]
+        self.__line_tracker = (self.__line_tracker+[x.rstrip('\n') for x in __block[-3:]])[-3:]
+
+    # Method: includes
+    # Purpose: Return the series index files the current document referenced.
+    # Parameters:
+    # - self: Class namespace
+    # Return:
+    # - Names of files in ./Content/System (List)
+    def includes(self):
+        return self.__includes
 
     # Method: raw
     # Purpose: Return raw line at specified position.
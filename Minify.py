@@ -0,0 +1,316 @@
+# Purpose: Minify the pages and stylesheet a build writes. Pages lose their
+# comments and the indentation between block-level tags; preformatted text,
+# like code blocks' pre_line_wrap spans, is left alone. The stylesheet loses
+# its comments and formatting, and the rules the top of every page needs can
+# be inlined into the template head, so the page draws before the full
+# stylesheet arrives. A page's minified copy is only worked out when the page
+# itself changed: each output's digest is kept in an SQLite database, with
+# the stat data of the file written for it.
+
+# Import methods
+from re import compile, DOTALL, IGNORECASE # Markup and stylesheet syntax
+from sqlite3 import connect # Cache database
+from os import makedirs, getpid, stat # Cache directory, worker processes, output files
+from os.path import dirname, relpath # Cache directory, output files
+from threading import local # Worker threads
+from hashlib import sha1 # Page digests
+
+# Constants
+## MINIFY_FILE: Default location of the minify cache database (String)
+## VERSION: Schema version. Bump to clear the cache, as when the minifier
+## changes. (Int)
+## PRESERVE: Elements whose contents are kept as they are (Set)
+## PRE_LINE: Opening tag of a line of a code block, kept as it is (Pattern)
+## TAG: Tags and comments in markup, with each tag's element name (Pattern)
+## BLOCK: Block-level and metadata elements, between which whitespace is
+## never drawn (Set)
+## STRINGS: Strings and comments in a stylesheet (Pattern)
+## SIMPLE: Element names, IDs, and classes in a compound selector (Pattern)
+## ATTRIBUTE: id and class attributes in a tag (Pattern)
+## STYLESHEET: Stylesheet link in a template head (Pattern)
+## FOLD: Markup of the start of a page's article, below the template head
+## (String)
+MINIFY_FILE = "./.cache/minify.db"
+VERSION = 1
+PRESERVE = {"pre", "textarea", "script", "style"}
+PRE_LINE = compile("<span class=[\"']pre_line_wrap[\"']>", IGNORECASE)
+TAG = compile("<!--.*?-->|</?([A-Za-z][\\w-]*)[^>]*>|<[^>]*>", DOTALL)
+BLOCK = {"html", "head", "body", "meta", "title", "base", "style", "script", "noscript",
+         "nav", "main", "header", "footer", "article", "section", "aside", "div", "p",
+         "h1", "h2", "h3", "h4", "h5", "h6", "hr", "ul", "ol", "li", "dl", "dt", "dd",
+         "table", "thead", "tbody", "tfoot", "tr", "th", "td", "caption", "blockquote",
+         "figure", "figcaption", "form", "fieldset", "address", "details", "summary"}
+STRINGS = compile("(\"(?:[^\"\\\\]|\\\\.)*\"|'(?:[^'\\\\]|\\\\.)*'|/\\*.*?\\*/)", DOTALL)
+SIMPLE = compile("[#.]?[\\w-]+")
+ATTRIBUTE = compile("\\b(id|class)\\s*=\\s*[\"']([^\"']*)[\"']")
+STYLESHEET = compile("<link rel=\"stylesheet\" href=\"(/[^\"]+\\.css)\">")
+FOLD = "<article><h2 id='article_title'><a class='original'></a></h2><time id='article_time'><a></a></time><p><a></a></p></article>"
+
+# Method: MinifyHTML
+# Purpose: Minify a page. Drop comments, except conditional ones, drop
+# whitespace next to block-level tags, and collapse any other run of
+# whitespace to one space, which a browser draws the same way. Leave the
+# tags themselves, and everything inside preformatted elements and code
+# blocks' lines, as they are.
+# Parameters:
+# - html: Page (String)
+# Return: Minified page (String)
+def MinifyHTML(html):
+    # Split the page into text and tags: out alternates text and tags, names
+    # holds each tag's element name, and raw marks the text inside preserved
+    # elements. keep is the name of the preserved element the page is in, if
+    # any.
+    out = []
+    names = []
+    raw = []
+    keep = None
+    start = 0
+    text = ""
+    for match in TAG.finditer(html):
+        tag = match.group(0)
+        name = (match.group(1) or "").lower()
+        text += html[start:match.start()]
+        start = match.end()
+        if (keep is None and tag.startswith("<!--") and not tag.startswith("<!--[")):
+            continue
+        out.extend([text, tag])
+        names.append(name)
+        raw.append(keep is not None)
+        text = ""
+        if (keep is not None):
+            if (tag[1] == "/" and name == keep):
+                keep = None
+        elif (name in PRESERVE or PRE_LINE.match(tag) is not None):
+            keep = name
+    out.append(text+html[start:])
+    raw.append(keep is not None)
+
+    for i in range(len(raw)):
+        if (raw[i]):
+            continue
+        text = " ".join(out[2*i].split())
+        if (out[2*i][:1].isspace() and text != ""):
+            text = " "+text
+        if (out[2*i][-1:].isspace()):
+            text = text+" "
+        if (i > 0 and names[i-1] in BLOCK):
+            text = text.lstrip()
+        if (i < len(names) and names[i] in BLOCK):
+            text = text.rstrip()
+        out[2*i] = text
+    return "".join(out)
+
+# Method: MinifyCSS
+# Purpose: Minify a stylesheet. Drop comments and the whitespace around
+# braces, semicolons, commas, and child combinators, and after colons, and
+# collapse any other run of whitespace to one space. Leave strings as they are.
+# Parameters:
+# - css: Stylesheet (String)
+# Return: Minified stylesheet (String)
+def MinifyCSS(css):
+    # Split the stylesheet into text and strings, joining the text on either
+    # side of each comment.
+    parts = [""]
+    for i,part in enumerate(STRINGS.split(css)):
+        if (i % 2 == 0 or part.startswith("/*")):
+            parts[-1] += part if i % 2 == 0 else ""
+        else:
+            parts.extend([part, ""])
+
+    for i in range(0, len(parts), 2):
+        text = " ".join(parts[i].split())
+        if (parts[i][:1].isspace() and text != ""):
+            text = " "+text
+        if (parts[i][-1:].isspace()):
+            text = text+" "
+        for each in "{};,>":
+            text = text.replace(" "+each, each).replace(each+" ", each)
+        parts[i] = text.replace(": ", ":").replace(";}", "}")
+    return "".join(parts).strip()
+
+# Method: Rules
+# Purpose: Split a minified stylesheet into its top-level rules.
+# Parameters:
+# - css: Minified stylesheet, from MinifyCSS (String)
+# Return: [prelude, body] pairs, like ["a:hover", "color:#696"] (List)
+def Rules(css):
+    rules = []
+    depth = 0
+    start = 0
+    offset = 0
+    for i,part in enumerate(STRINGS.split(css)):
+        # Braces in strings don't count.
+        for j,char in enumerate(part if i % 2 == 0 else ""):
+            if (char == "{"):
+                if (depth == 0):
+                    brace = offset+j
+                depth += 1
+            elif (char == "}" and depth > 0):
+                depth -= 1
+                if (depth == 0):
+                    rules.append([css[start:brace].strip(), css[brace+1:offset+j]])
+                    start = offset+j+1
+        offset += len(part)
+    return rules
+
+# Method: Matches
+# Purpose: Tell whether a selector could match markup: whether every element
+# name, ID, and class it names is used there. Pseudo-classes are ignored, so
+# a:hover matches wherever a does.
+# Parameters:
+# - selector: One selector, like "nav a" (String)
+# - names: Element names, IDs prefixed with #, and classes prefixed with . in
+#   the markup (Set)
+# Return: True (Could match), False (Can't match)
+def Matches(selector, names):
+    for compound in selector.replace(">", " ").replace("+", " ").replace("~", " ").split():
+        for name in SIMPLE.findall(compound.split(":", 1)[0].split("[", 1)[0]):
+            if (name[0] not in "#." and name.lower() not in names or name[0] in "#." and name not in names):
+                return False
+    return True
+
+# Method: CriticalCSS
+# Purpose: Pick out the rules of a stylesheet that style some markup, like
+# the top of a page, including the ones inside @media and @supports rules.
+# Parameters:
+# - css: Minified stylesheet, from MinifyCSS (String)
+# - html: Markup (String)
+# Return: Minified stylesheet of the rules that match (String)
+def CriticalCSS(css, html):
+    names = {"html", "body"}
+    for match in TAG.finditer(html):
+        names.add((match.group(1) or "").lower())
+        for attribute,value in ATTRIBUTE.findall(match.group(0)):
+            names.update(("#" if attribute == "id" else ".")+x for x in value.split())
+    return Select(css, names)
+
+# Method: Select
+# Purpose: Pick out the rules of a stylesheet with selectors that could match
+# markup, for CriticalCSS.
+# Parameters:
+# - css: Minified stylesheet, from MinifyCSS (String)
+# - names: Names used in the markup, as for Matches (Set)
+# Return: Minified stylesheet of the rules that match (String)
+def Select(css, names):
+    out = []
+    for prelude,body in Rules(css):
+        if (prelude.startswith("@media") or prelude.startswith("@supports")):
+            inner = Select(body, names)
+            if (inner != ""):
+                out.append(prelude+"{"+inner+"}")
+        elif (not prelude.startswith("@")):
+            selectors = [x for x in prelude.split(",") if Matches(x, names)]
+            if (len(selectors) != 0):
+                out.append(",".join(selectors)+"{"+body+"}")
+    return "".join(out)
+
+# Method: InlineCSS
+# Purpose: Inline the rules of a page's stylesheet that style the top of the
+# page into its head, and load the full stylesheet without holding up the
+# first paint. Browsers without scripts still load it as before.
+# Parameters:
+# - head: Template head, through the opening <main> tag (String)
+# - root: Directory the stylesheet's path is relative to (String)
+# Return: Template head (String)
+def InlineCSS(head, root):
+    match = STYLESHEET.search(head)
+    if (match is None):
+        return head
+    try:
+        with open(root+match.group(1), "r", encoding="utf-8") as fd:
+            css = MinifyCSS(fd.read())
+    except OSError:
+        return head
+    href = match.group(1)
+    critical = CriticalCSS(css, head+FOLD)
+    link = f"<style>{critical}</style><link rel=\"preload\" href=\"{href}\" as=\"style\" onload=\"this.onload=null;this.rel='stylesheet'\"><noscript><link rel=\"stylesheet\" href=\"{href}\"></noscript>"
+    return head[:match.start()]+link+head[match.end():]
+
+class MinifyCache:
+    # Method: __init__
+    # Purpose: Describe the cache. The database is opened on first use, so
+    # each worker process and thread gets its own connection.
+    # Parameters:
+    # - self: Class namespace
+    # - root: Output directory, which pages are recorded relative to, so a
+    #   staging directory shares the live one's records (String)
+    # - path: Path to the cache database (String)
+    # Return: none
+    def __init__(self, root, path=MINIFY_FILE):
+        self.__root = root
+        self.__path = path
+        self.__local = local()
+
+    # Method: __connect
+    # Purpose: Open the cache database for this process and thread, creating
+    # it if necessary.
+    # Parameters:
+    # - self: Class namespace
+    # Return: Database connection (sqlite3.Connection)
+    def __connect(self):
+        if (getattr(self.__local, "pid", None) == getpid()):
+            return self.__local.db
+        if (dirname(self.__path) != ""):
+            makedirs(dirname(self.__path), exist_ok=True)
+        db = connect(self.__path, timeout=60, isolation_level=None)
+        # Losing the last few records in a crash only costs minifying again.
+        db.execute("PRAGMA journal_mode = WAL")
+        db.execute("PRAGMA synchronous = NORMAL")
+        db.execute("BEGIN IMMEDIATE")
+        if (db.execute("PRAGMA user_version").fetchone()[0] != VERSION):
+            db.execute("DROP TABLE IF EXISTS pages")
+            db.execute("CREATE TABLE pages (path TEXT PRIMARY KEY, digest TEXT, inode INTEGER, size INTEGER)")
+            db.execute(f"PRAGMA user_version = {VERSION}")
+        db.execute("COMMIT")
+        self.__local.db = db
+        self.__local.pid = getpid()
+        return db
+
+    # Method: key
+    # Purpose: Digest a page, before it is minified.
+    # Parameters:
+    # - self: Class namespace
+    # - text: Page (String)
+    # Return: Hex digest (String)
+    def key(self, text):
+        return sha1(text.encode("utf-8", "surrogatepass")).hexdigest()
+
+    # Method: current
+    # Purpose: Tell whether an output file holds a page minified already: the
+    # page's digest matches the one recorded for the file, and the file is
+    # the one written for it.
+    # Parameters:
+    # - self: Class namespace
+    # - path: Path to the output file (String)
+    # - digest: Page's digest, from key() (String)
+    # Return: True (Up to date), False (Minify the page)
+    def current(self, path, digest):
+        row = self.__connect().execute("SELECT digest, inode, size FROM pages WHERE path = ?", (relpath(path, self.__root),)).fetchone()
+        if (row is None or row[0] != digest):
+            return False
+        try:
+            info = stat(path)
+        except OSError:
+            return False
+        return (row[1] == info.st_ino and row[2] == info.st_size)
+
+    # Method: record
+    # Purpose: Record the page an output file holds, minified.
+    # Parameters:
+    # - self: Class namespace
+    # - path: Path to the output file (String)
+    # - digest: Page's digest, from key() (String)
+    # Return: none
+    def record(self, path, digest):
+        info = stat(path)
+        self.__connect().execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)", (relpath(path, self.__root), digest, info.st_ino, info.st_size))
+
+    # Method: close
+    # Purpose: Close this process and thread's database connection.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    def close(self):
+        if (getattr(self.__local, "pid", None) == getpid()):
+            self.__local.db.close()
+        self.__local.pid = None
@@ -0,0 +1,160 @@
+# Purpose: Write output files only when their contents change, and atomically
+# when they do: render the whole page first, compare it to the file already
+# there, and rename a finished temporary file over it. Readers never see a
+# half-written page, and an unchanged page keeps its mtime, so a deploy or
+# a `git add` only sees pages that really changed. Beside each text file, keep
+# a gzipped copy, compressed once when the file changes, for the preview
+# server and static hosts to send instead. Pages can be minified on the way
+# out, when a page changed since its file was written.
+
+# Import methods
+from os import stat, replace, fdopen, chmod, umask, remove, utime # File operations
+from os.path import dirname, basename, exists # Temporary files, compressed copies
+from tempfile import mkstemp # Temporary files
+from gzip import compress # Compressed copies
+from Minify import MinifyHTML # Minified pages
+
+# Constants
+## UMASK: Process's file mode creation mask, read by setting and restoring it (Int)
+## MODE: Permissions for new files, the same as open() would give them (Int)
+## COMPRESSIBLE: Extensions of the files to keep gzipped copies of (Tuple)
+## GZIP_LEVEL: Compression level of the gzipped copies (Int)
+## GZIP: Whether to keep gzipped copies, set by Precompress (Boolean)
+## MINIFY: Record of the pages minified, set by Minify, or None to write
+## pages as they are (MinifyCache)
+UMASK = umask(0o022)
+umask(UMASK)
+MODE = 0o666 & ~UMASK
+COMPRESSIBLE = (".html", ".xml", ".css", ".js", ".json", ".svg", ".txt")
+GZIP_LEVEL = 9
+GZIP = False
+MINIFY = None
+
+# Method: Precompress
+# Purpose: Turn the gzipped copies on or off, for this process.
+# Parameters:
+# - on: Keep gzipped copies (Boolean)
+# Return: none
+def Precompress(on):
+    global GZIP
+    GZIP = on
+
+# Method: Minify
+# Purpose: Turn minifying pages on or off, for this process.
+# Parameters:
+# - cache: Record of the pages minified, or None to turn minifying off
+#   (MinifyCache)
+# Return: none
+def Minify(cache):
+    global MINIFY
+    MINIFY = cache
+
+# Method: Replace
+# Purpose: Write a temporary file beside a file, on the same file system,
+# then rename it into place.
+# Parameters:
+# - path: Path to the file (String)
+# - data: New contents (Bytes)
+# Return: none
+def Replace(path, data):
+    fd, temp = mkstemp(prefix=f".{basename(path)}.", suffix=".tmp", dir=dirname(path) or ".")
+    try:
+        with fdopen(fd, "wb") as out:
+            out.write(data)
+        chmod(temp, MODE)
+        replace(temp, path)
+    except BaseException:
+        remove(temp)
+        raise
+
+# Method: Compress
+# Purpose: Bring a text file's gzipped copy, path.gz, in step with it: write
+# it if the file changed or it is missing, and delete it if copies are off or
+# it would be no smaller. The copy has no timestamp or name in its header, so
+# the same file always compresses to the same bytes.
+# Parameters:
+# - path: Path to the file (String)
+# - data: File's contents, or None to read them if need be (Bytes)
+# - changed: Whether the file was just written (Boolean)
+# Return: none
+def Compress(path, data, changed):
+    if (not path.endswith(COMPRESSIBLE)):
+        return
+    if (GZIP and (changed or not exists(path+".gz"))):
+        if (data is None):
+            with open(path, "rb") as fd:
+                data = fd.read()
+        packed = compress(data, GZIP_LEVEL, mtime=0)
+        if (len(packed) < len(data)):
+            Replace(path+".gz", packed)
+            return
+    elif (GZIP):
+        return
+    if (exists(path+".gz")):
+        remove(path+".gz")
+
+# Method: CompressAsset
+# Purpose: Bring a static asset's gzipped copy in step with it, going by mod
+# times: the copy takes the asset's mtime, so an asset that hasn't changed
+# since its copy was made is only stat'd.
+# Parameters:
+# - path: Path to the asset (String)
+# Return: True (Copy written or deleted), False (Already in step)
+def CompressAsset(path):
+    mtime = stat(path).st_mtime_ns
+    try:
+        if (GZIP and stat(path+".gz").st_mtime_ns == mtime):
+            return False
+    except OSError:
+        if (not GZIP):
+            return False
+    with open(path, "rb") as fd:
+        Compress(path, fd.read(), True)
+    if (exists(path+".gz")):
+        utime(path+".gz", ns=(mtime, mtime))
+    return True
+
+# Method: RemoveOutput
+# Purpose: Delete an output file, with its gzipped copy.
+# Parameters:
+# - path: Path to the file (String)
+# Return: none
+def RemoveOutput(path):
+    for each in [path, path+".gz"]:
+        if (exists(each)):
+            remove(each)
+
+# Method: WriteIfChanged
+# Purpose: Replace a file's contents, unless they are the same already, and
+# keep its gzipped copy in step. If minifying is on, minify a page first,
+# unless its file already holds it minified.
+# Parameters:
+# - path: Path to the file (String)
+# - text: New contents (String)
+# - encoding: Encoding to write the file in (String)
+# Return: True (File written), False (File already up to date)
+def WriteIfChanged(path, text, encoding="utf-8"):
+    digest = None
+    if (MINIFY is not None and path.endswith(".html")):
+        digest = MINIFY.key(text)
+        if (MINIFY.current(path, digest)):
+            Compress(path, None, False)
+            return False
+        text = MinifyHTML(text)
+    data = text.encode(encoding)
+
+    # Compare sizes first, so a changed page is rarely read back at all.
+    changed = True
+    try:
+        if (stat(path).st_size == len(data)):
+            with open(path, "rb") as fd:
+                changed = (fd.read() != data)
+    except OSError:
+        pass
+
+    if (changed):
+        Replace(path, data)
+    Compress(path, data, changed)
+    if (digest is not None):
+        MINIFY.record(path, digest)
+    return changed
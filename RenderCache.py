@@ -0,0 +1,158 @@
+# Purpose: Keep rendered HTML for each block of Markdown, between blank lines,
+# in an SQLite database, so a post that changed in one paragraph only sends
+# that paragraph back through the parser. Each block is keyed by its text and
+# the parser state it starts in, and the least recently used blocks are
+# evicted when the cache grows past its size limit.
+
+# Import methods
+from sqlite3 import connect # Cache database
+from os import makedirs, getpid # Cache directory, worker processes
+from os.path import dirname # Cache directory
+from hashlib import sha1 # Block digests
+from time import time # Last use
+
+# Constants
+## RENDER_FILE: Default location of the render cache database (String)
+## VERSION: Schema version. Bump to clear the cache. (Int)
+## MAX_SIZE: Characters of HTML to keep before evicting blocks (Int)
+## BATCH: Maximum number of blocks to look up in one query (Int)
+RENDER_FILE = "./.cache/render.db"
+VERSION = 1
+MAX_SIZE = 64*1024*1024
+BATCH = 256
+
+class RenderCache:
+    # Method: __init__
+    # Purpose: Describe the cache. The database is opened on first use, so
+    # each worker process gets its own connection.
+    # Parameters:
+    # - self: Class namespace
+    # - scope: Everything besides a block and its parser state that the
+    #   HTML depends on, like the parser's digest and the base URL (String)
+    # - path: Path to the cache database (String)
+    # - size: Characters of HTML to keep before evicting blocks (Int)
+    # Return: none
+    def __init__(self, scope, path=RENDER_FILE, size=MAX_SIZE):
+        self.__scope = scope
+        self.__path = path
+        self.__size = size
+        self.__db = None
+        self.__pid = None
+
+    # Method: __connect
+    # Purpose: Open the cache database for this process, creating it if
+    # necessary.
+    # Parameters:
+    # - self: Class namespace
+    # Return: Database connection (sqlite3.Connection)
+    def __connect(self):
+        if (self.__db is not None and self.__pid == getpid()):
+            return self.__db
+        if (dirname(self.__path) != ""):
+            makedirs(dirname(self.__path), exist_ok=True)
+        self.__db = connect(self.__path, timeout=60)
+        self.__pid = getpid()
+        # Losing the last few blocks in a crash only costs renders.
+        self.__db.execute("PRAGMA journal_mode = WAL")
+        self.__db.execute("PRAGMA synchronous = NORMAL")
+        # Workers can open the cache at the same time, so hold the write lock
+        # while checking the schema.
+        self.__db.execute("BEGIN IMMEDIATE")
+        if (self.__db.execute("PRAGMA user_version").fetchone()[0] != VERSION):
+            self.__db.execute("DROP TABLE IF EXISTS blocks")
+            self.__db.execute("CREATE TABLE blocks (digest TEXT, state TEXT, html TEXT, end TEXT, size INTEGER, used REAL, PRIMARY KEY (digest, state))")
+            self.__db.execute("CREATE INDEX blocks_used ON blocks (used)")
+            self.__db.execute(f"PRAGMA user_version = {VERSION}")
+        self.__db.commit()
+        return self.__db
+
+    # Method: key
+    # Purpose: Digest a block of Markdown within the cache's scope.
+    # Parameters:
+    # - self: Class namespace
+    # - block: Raw Markdown lines (List)
+    # Return: Hex digest (String)
+    def key(self, block):
+        return sha1((self.__scope+"\n"+repr(block)).encode("utf-8")).hexdigest()
+
+    # Method: fetch
+    # Purpose: Look up cached blocks.
+    # Parameters:
+    # - self: Class namespace
+    # - keys: Block digests, from key() (List)
+    # Return: Each digest found mapped to {start state: [html, end state]} (Dictionary)
+    def fetch(self, keys):
+        found = {}
+        keys = list(set(keys))
+        db = self.__connect()
+        for i in range(0, len(keys), BATCH):
+            batch = keys[i:i+BATCH]
+            for digest,state,html,end in db.execute(f"SELECT digest, state, html, end FROM blocks WHERE digest IN ({', '.join(['?']*len(batch))})", batch):
+                found.setdefault(digest, {})[state] = [html, end]
+        return found
+
+    # Method: touch
+    # Purpose: Mark cached blocks as used now, so eviction keeps them longer.
+    # Workers outlive a build in watch mode, so the time is taken per call.
+    # Parameters:
+    # - self: Class namespace
+    # - hits: [digest, start state] pairs (List)
+    # Return: none
+    def touch(self, hits):
+        now = time()
+        self.__connect().executemany("UPDATE blocks SET used = ? WHERE digest = ? AND state = ?", [[now]+x for x in hits])
+
+    # Method: store
+    # Purpose: Add rendered blocks to the cache.
+    # Parameters:
+    # - self: Class namespace
+    # - blocks: [digest, start state, html, end state] lists (List)
+    # Return: none
+    def store(self, blocks):
+        now = time()
+        self.__connect().executemany("INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?, ?, ?)", [x+[len(x[2]), now] for x in blocks])
+
+    # Method: commit
+    # Purpose: Commit pending changes.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    def commit(self):
+        if (self.__db is not None and self.__pid == getpid()):
+            self.__db.commit()
+
+    # Method: evict
+    # Purpose: Delete the least recently used blocks until the cache fits in
+    # its size limit, then fold the write-ahead log back into the database.
+    # Run it once every process is done writing.
+    # Parameters:
+    # - self: Class namespace
+    # Return: Number of blocks deleted (Int)
+    def evict(self):
+        db = self.__connect()
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM blocks").fetchone()[0]
+        if (total <= self.__size):
+            db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            return 0
+        # Walk the blocks from least recently used, counting the ones that
+        # have to go.
+        count = 0
+        for (size,) in db.execute("SELECT size FROM blocks ORDER BY used, rowid"):
+            total -= size
+            count += 1
+            if (total <= self.__size):
+                break
+        deleted = db.execute("DELETE FROM blocks WHERE rowid IN (SELECT rowid FROM blocks ORDER BY used, rowid LIMIT ?)", (count,)).rowcount
+        db.commit()
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return deleted
+
+    # Method: close
+    # Purpose: Close this process's database connection.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    def close(self):
+        if (self.__db is not None and self.__pid == getpid()):
+            self.__db.close()
+        self.__db = None
@@ -0,0 +1,591 @@
+# Purpose: Serve the built site for preview. Keep recently requested files in
+# memory, checked against their stat data on every request, with their
+# headers worked out once, and let browsers revalidate with ETag and
+# Last-Modified instead of downloading pages that didn't change, and send
+# the gzipped copy a build keeps beside each text file to clients that
+# accept it, without compressing anything as it serves. Serve on a
+# thread per connection, or on an asyncio event loop that keeps HTTP/1.1
+# connections open between requests, and write the access log in batches
+# from a background thread.
+
+# Import methods
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler # Web server
+from http import HTTPStatus # Status lines
+from http.client import parse_headers # Request headers
+from io import BytesIO # Request headers
+from os import stat, replace # Cache validation, log rotation
+from os.path import exists # Log rotation
+from os.path import normpath, join, basename # Request paths
+from urllib.parse import unquote, urlsplit # Request paths
+from email.utils import formatdate, parsedate_to_datetime # Last-Modified
+from mimetypes import guess_type, add_type # Content types
+from collections import OrderedDict # Least recently used files
+from threading import Lock, Thread, Event # Cache shared between request threads, log writer
+from queue import SimpleQueue # Log writer
+from hashlib import sha1 # ETags
+from gzip import decompress, BadGzipFile # Checking gzipped copies
+from zlib import error as ZlibError # Checking gzipped copies
+from time import strftime # Timestamping logs
+from CLI import c # Terminal colors
+from Assets import Fingerprinted # Fingerprinted assets
+
+# Constants
+## ROOT: Directory to serve (String)
+## PORT: Port to serve on (Int)
+## CACHE_SIZE: Bytes of file contents to keep in memory (Int)
+## CACHE_LIMIT: Size above which a file is sent straight from disk, with
+## sendfile, instead of being cached (Int)
+## TEXT_TYPES: Content types, besides text/*, that get a charset (List)
+## REVALIDATE: Cache-Control for files that may change under the same name (String)
+## IMMUTABLE: Cache-Control for fingerprinted assets, which never change (String)
+## ENGINES: Server engines: "thread" serves each connection on its own
+## thread, over HTTP/1.0; "async" serves every connection on one event loop,
+## over HTTP/1.1 with keep-alive (List)
+## KEEP_ALIVE: Seconds an idle connection stays open, in the async engine (Int)
+## MAX_HEAD: Largest request line and headers, or request body, in bytes, in
+## the async engine (Int)
+## LOG_PATH: Path to the access log (String)
+## LOG_SIZE: Size, in bytes, at which the access log is rotated (Int)
+## LOG_BACKUPS: Number of rotated access logs kept, as server.log.1 and so on (Int)
+## NOT_FOUND: Body of a 404 response, if there is no 404 page (Bytes)
+ROOT = "./html"
+PORT = 8000
+CACHE_SIZE = 64*1024*1024
+CACHE_LIMIT = 1024*1024
+TEXT_TYPES = ["application/xml", "application/json", "application/javascript", "application/manifest+json", "application/rss+xml", "application/atom+xml", "image/svg+xml"]
+REVALIDATE = "no-cache"
+IMMUTABLE = "public, max-age=31536000, immutable"
+ENGINES = ["thread", "async"]
+KEEP_ALIVE = 5
+MAX_HEAD = 64*1024
+LOG_PATH = "./server.log"
+LOG_SIZE = 1024*1024
+LOG_BACKUPS = 3
+NOT_FOUND = b"404 Not Found\n"
+
+add_type("text/xml", ".xml")
+add_type("application/manifest+json", ".webmanifest")
+add_type("application/rss+xml", ".rss")
+add_type("image/x-icon", ".ico")
+
+class FileCache:
+    # Method: __init__
+    # Purpose: Set up an empty cache.
+    # Parameters:
+    # - self: Class namespace
+    # - size: Bytes of file contents to keep (Int)
+    # - limit: Largest file to keep, in bytes (Int)
+    # Return: none
+    def __init__(self, size=CACHE_SIZE, limit=CACHE_LIMIT):
+        self.__size = size
+        self.__limit = limit
+        self.__used = 0
+        self.__files = OrderedDict()
+        self.__lock = Lock()
+
+    # Method: __describe
+    # Purpose: Read a file, if it is small enough to cache, with its gzipped
+    # copy, if it has one that matches it, and work out its headers.
+    # Parameters:
+    # - self: Class namespace
+    # - __path: Path to the file (String)
+    # - __info: File's stat data (stat_result)
+    # - __packed: Gzipped copy's stat data, or None (stat_result)
+    # Return: {"path", "key", "size", "body" (None if too big to cache),
+    # "gzip" (None if there is no copy), "etag", "gzip_etag", "modified",
+    # "type", "cache"} (Dict)
+    def __describe(self, __path, __info, __packed):
+        body = None
+        packed = None
+        if (__info.st_size <= self.__limit):
+            with open(__path, "rb") as fd:
+                body = fd.read()
+
+            # Use the gzipped copy only if it holds the file as it is now,
+            # since a build may be between writing the two.
+            if (__packed is not None):
+                try:
+                    with open(__path+".gz", "rb") as fd:
+                        packed = fd.read()
+                    if (decompress(packed) != body):
+                        packed = None
+                except (OSError, EOFError, BadGzipFile, ZlibError):
+                    packed = None
+        # Tag cached files by their contents, since a rebuilt page can keep
+        # its size and mtime; tag the rest by their stat data.
+        if (body is not None):
+            etag = f'"{sha1(body).hexdigest()[:20]}"'
+        else:
+            etag = f'"{__info.st_ino:x}-{__info.st_size:x}-{__info.st_mtime_ns:x}"'
+        kind = guess_type(__path)[0] or "application/octet-stream"
+        if (kind.startswith("text/") or kind in TEXT_TYPES):
+            kind += "; charset=utf-8"
+        # Date files by when they were written. A build sets each post's page
+        # back to its publication time, but renaming the page into place, and
+        # setting its mtime, both move its ctime.
+        written = max(__info.st_mtime, __info.st_ctime)
+        return {"path":__path, "key":self.__key(__info, __packed), "size":len(body) if body is not None else __info.st_size, "body":body, "gzip":packed, "etag":etag, "gzip_etag":etag[:-1]+'-gz"', "modified":formatdate(written, usegmt=True), "written":int(written), "type":kind, "cache":IMMUTABLE if ("/assets/" in __path and Fingerprinted(basename(__path))) else REVALIDATE}
+
+    # Method: __key
+    # Purpose: Identify a version of a file and its gzipped copy from their
+    # stat data. A page written by renaming a new file over the old one gets
+    # a new inode, even if its size and mtime stay the same.
+    # Parameters:
+    # - self: Class namespace
+    # - __info: File's stat data (stat_result)
+    # - __packed: Gzipped copy's stat data, or None (stat_result)
+    # Return: Version (Tuple)
+    def __key(self, __info, __packed):
+        key = (__info.st_ino, __info.st_size, __info.st_mtime_ns, __info.st_ctime_ns)
+        if (__packed is not None):
+            key += (__packed.st_ino, __packed.st_size, __packed.st_mtime_ns)
+        return key
+
+    # Method: get
+    # Purpose: Look up a file, reading it again if it changed since it was
+    # cached.
+    # Parameters:
+    # - self: Class namespace
+    # - path: Path to the file (String)
+    # Return: File description, from __describe, or None if there is no
+    # such file (Dict)
+    def get(self, path):
+        try:
+            info = stat(path)
+        except OSError:
+            return None
+        if ((info.st_mode & 0o170000) != 0o100000):
+            return None
+        packed = None
+        if (info.st_size <= self.__limit):
+            try:
+                packed = stat(path+".gz")
+            except OSError:
+                pass
+        with self.__lock:
+            entry = self.__files.get(path)
+            if (entry is not None and entry["key"] == self.__key(info, packed)):
+                self.__files.move_to_end(path)
+                return entry
+        try:
+            entry = self.__describe(path, info, packed)
+        except OSError:
+            return None
+
+        # Keep the file's contents, evicting the least recently used files
+        # once the cache is full.
+        with self.__lock:
+            old = self.__files.pop(path, None)
+            if (old is not None and old["body"] is not None):
+                self.__used -= len(old["body"])+len(old["gzip"] or b"")
+            if (entry["body"] is not None):
+                self.__files[path] = entry
+                self.__used += len(entry["body"])+len(entry["gzip"] or b"")
+                while (self.__used > self.__size):
+                    path, old = self.__files.popitem(last=False)
+                    self.__used -= len(old["body"])+len(old["gzip"] or b"")
+        return entry
+
+# Method: Resolve
+# Purpose: Map a request path to a file in the site, without letting it
+# escape the site's directory.
+# Parameters:
+# - target: Request target, like "/blog.html?x=1" (String)
+# - root: Directory to serve (String)
+# Return: Path to the file, or None if it falls outside root (String)
+def Resolve(target, root=ROOT):
+    path = unquote(urlsplit(target).path)
+    if (path.endswith("/")):
+        path += "index.html"
+    path = normpath("/"+path).lstrip("/")
+    if (path.startswith("..")):
+        return None
+    return join(root, path)
+
+# Method: AcceptsGzip
+# Purpose: Check whether a client accepts gzipped responses.
+# Parameters:
+# - headers: Request headers (Message)
+# Return: True (Accepts gzip), False (Doesn't)
+def AcceptsGzip(headers):
+    for each in headers.get("Accept-Encoding", "").split(","):
+        coding, _, params = each.partition(";")
+        if (coding.strip().lower() in ["gzip", "x-gzip", "*"]):
+            params = params.replace(" ", "").lower()
+            if (not params.startswith("q=")):
+                return True
+            try:
+                return (float(params[2:]) > 0)
+            except ValueError:
+                return False
+    return False
+
+# Method: NotModified
+# Purpose: Check a request's validators against a file, giving ETags
+# precedence over dates, as HTTP does.
+# Parameters:
+# - headers: Request headers (Message)
+# - entry: File description, from FileCache (Dict)
+# - etag: ETag of the version of the file to send (String)
+# Return: True (Client's copy is current), False (Send the file)
+def NotModified(headers, entry, etag):
+    tags = headers.get("If-None-Match")
+    if (tags is not None):
+        return (tags.strip() == "*" or etag in [x.strip().removeprefix("W/") for x in tags.split(",")])
+    since = headers.get("If-Modified-Since")
+    if (since is not None):
+        try:
+            return (entry["written"] <= parsedate_to_datetime(since).timestamp())
+        except (TypeError, ValueError):
+            return False
+    return False
+
+# Method: Respond
+# Purpose: Work out the response to a GET or HEAD request: a file, the 404
+# page if there is no such file, or just the file's headers if the client's
+# copy is current. Both engines send what this returns.
+# Parameters:
+# - cache: Files (FileCache)
+# - method: "GET" or "HEAD" (String)
+# - target: Request target (String)
+# - headers: Request headers (Message)
+# Return: [Status code, headers as [name, value] pairs, body to send or
+# None, path to a file to send from disk or None] (List)
+def Respond(cache, method, target, headers):
+    code = 200
+    path = Resolve(target)
+    entry = cache.get(path) if path is not None else None
+    if (entry is None):
+        code = 404
+        entry = cache.get(join(ROOT, "404.html"))
+        if (entry is None):
+            fields = [["Content-Type", "text/plain; charset=utf-8"], ["Content-Length", str(len(NOT_FOUND))]]
+            return [code, fields, NOT_FOUND if method == "GET" else None, None]
+
+    # Send the gzipped copy, if there is one and the client accepts it. It
+    # is a different representation, so it has its own ETag.
+    packed = (entry["gzip"] is not None and AcceptsGzip(headers))
+    body = entry["gzip"] if packed else entry["body"]
+    etag = entry["gzip_etag"] if packed else entry["etag"]
+    if (code == 200 and NotModified(headers, entry, etag)):
+        code = 304
+
+    fields = [["ETag", etag], ["Last-Modified", entry["modified"]], ["Cache-Control", entry["cache"] if code != 404 else REVALIDATE]]
+    if (entry["gzip"] is not None):
+        fields.append(["Vary", "Accept-Encoding"])
+    if (code != 304):
+        fields.append(["Content-Type", entry["type"]])
+        if (packed):
+            fields.append(["Content-Encoding", "gzip"])
+        fields.append(["Content-Length", str(len(body) if body is not None else entry["size"])])
+    if (method != "GET" or code == 304):
+        return [code, fields, None, None]
+    if (body is None):
+        return [code, fields, None, entry["path"]]
+    return [code, fields, body, None]
+
+class AccessLog:
+    # Method: __init__
+    # Purpose: Clear the access log, and start writing to it in the
+    # background.
+    # Parameters:
+    # - self: Class namespace
+    # - path: Path to the log (String)
+    # - size: Size, in bytes, at which the log is rotated (Int)
+    # - backups: Number of rotated logs to keep (Int)
+    # Return: none
+    def __init__(self, path=LOG_PATH, size=LOG_SIZE, backups=LOG_BACKUPS):
+        self.__path = path
+        self.__size = size
+        self.__backups = backups
+        self.__queue = SimpleQueue()
+        self.__fd = open(path, "w")
+        self.__thread = Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    # Method: __rotate
+    # Purpose: Move the log to server.log.1, server.log.1 to server.log.2,
+    # and so on, dropping the oldest, then start a new log.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    def __rotate(self):
+        self.__fd.close()
+        for i in range(self.__backups-1, 0, -1):
+            if (exists(f"{self.__path}.{i}")):
+                replace(f"{self.__path}.{i}", f"{self.__path}.{i+1}")
+        if (self.__backups > 0):
+            replace(self.__path, f"{self.__path}.1")
+        self.__fd = open(self.__path, "w")
+
+    # Method: __run
+    # Purpose: Write lines as they arrive, with every line that arrived
+    # while the last batch was being written, in a single write, and echo
+    # them to the terminal. Stop at None.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    def __run(self):
+        done = False
+        while (not done):
+            lines = [self.__queue.get()]
+            while (not self.__queue.empty()):
+                lines.append(self.__queue.get())
+            if (None in lines):
+                lines = lines[:lines.index(None)]
+                done = True
+            if (len(lines) == 0):
+                continue
+            if (self.__fd.tell() >= self.__size):
+                self.__rotate()
+            batch = "\n".join(lines)+"\n"
+            self.__fd.write(batch)
+            self.__fd.flush()
+            print(batch, end="", flush=True)
+        self.__fd.close()
+
+    # Method: write
+    # Purpose: Queue a line for the log, without waiting for it to be
+    # written.
+    # Parameters:
+    # - self: Class namespace
+    # - line: Log line, without a newline (String)
+    # Return: none
+    def write(self, line):
+        self.__queue.put(line)
+
+    # Method: close
+    # Purpose: Note a graceful shutdown, write every queued line, and close
+    # the log.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    def close(self):
+        if (not self.__thread.is_alive()):
+            return
+        self.__queue.put(f"- - - [{strftime('%d/%b/%Y %H:%M:%S')}] Graceful shutdown - -")
+        self.__queue.put(None)
+        self.__thread.join()
+
+class ThreadServer(ThreadingHTTPServer):
+    # Method: __init__
+    # Purpose: Set up a server that handles each connection on its own
+    # thread.
+    # Parameters:
+    # - self: Class namespace
+    # - address: Host and port to listen on (Tuple)
+    # - cache: Files (FileCache)
+    # - log: Access log (AccessLog)
+    # Return: none
+    def __init__(self, address, cache, log):
+        self.log = log
+
+        # Setup the request handler
+        class GetHandler(BaseHTTPRequestHandler):
+            # Method: send
+            # Purpose: Answer a GET or HEAD request. Send a cached file in
+            # one write, and a large one straight from disk.
+            # Parameters:
+            # - self: Class namespace
+            # Return: none
+            def send(self):
+                code, fields, body, path = Respond(cache, self.command, self.path, self.headers)
+                self.send_response(code)
+                for name, value in fields:
+                    self.send_header(name, value)
+                self.end_headers()
+                if (body is not None):
+                    self.wfile.write(body)
+                elif (path is not None):
+                    with open(path, "rb") as fd:
+                        self.wfile.flush()
+                        self.connection.sendfile(fd)
+
+            def do_GET(self): self.send() # Handle GET requests
+            def do_HEAD(self): self.send() # Handle HEAD requests
+
+            # Send nothing if client uses a valid but unsupported HTTP methods.
+            def do_POST(self): return False
+            def do_PUT(self): return False
+            def do_DELETE(self): return False
+            def do_CONNECT(self): return False
+            def do_OPTIONS(self): return False
+            def do_TRACE(self): return False
+            def do_PATCH(self): return False
+
+            # Custom log handler that queues the log message.
+            def log_request(self, code):
+                log.write(f"{self.client_address[0]} - - [{self.log_date_time_string()}] {self.requestline} {code} -")
+
+        super().__init__(address, GetHandler)
+
+    # Method: shutdown
+    # Purpose: Stop serving, close the socket, and close the log.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    def shutdown(self):
+        super().shutdown()
+        self.server_close()
+        self.log.close()
+
+class AsyncServer:
+    # Method: __init__
+    # Purpose: Bind a socket for a server that handles every connection on
+    # one asyncio event loop. asyncio is imported here, so the thread engine
+    # never loads it.
+    # Parameters:
+    # - self: Class namespace
+    # - address: Host and port to listen on (Tuple)
+    # - cache: Files (FileCache)
+    # - log: Access log (AccessLog)
+    # Return: none
+    def __init__(self, address, cache, log):
+        from socket import create_server # Listening socket
+        self.log = log
+        self.__cache = cache
+        self.__socket = create_server(address, backlog=128)
+        self.__loop = None
+        self.__stop = None
+        self.__clients = {}
+        self.__started = False
+        self.__request = Event()
+        self.__done = Event()
+
+    # Method: __client
+    # Purpose: Serve requests on a connection until the client closes it,
+    # asks to, sends something other than a GET or HEAD request, or stays
+    # idle for KEEP_ALIVE seconds.
+    # Parameters:
+    # - self: Class namespace
+    # - __reader: Connection's input (StreamReader)
+    # - __writer: Connection's output (StreamWriter)
+    # Return: none
+    async def __client(self, __reader, __writer):
+        from asyncio import wait_for, current_task, IncompleteReadError, LimitOverrunError, TimeoutError # Event loop
+
+        client = __writer.get_extra_info("peername")[0]
+        task = current_task()
+        self.__clients[task] = __writer
+        try:
+            while (True):
+                try:
+                    head = await wait_for(__reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE)
+                except (TimeoutError, IncompleteReadError, LimitOverrunError, ConnectionError):
+                    break
+                requestline, _, rest = head.partition(b"\r\n")
+                requestline = requestline.decode("latin-1")
+                words = requestline.split()
+                if (len(words) != 3 or not words[2].startswith("HTTP/")):
+                    break
+                method, target, version = words
+                headers = parse_headers(BytesIO(rest))
+
+                # Keep the connection open by default in HTTP/1.1, and only
+                # on request in HTTP/1.0. Skip any request body.
+                connection = headers.get("Connection", "").lower()
+                keep = (connection != "close") if version == "HTTP/1.1" else (connection == "keep-alive")
+                if (headers.get("Transfer-Encoding") is not None):
+                    keep = False
+                length = headers.get("Content-Length", "0")
+                if (not length.isdigit() or int(length) > MAX_HEAD):
+                    break
+                if (int(length) > 0):
+                    await __reader.readexactly(int(length))
+
+                # Send nothing if client uses a valid but unsupported HTTP methods.
+                if (method not in ["GET", "HEAD"]):
+                    break
+
+                # Send the headers and a cached file in one write, and a large
+                # file straight from disk.
+                code, fields, body, path = Respond(self.__cache, method, target, headers)
+                fields = [["Date", formatdate(usegmt=True)]]+fields+[["Connection", "keep-alive" if keep else "close"]]
+                response = f"HTTP/1.1 {code} {HTTPStatus(code).phrase}\r\n"+"".join([f"{name}: {value}\r\n" for name, value in fields])+"\r\n"
+                __writer.write(response.encode("latin-1")+(body or b""))
+                if (path is not None):
+                    await __writer.drain()
+                    with open(path, "rb") as fd:
+                        await self.__loop.sendfile(__writer.transport, fd)
+                await __writer.drain()
+                self.log.write(f"{client} - - [{strftime('%d/%b/%Y %H:%M:%S')}] {requestline} {code} -")
+                if (not keep):
+                    break
+        except (ConnectionError, IncompleteReadError):
+            pass
+        finally:
+            self.__clients.pop(task, None)
+            __writer.close()
+
+    # Method: __serve
+    # Purpose: Accept connections until shutdown is requested. Then close
+    # the open connections, so their handlers finish on their own instead
+    # of being cancelled.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    async def __serve(self):
+        from asyncio import get_running_loop, start_server, gather, Event # Event loop
+        self.__stop = Event()
+        self.__loop = get_running_loop()
+        if (self.__request.is_set()):
+            return
+        server = await start_server(self.__client, sock=self.__socket, limit=MAX_HEAD)
+        try:
+            async with server:
+                await self.__stop.wait()
+        finally:
+            for writer in list(self.__clients.values()):
+                writer.close()
+            await gather(*self.__clients, return_exceptions=True)
+
+    # Method: serve_forever
+    # Purpose: Serve until shutdown is called, or the user issues an
+    # interrupt, like ThreadingHTTPServer's method of the same name.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    def serve_forever(self):
+        from asyncio import run # Event loop
+        self.__started = True
+        try:
+            run(self.__serve())
+        finally:
+            self.__done.set()
+
+    # Method: shutdown
+    # Purpose: Stop serving, from any thread, wait for the event loop to
+    # finish, and close the log.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    def shutdown(self):
+        self.__request.set()
+        if (self.__loop is not None and not self.__loop.is_closed()):
+            try:
+                self.__loop.call_soon_threadsafe(self.__stop.set)
+            except RuntimeError:
+                pass
+        if (self.__started):
+            self.__done.wait()
+        self.__socket.close()
+        self.log.close()
+
+# Method: PreviewServer
+# Purpose: Set up a web server to preview the site in ./html, reachable from
+# this machine only, or from the whole network.
+# Parameters:
+# - public: Listen on every interface, rather than localhost (Boolean)
+# - engine: Server engine, from ENGINES (String)
+# Return: Server, ready to serve (ThreadServer or AsyncServer)
+def PreviewServer(public, engine="thread"):
+    # Make web server public or private, and notify user
+    if (public):
+        server_address = ("0.0.0.0", PORT)
+        print(f"Serving {c.WARNING}public{c.ENDC} web server at port {c.OKGREEN}{PORT}{c.ENDC}. Use {c.BOLD}CTRL-C{c.ENDC} to exit.")
+    else:
+        server_address = ("127.0.0.1", PORT)
+        print(f"Serving {c.OKGREEN}private{c.ENDC} web server at port {c.OKGREEN}{PORT}{c.ENDC}. Use {c.BOLD}CTRL-C{c.ENDC} to exit.")
+    if (engine == "async"):
+        return AsyncServer(server_address, FileCache(), AccessLog())
+    return ThreadServer(server_address, FileCache(), AccessLog())
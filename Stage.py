@@ -0,0 +1,82 @@
+# Purpose: Rebuild the whole site beside the live one, then swap it in. A
+# full rebuild renders into a staging directory that starts with hard links
+# to the live site's static files, and only replaces the live directory once
+# it is complete, keeping the one it replaced for an instant rollback. The
+# live site stays whole the entire time.
+
+# Import methods
+from os import walk, link, makedirs, rename # File operations
+from os.path import isdir, join, relpath # File operations
+from shutil import copy2, rmtree # Linking across file systems, cleanup
+
+# Constants
+## STAGING: Suffix of the directory a full rebuild renders into (String)
+## PREVIOUS: Suffix of the directory the last live site is kept in (String)
+## RETIRED: Suffix of a directory on its way out (String)
+STAGING = ".next"
+PREVIOUS = ".prev"
+RETIRED = ".old"
+
+# Method: Generated
+# Purpose: Tell whether a file in the output directory is one a build
+# writes, or its gzipped copy, as opposed to a static asset.
+# Parameters:
+# - path: Path relative to the output directory (String)
+# Return: True (Written by a build), False (Static asset)
+def Generated(path):
+    return (path.endswith((".html", ".html.gz")) and not path.startswith("assets"))
+
+# Method: Prepare
+# Purpose: Set up a fresh staging directory beside the live one, with the
+# live directory's structure and static assets. Assets are hard linked, or
+# copied if the file system can't link them, so the builds never write to
+# them; every page is written to a new file and renamed into place.
+# Parameters:
+# - live: Path to the live output directory (String)
+# Return: Path to the staging directory (String)
+def Prepare(live):
+    staging = live.rstrip("/")+STAGING
+    rmtree(staging, ignore_errors=True)
+    for root, dirs, files in walk(live):
+        target = join(staging, relpath(root, live))
+        makedirs(target, exist_ok=True)
+        for file in files:
+            if (Generated(relpath(join(root, file), live))): continue
+            try:
+                link(join(root, file), join(target, file))
+            except OSError:
+                copy2(join(root, file), join(target, file))
+    return staging
+
+# Method: Swap
+# Purpose: Make a finished staging directory live, and keep the live one as
+# the previous generation. Each step is a rename, so the live directory is
+# only missing between two system calls, and the generation before last is
+# deleted after the new one is already live.
+# Parameters:
+# - live: Path to the live output directory (String)
+# Return: none
+def Swap(live):
+    live = live.rstrip("/")
+    if (isdir(live+PREVIOUS)):
+        rmtree(live+RETIRED, ignore_errors=True)
+        rename(live+PREVIOUS, live+RETIRED)
+    rename(live, live+PREVIOUS)
+    rename(live+STAGING, live)
+    rmtree(live+RETIRED, ignore_errors=True)
+
+# Method: Rollback
+# Purpose: Trade the live output directory for the previous generation.
+# Rolling back twice restores the newer one.
+# Parameters:
+# - live: Path to the live output directory (String)
+# Return: True (Rolled back), False (No previous generation)
+def Rollback(live):
+    live = live.rstrip("/")
+    if (not isdir(live+PREVIOUS)):
+        return False
+    rmtree(live+RETIRED, ignore_errors=True)
+    rename(live, live+RETIRED)
+    rename(live+PREVIOUS, live)
+    rename(live+RETIRED, live+PREVIOUS)
+    return True
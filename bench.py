@@ -0,0 +1,382 @@
+#!/usr/local/bin/python3
+
+# Purpose: Microbenchmarks for the hot paths of a build. Run with the names of
+# the benchmarks to run, or none to run them all, from the root directory.
+# Usage: ./bench.py [-n LINES] [blocks] [inline] [html] [executors] [startup]
+
+# Import methods
+from sys import argv, exit, executable # Command line arguments, startup
+from os import listdir, cpu_count, makedirs # Corpus, workers, startup
+from os.path import isdir, dirname, abspath, join # Corpus, startup
+from subprocess import run, DEVNULL # Startup
+from tempfile import TemporaryDirectory # Startup
+from time import perf_counter # Timing
+from threading import local # Per-worker parser
+from Markdown import Markdown # Parser
+from Executor import Executor, KINDS # Build stage backends
+
+# Constants
+## SAMPLE: Representative Markdown, used when ./content has no posts (String)
+## LINES: Default corpus size, in lines (Int)
+## REPEAT: Number of timed runs. The fastest one is reported. (Int)
+## POSTS: Numbers of posts to build with each executor backend (List)
+## POST_LINES: Lines of Markdown in each of those posts (Int)
+## STARTUP_POSTS: Number of posts on the site a no-op build is timed on (Int)
+## STARTUP_TARGET: Most time, in seconds, a no-op build may take (Float)
+SAMPLE = """# A Header: With an Anchor
+
+A paragraph with *emphasis*, **strong text**, `inline code`, and a [link](https://example.com). It's "quoted" -- and 'single quoted'.
+Another paragraph, with a footnote[^1] and a [link to a post]().
+
+* An unordered list
+* With two items
+    * And a nested one
+* Back out
+
+1. An ordered list
+2. With two items
+
+> A blockquote, with a [link](https://example.com).
+> Continued.
+
++---+---+
+| a | b |
++---+---+
+
+```python
+def f(x):
+    return x*2
+```
+
+![An image](https://example.com/image.png "Title")
+
+---
+
+<div class="raw">Raw HTML</div>
+
+[>1] A footnote, with *emphasis*.
+"""
+LINES = 100000
+REPEAT = 5
+POSTS = [10, 1000, 50000]
+POST_LINES = 20
+STARTUP_POSTS = 1000
+STARTUP_TARGET = 0.1
+
+# Worker state: each thread gets its own parser (worker.md).
+worker = local()
+
+# Method: Corpus
+# Purpose: Read every post in ./content, or repeat SAMPLE, into a corpus.
+# Parameters:
+# - size: Number of lines in the corpus (Int)
+# Return: Lines of Markdown, without trailing newlines (List)
+def Corpus(size):
+    lines = []
+    if (isdir("./content")):
+        for each in sorted(listdir("./content")):
+            if (each[-4:] == ".txt"):
+                with open("./content/"+each, "r", encoding="utf-8") as fd:
+                    # Skip the header.
+                    lines.extend(fd.read().split("\n")[6:])
+    if (len(lines) == 0):
+        lines = SAMPLE.split("\n")
+    return (lines * (size // len(lines) + 1))[0:size]
+
+# Method: Time
+# Purpose: Time a function over a corpus, REPEAT times.
+# Parameters:
+# - fn: Function to time, called once per line (Function)
+# - lines: Corpus (List)
+# - setup: Function called before each run (Function)
+# Return: Fastest run, in nanoseconds per line (Float)
+def Time(fn, lines, setup=None):
+    best = None
+    for i in range(REPEAT):
+        if (setup is not None):
+            setup()
+        start = perf_counter()
+        for line in lines:
+            fn(line)
+        elapsed = perf_counter() - start
+        if (best is None or elapsed < best):
+            best = elapsed
+    return best * 1e9 / len(lines)
+
+class Chain:
+    # Method: __init__
+    # Purpose: Hold the parser's line trackers as it kept them before block
+    # classification dispatched on a line's first character: growing lists,
+    # trimmed with pop(0), and an if/elif chain that every line walked. Kept
+    # here, unchanged, so BenchBlocks can time the parser against it.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    def __init__(self):
+        self.clear()
+
+    # Method: clear
+    # Purpose: Reset the trackers, as Markdown.clear does.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    def clear(self):
+        self.__line_tracker = ["", "", ""]
+        self.__line_type_tracker = ["", "", ""]
+        self.__line_indent_tracker = [0, 0, 0]
+        self.__close_out = []
+        self.__pre = False
+        self.__html = False
+
+    # Method: track
+    # Purpose: Update the trackers for a line, in the order html() did.
+    # Parameters:
+    # - self: Class namespace
+    # - __line: Raw Markdown line (String)
+    # Return: none
+    def track(self, __line):
+        self.__updateIndentTracker(__line)
+        self.__updateLineTracker(__line)
+        self.__updateLineTypeTracker(__line)
+
+    # Method: __updateLineTracker
+    # Purpose: Keep track of raw lines.
+    # Parameters:
+    # - self: Class namespace
+    # - __line: Raw Markdown line (String)
+    # Return: none
+    def __updateLineTracker(self, __line):
+        self.__line_tracker.append(__line)
+        if (len(self.__line_tracker) > 3):
+            self.__line_tracker.pop(0)
+
+    # Method: __updateLineTypeTracker
+    # Purpose: Determine type of line, and whether it is part of a larger
+    # block-level element, and annotate that in the line type tracker.
+    # Parameters:
+    # - self: Class namespace
+    # - __line: Raw Markdown line (String)
+    # Return: none
+    def __updateLineTypeTracker(self, __line):
+        __line = __line.lstrip(' ')
+
+        if (__line == "<html>"):
+            if (self.__line_type_tracker[-2] == "" and self.__line_type_tracker[-3] == ""):
+                self.__html = True
+
+        if (len(__line.strip()) == 0):
+            self.__line_type_tracker.append("blank")
+        elif (__line == "{EOF}"):
+            self.__line_type_tracker.append("EOF")
+        elif (__line[0] == "<" and (__line[0:4] != "<pre" and __line[0:5] != "</pre")):
+            self.__line_type_tracker.append("raw")
+        elif (__line[0] == "#"):
+            self.__line_type_tracker.append("header")
+        elif (__line[0:4] == "---" or __line[0:7] == "* * *"):
+            self.__line_type_tracker.append("hr")
+        elif (__line[0:2] == "!["):
+            self.__line_type_tracker.append("img")
+        elif (__line[0] == "{" and self.__pre == False):
+            self.__line_type_tracker.append("idx")
+        elif (__line[0] in ['*', '+', '-'] and __line[1] == ' '):
+            if (self.__line_indent_tracker[-1] > self.__line_indent_tracker[-2]):
+                self.__line_type_tracker.append("ul")
+            elif (self.__line_indent_tracker[-1] < self.__line_indent_tracker[-2]):
+                self.__line_type_tracker.append("/ul")
+            elif (self.__line_type_tracker[-1] == "ul" or self.__line_type_tracker[-1] == "li"):
+                self.__line_type_tracker.append("li")
+            elif (len(self.__close_out) != 0):
+                self.__line_type_tracker.append("li")
+            else:
+                self.__line_type_tracker.append("ul")
+        elif (__line[0].isdigit() and __line[1] == ".") or (__line[0:1].isdigit() and __line[2] == "."):
+            if (self.__line_indent_tracker[-1] > self.__line_indent_tracker[-2]):
+                self.__line_type_tracker.append("ol")
+            elif (self.__line_indent_tracker[-1] < self.__line_indent_tracker[-2]):
+                self.__line_type_tracker.append("/ol")
+            elif (self.__line_type_tracker[-1] == "ol" or self.__line_type_tracker[-1] == "li"):
+                self.__line_type_tracker.append("li")
+            elif (self.__line_type_tracker[-1] == "/ol" and len(self.__close_out) != 0):
+                self.__line_type_tracker.append("li")
+            else:
+                self.__line_type_tracker.append("ol")
+        elif (__line[0] == "+" and __line[1] == "-"):
+            if (self.__line_type_tracker[-1] != "tr"):
+                self.__line_type_tracker.append("table")
+            else:
+                self.__line_type_tracker.append("tr")
+        elif  (__line[0] == "|"):
+            self.__line_type_tracker.append("tr")
+        elif (__line[0] == ">"):
+            if (self.__line_type_tracker[-1] == "blockquote" or self.__line_type_tracker[-1] == "bqt"):
+                self.__line_type_tracker.append("bqt")
+            else:
+                self.__line_type_tracker.append("blockquote")
+        elif (__line[0:3] == "```" or __line[0:4] == "<pre" or __line[0:5] == "</pre"):
+            self.__line_type_tracker.append("pre")
+            self.__pre = not self.__pre
+        elif (__line[0:2] == "[>"):
+            self.__line_type_tracker.append("fn")
+        else:
+            self.__line_type_tracker.append("p")
+
+        if (len(self.__line_type_tracker) > 3):
+            self.__line_type_tracker.pop(0)
+
+    # Method: __updateIndentTracker
+    # Purpose: Keep track of the indentation level.
+    # Parameters:
+    # - self: Class namespace
+    # - __line: Raw Markdown line (String)
+    # Return: none
+    def __updateIndentTracker(self, __line):
+        if (__line.strip() == ""):
+            self.__line_indent_tracker.append(0)
+        else:
+            self.__line_indent_tracker.append(len(__line) - len(__line.lstrip(' ')))
+        if (len(self.__line_indent_tracker) > 3):
+            self.__line_indent_tracker.pop(0)
+
+# Method: BenchBlocks
+# Purpose: Time block classification: the tracker updates the parser runs for
+# every line before rendering it, and the same updates the way the parser
+# made them before, with Chain.
+# Parameters:
+# - lines: Corpus (List)
+# Return: Rows of [classifier, nanoseconds per line] (List)
+def BenchBlocks(lines):
+    chain = Chain()
+    md = Markdown()
+    track = md._Markdown__track
+    return [["if/elif chain, before", Time(chain.track, lines, chain.clear)], ["first-character dispatch", Time(lambda line: track(line, line.lstrip(' ')), lines, md.clear)]]
+
+# Method: BenchInline
+# Purpose: Time inline Markdown parsing alone.
+# Parameters:
+# - lines: Corpus (List)
+# Return: Nanoseconds per line (Float)
+def BenchInline(lines):
+    return Time(Markdown()._Markdown__parseInlineMD, lines)
+
+# Method: BenchHTML
+# Purpose: Time rendering lines to HTML, block and inline stages together.
+# Parameters:
+# - lines: Corpus (List)
+# Return: Nanoseconds per line (Float)
+def BenchHTML(lines):
+    md = Markdown()
+    return Time(md.html, lines, md.clear)
+
+# Method: Prepare
+# Purpose: Set up an executor worker with its own parser.
+# Parameters: none
+# Return: none
+def Prepare():
+    worker.md = Markdown()
+
+# Method: Render
+# Purpose: Render a post the way TestAndBuild does, for BenchExecutors.
+# Parameters:
+# - lines: Post content (List)
+# Return: Length of the rendered post (Int)
+def Render(lines):
+    return sum(len(x) for x in worker.md.render(lines))
+
+# Method: BenchExecutors
+# Purpose: Time the post stage of a build on each executor backend, and on
+# the one Executor picks, for small to large sites. Includes starting the
+# backend, which is what makes pools lose on small builds.
+# Parameters:
+# - lines: Corpus (List)
+# Return: Rows of [posts, backend, microseconds per post] (List)
+def BenchExecutors(lines):
+    rows = []
+    for count in POSTS:
+        posts = [[lines[(i*POST_LINES) % len(lines):(i*POST_LINES) % len(lines)+POST_LINES]] for i in range(count)]
+        for kind in KINDS+["auto"]:
+            executor = Executor(cpu_count() or 1, Prepare, (), {} if kind == "auto" else {"posts":kind})
+            start = perf_counter()
+            for each in executor.run("posts", Render, posts): pass
+            executor.close()
+            elapsed = perf_counter() - start
+            rows.append([count, kind if kind != "auto" else "auto: "+executor.used()["posts"], elapsed * 1e6 / count])
+    return rows
+
+# Method: Site
+# Purpose: Set up a site to build, with a minimal template and config.
+# Parameters:
+# - root: Directory to set the site up in (String)
+# - lines: Corpus (List)
+# - count: Number of posts (Int)
+# Return: none
+def Site(root, lines, count):
+    for each in ["content", "templates", "html/assets"]:
+        makedirs(join(root, each))
+    with open(join(root, "Config.json"), "w", encoding="utf-8") as fd:
+        fd.write("{\n"+",\n".join(f'    "{x}" : "{x}"' for x in ["meta_baseurl", "byline", "full_name", "meta_keywords", "meta_appname", "twitter_url", "insta_url"])+"\n}\n")
+    with open(join(root, "templates/main.html"), "w", encoding="utf-8") as fd:
+        fd.write("<html><head><title>{{TITLE}}</title></head><body id='{{BODYID}}'>\n<!-- DIVIDER -->\n</body></html>\n")
+    open(join(root, "html/assets/main.css"), "w").close()
+    for i in range(count):
+        with open(join(root, f"content/Post {i}.txt"), "w", encoding="utf-8") as fd:
+            fd.write(f"Type: original\nTitle: Post {i}\nLink: post-{i}.html\nPubdate: 2020/01/01 00:00:00\nCategory: Tech\nAuthor: Bench\n\n")
+            fd.write("\n".join(lines[(i*POST_LINES) % len(lines):(i*POST_LINES) % len(lines)+POST_LINES])+"\n")
+
+# Method: BenchStartup
+# Purpose: Time a build with nothing to do, on a site of STARTUP_POSTS posts,
+# against the interpreter starting up and doing nothing.
+# Parameters:
+# - lines: Corpus (List)
+# Return: Rows of [what was timed, fastest run in seconds] (List)
+def BenchStartup(lines):
+    blog = join(dirname(abspath(__file__)), "blog.py")
+    with TemporaryDirectory() as root:
+        Site(root, lines, STARTUP_POSTS)
+        run([executable, blog], cwd=root, stdout=DEVNULL, check=True)
+        rows = []
+        for name, command in [["python", [executable, "-c", "pass"]], ["no-op build", [executable, blog]]]:
+            best = None
+            for i in range(REPEAT*2):
+                start = perf_counter()
+                run(command, cwd=root, stdout=DEVNULL, check=True)
+                elapsed = perf_counter() - start
+                if (best is None or elapsed < best):
+                    best = elapsed
+            rows.append([name, best])
+    return rows
+
+# Benchmarks, by name
+BENCHMARKS = {"blocks": BenchBlocks, "inline": BenchInline, "html": BenchHTML, "executors": BenchExecutors, "startup": BenchStartup}
+
+if (__name__ == "__main__"):
+    args = argv[1:]
+    size = LINES
+    if ("-n" in args):
+        i = args.index("-n")
+        size = int(args[i+1])
+        del args[i:i+2]
+    for each in args:
+        if (each not in BENCHMARKS):
+            print(f"Unknown benchmark: {each}. Choose from: {', '.join(BENCHMARKS)}")
+            exit(1)
+    lines = Corpus(size)
+    failed = False
+    for each in (args or list(BENCHMARKS)):
+        if (each == "blocks"):
+            for name, speed in BenchBlocks(lines):
+                print(f"{each:8} {speed:10.0f} ns/line ({len(lines)} lines, {name})")
+        elif (each == "executors"):
+            for count, kind, speed in BenchExecutors(lines):
+                print(f"{each:8} {speed:10.0f} us/post ({count} posts, {kind})")
+        elif (each == "startup"):
+            rows = BenchStartup(lines)
+            for name, elapsed in rows:
+                print(f"{each:8} {elapsed*1e3:10.0f} ms      ({name}, {STARTUP_POSTS} posts)")
+            # Fail if a no-op build misses the target.
+            if (rows[1][1] > STARTUP_TARGET):
+                print(f"{each:8} {'FAILED':>10}         no-op build took longer than {STARTUP_TARGET*1e3:.0f} ms")
+                failed = True
+        else:
+            print(f"{each:8} {BENCHMARKS[each](lines):10.0f} ns/line ({len(lines)} lines)")
+    if (failed):
+        exit(1)
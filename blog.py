@@ -1,78 +1,156 @@
 #!/usr/bin/python3
 
-# Imports 
-from multiprocessing import Pool # Multiprocessing
-from os import listdir, stat, mkdir, utime # File/folder operations
-from os.path import isfile, isdir # File/folder operations
-from time import localtime, strftime, strptime, mktime, gmtime # Mod time operations
+# Imports. Only what a build with nothing to do needs is imported here. The
+# rest is imported once a build finds something changed, and by the functions
+# workers run, since a spawned worker never runs the main block.
+from os import listdir, stat, mkdir, makedirs, utime, cpu_count, devnull # File/folder operations, worker count
+from os.path import isfile, isdir, dirname, abspath, join # File/folder operations
+from time import localtime, strftime, strptime, mktime, time # Mod time operations
 from datetime import datetime # Runtime
-from locale import getpreferredencoding # Speed up file opens
 from CLI import * # FirstCrack's command-line interface
-from Markdown import Markdown # Markdown parser
-from random import choices # Explore page
+from Manifest import Snapshot, Unchanged, SaveManifest # No-op builds
+from Executor import Executor, ParseKinds # Serial, thread, and process backends
+from itertools import chain # Streaming content files
+from threading import local # Per-worker parser
 
 # Constants
 ## BASE_DIR: Base working directory, with trailing / (String)
-## MAX_PROCESSES: Process limit (Int)
+## MAX_PROCESSES: Default worker limit, one per CPU (Int)
 ## ENCODING: File system encoding (String)
 ## MONTHS: A map of month numbers to names (Dictionary)
+## BLOG_POSTS: Number of posts on the blog page (Int)
+## HTML_DIR: Live output directory, without trailing / (String)
+## OUTPUTS: Output directories whose pages the no-op check also takes stock
+## of, so deleting or editing a post's page rebuilds it (List)
+## WATCH_INTERVAL: Seconds between checks for changes in watch mode (Float)
+## WATCH_DEBOUNCE: Seconds inputs must stay unchanged before a rebuild, so a
+## save that writes several files triggers one build (Float)
 BASE_DIR = "./"
-MAX_PROCESSES = 16
-ENCODING = getpreferredencoding()
+HTML_DIR = "./html"
+OUTPUTS = [f"{HTML_DIR}/blog"]
+WATCH_INTERVAL = 0.1
+WATCH_DEBOUNCE = 0.05
+MAX_PROCESSES = cpu_count() or 1
+BLOG_POSTS = 32
+# The encoding open() uses by default, read off an open file rather than from
+# locale.getpreferredencoding(), since importing locale loads re.
+with open(devnull, "r") as fd: ENCODING = fd.encoding
 MONTHS = {"01":"January","02":"February","03":"March","04":"April","05":"May","06":"June","07":"July","08":"August","09":"September","10":"October","11":"November","12":"December"}
 
+# Method: BuildArchives
+# Purpose: Build a page of the post archive: every post not on the blog page,
+# newest first. Paginated archives number their pages from the oldest post,
+# so adding a post only changes the newest page, which doubles as
+# archives.html.
+# Parameters:
+# - page: Page number, or 0 to list every post in archives.html (Int)
+# - pages: Number of pages in the archive (Int)
+# - size: Posts per page (Int)
+# Return: True (Operation completes)
+def BuildArchives(page,pages,size):
+    from Catalog import Catalog # Post catalog
+
+    catalog = Catalog()
+    if (page == 0):
+        posts = catalog.posts(offset=BLOG_POSTS)
+    else:
+        count = max(0, catalog.count()-BLOG_POSTS)
+        posts = catalog.oldest(min(size, count-(page-1)*size), (page-1)*size)[::-1]
+    catalog.close()
+
+    # Write opening HTML tags, each post's excerpt, then links to the pages
+    # around this one and closing HTML tags.
+    html = [template[0].replace("{{META_DESC}}", f"{config['byline']}'s Post Archive").replace("{{TITLE}}", "Post Archive", 2).replace("{{BODYID}}", "postarchives", 1)]
+    for each in posts:
+        html.append(each["excerpt"].replace("</article>", f"<p><a class='read_more_link' href='/blog/{each['output']}'>Read more</a><span class='logo'>&#x24E9;</span></p>\n</article>"))
+    html.append(Pagination("archives", page, pages, "/blog.html")+template[1])
+    WritePage("archives", page, pages, "".join(html))
+    return True
+
 # Method: BuildByYear
 # Purpose: Facilitate multiprocessing of year indexes
 # Parameters:
 # - year: Year index to build (String)
-# - stats: Content file stats by year/month/day/time (Dict)
-# - files: Content file names by year/month/day/time (Dict)
+# - months: Month indexes to build, or None for all of them (Set)
 # Return: True (Operation completes), False (Operation fails)
-def BuildByYear(year,stats,files):
-    # For each year in which a post was made, generate a 'year' file, that
-    # contains links to each month in which a post was published.
+def BuildByYear(year,months):
+    from Catalog import Catalog # Post catalog
+    from Output import WriteIfChanged # Output files
 
-    # Clear the 'year' file
-    open("./html/blog/"+year+".html", "w", encoding=ENCODING).close()
-    year_fd = open("./html/blog/"+year+".html", "a", encoding=ENCODING)
-    # Write the opening HTML tags
-    year_fd.write(template[0].replace("{{META_DESC}}", f"{year} Post Archives", 1).replace("{{TITLE}}", f"{year} Post Archives", 2).replace("{{BODYID}}", "year_archive",1))
+    # For each year in which a post was made, generate a 'year' file, that
+    # contains links to each month in which a post was published. Look up the
+    # months and their posts in the catalog.
+    catalog = Catalog()
+    counts = catalog.months(year)
+    count = sum([x[1] for x in counts])
+
+    # Write the opening HTML tags to the 'year' file
+    year_fd = [template[0].replace("{{META_DESC}}", f"{year} Post Archives", 1).replace("{{TITLE}}", f"{year} Post Archives", 2).replace("{{BODYID}}", "year_archive",1)]
     # Display the months listed.
-    year_fd.write(f"<article>\n    <h2>\n        {year}. {stats[year]['count']} {'post' if stats[year]['count'] == 1 else 'posts'}.\n    </h2>\n</article>\n")
-    # Sort the sub-dictionaries by keys, months, then iterate over it. For each
-    # month in which a post was made, generate a 'month' file that contains all
-    # posts made during that month.
-    for month in sorted(files[year], reverse=True):
+    year_fd.append(f"<article>\n    <h2>\n        {year}. {count} {'post' if count == 1 else 'posts'}.\n    </h2>\n</article>\n")
+    # Iterate over the months, newest first. For each month in which a post
+    # was made, generate a 'month' file that contains all posts made during
+    # that month.
+    for month, count in counts:
         # Add a link to the month, to the year file it belongs to.
-        year_fd.write(f"<article>\n    <p>\n        <a href=\"{year}"+"-"+month+f".html\">{MONTHS[month]}</a> - {stats[year][month]['count']} {'post' if stats[year][month]['count'] == 1 else 'posts'}.\n    </p>\n</article>\n")
-        # Clear the 'month' file
-        open("./html/blog/"+year+"-"+month+".html", "w", encoding=ENCODING).close()
-        month_fd = open("./html/blog/"+year+"-"+month+".html", "a", encoding=ENCODING)
-        # Write the opening HTML tags
-        month_fd.write(template[0].replace("{{META_DESC}}", f"{year}/{month} Post Archives", 1).replace("{{TITLE}}", f"{MONTHS[month]}, {year} Post Archives", 2).replace("{{BODYID}}", "month_archive",1))
-        month_fd.write("<article>\n<p>\n    <h2>\n        "+MONTHS[month]+", <a href=\""+year+".html\">"+year+f"</a>. {stats[year][month]['count']} {'post' if stats[year][month]['count'] == 1 else 'posts'}.\n    </h2>\n</p>\n</article>\n")
-
-        # Sort the sub-dictionaries by keys, days, then iterate over it.
-        for day in sorted(files[year][month], reverse=True):
-            # Sort the sub-dictionaries by keys, timestamps, then iterate over it
-            for timestamp in sorted(files[year][month][day], reverse=True):
-                fd = open(BASE_DIR+"content/"+files[year][month][day][timestamp], "r", encoding=ENCODING)
-                article_title = fd.readlines()[1][7:]
-                fd.close()
-                # For each article made in the month, add an entry on the appropriate
-                # 'month' structure file.
-                month_fd.write(f"<article>\n    <p>{year}/{month}/{day} {timestamp}: <a href=\""+files[year][month][day][timestamp].lower().replace(" ", "-")[0:-3]+f"html\">{article_title.strip()}</a></p>\n</article>\n")
-
-        # Write closing HTML tags to the month file.
-        month_fd.write(template[1])
-        month_fd.close()
-
-    # Write closing HTML tags to the year file.
-    year_fd.write(template[1])
-    year_fd.close()
+        year_fd.append(f"<article>\n    <p>\n        <a href=\"{year}"+"-"+month+f".html\">{MONTHS[month]}</a> - {count} {'post' if count == 1 else 'posts'}.\n    </p>\n</article>\n")
+        # Skip month files that no changed post belongs to.
+        if (months is not None and month not in months): continue
+        # Write the opening HTML tags to the 'month' file
+        month_fd = [template[0].replace("{{META_DESC}}", f"{year}/{month} Post Archives", 1).replace("{{TITLE}}", f"{MONTHS[month]}, {year} Post Archives", 2).replace("{{BODYID}}", "month_archive",1)]
+        month_fd.append("<article>\n<p>\n    <h2>\n        "+MONTHS[month]+", <a href=\""+year+".html\">"+year+f"</a>. {count} {'post' if count == 1 else 'posts'}.\n    </h2>\n</p>\n</article>\n")
+
+        # For each article made in the month, newest first, add an entry on
+        # the appropriate 'month' structure file.
+        for each in catalog.month(year, month):
+            month_fd.append(f"<article>\n    <p>{year}/{month}/{each['datetime'][8:10]} {each['datetime'][11:19]}: <a href=\"{each['output']}\">{each['title']}</a></p>\n</article>\n")
+
+        # Write closing HTML tags to the month file, then save it.
+        month_fd.append(template[1])
+        WriteIfChanged(f"{output}/blog/"+year+"-"+month+".html", "".join(month_fd), ENCODING)
+
+    # Write closing HTML tags to the year file, then save it.
+    year_fd.append(template[1])
+    WriteIfChanged(f"{output}/blog/"+year+".html", "".join(year_fd), ENCODING)
 
     # Cleanup
-    del article_title, year_fd, month_fd
+    catalog.close()
+    del year_fd, catalog
+    return True
+
+# Method: BuildCategory
+# Purpose: Build a category page, listing its posts newest first, in a single
+# write. Paginated categories number their pages from the oldest post, and
+# the newest page doubles as the category's main page.
+# Parameters:
+# - category: Category page file name, like "life-notes.html" (String)
+# - page: Page number, or 0 to list every post on the main page (Int)
+# - pages: Number of pages in the category (Int)
+# - size: Posts per page (Int)
+# Return: True (Operation completes), False (Category has no posts)
+def BuildCategory(category,page,pages,size):
+    from Catalog import Catalog # Post catalog
+
+    catalog = Catalog()
+    if (page == 0):
+        posts = catalog.category(category)
+    else:
+        posts = catalog.oldest(size, (page-1)*size, category)[::-1]
+    catalog.close()
+    if (len(posts) == 0):
+        return False
+
+    # Write opening HTML tags, with the category's name, then an entry for
+    # each post, then links to the pages around this one and closing HTML
+    # tags.
+    name = category[:-5].replace('-', ' ').title()
+    html = [template[0].replace("{{META_DESC}}", f"{category[:-5]} Posts").replace("{{TITLE}}", f"{name} Posts", 2).replace("{{BODYID}}", category[:-5], 1)+"\n"+f"<article>\n    <h2>{name} Posts</h2>\n</article>\n"]
+    for each in posts:
+        # Conver to struct_time to include timestamp
+        mtime = strptime(each["datetime"], '%Y-%m-%d %H:%M:%S-0400')
+        html.append(f"<article>\n    <p><a href=\"/blog/{mtime.tm_year}.html\">{mtime.tm_year}</a>/<a href=\"/blog/{mtime.tm_year}-{mtime.tm_mon:02}.html\">{mtime.tm_mon:02}</a>/{mtime.tm_mday:02} {mtime.tm_hour:02}:{mtime.tm_min:02}:{mtime.tm_sec:02} EST: <a href=\"/blog/{each['output']}\">{each['title']}</a></p>\n</article>\n")
+    html.append(Pagination(category[:-5], page, pages, None)+template[1])
+    WritePage(category[:-5], page, pages, "".join(html))
     return True
 
 # Method: BuildFromTemplate
@@ -82,64 +160,137 @@ def BuildByYear(year,stats,files):
 # - title: Output page title. Optional (String)
 # Return: True (Operation completes), False (Operation fails)
 def BuildFromTemplate(content_file,title):
+    from Output import WriteIfChanged # Output files
+
     if (title == "Index"): title = "Home" # Fix title for home page
-    # Clear, then open output file
-    open(f"./html/{content_file}", "w", encoding=ENCODING).close()
-    o_fd = open(f"./html/{content_file}", "a", encoding=ENCODING)
     # Write opening HTML tags, after inserting page title and meta description.
-    o_fd.write(template[0].replace("{{TITLE}}", title, 2).replace("{{META_DESC}}", title, 1).replace("{{BODYID}}", title.lower(),1))
+    o_fd = [template[0].replace("{{TITLE}}", title, 2).replace("{{META_DESC}}", title, 1).replace("{{BODYID}}", title.lower(),1)]
 
     # Write content from source file to output file
     s_fd = open(f"./templates/{content_file}", encoding=ENCODING)
-    o_fd.write("<article>\n"+s_fd.read()+"\n</article>")
+    o_fd.append("<article>\n"+s_fd.read()+"\n</article>")
     s_fd.close()
 
-    # Write closing HTML tags
-    o_fd.write(template[1])
-    # Close file and return success
-    o_fd.close()
+    # Write closing HTML tags, then save the file and return success
+    o_fd.append(template[1])
+    WriteIfChanged(f"{output}/{content_file}", "".join(o_fd), ENCODING)
     return True
 
-# Method: GetContent
-# Purpose: Get title, link, mod time, structure file, and first paragraph of
-# original post or entire linkpost.
+# Method: DirtyPages
+# Purpose: Find the pages of a paginated listing, like the archive or a
+# category, that a set of changed posts appear on, before or after the
+# change. A post that appears, disappears, or moves shifts every post after
+# it, so every page from there on is dirty too, as are the newest pages when
+# the number of pages changes.
 # Parameters:
-# - content_file: Target content file (Character array)
-# Return: [title, link, mtime, structure_file, content] (List)
-def GetContent(*content_file):
-    content_file = "".join(content_file)
-    structure_file = content_file.lower().replace(' ', '-')[0:-3]+'html'
-    # Open structure file
-    fd = open(f"./html/blog/{structure_file}", "r", encoding=ENCODING)
-
-    # Skip to <article>
-    for i,line in enumerate(fd):
-        if ("<article" in line):
-            break
-
-    # Start recording content (content), and keep track of article type (t)
-    content = "<article>\n"
-    t = ""
-    # Retrieve title and first paragraph of original article, or entire linkpost
-    for i,line in enumerate(fd):
-        line = line.strip()
-        content += line+"\n"
-        if (i == 1):
-            title = line.split("\">")[1].replace("</a>", "")
-            link = line.split("href=\"")[1].split("\">")[0]
-            t = line.split("class=\"")[1].split("\" ")[0]
-        elif (i == 3):
-            mtime = line.split("datetime=\"")[1].split("\"",1)[0]
-            category = line.split(" in ")[1][9:].split("'")[0][1:]
-        elif (t == "original" and i == 4): 
-            content += "</article>\n"
-            break
-        else:
-            if (line == "</article>"): break
-    # Close, clean, and return
-    fd.close()
-    del fd, t
-    return [title,link,mtime,category,structure_file,content]
+# - before: Position of each changed post in the listing, counting from the
+#   oldest post, before this build, or None if it wasn't in it (List)
+# - after: Position of each changed post after this build (List)
+# - counts: Number of posts in the listing, [before, after] (List)
+# - size: Posts per page (Int)
+# Return: Page numbers, some of which may no longer exist (Set)
+def DirtyPages(before,after,counts,size):
+    pages = set()
+    shift = None
+    for old, new in zip(before, after):
+        for each in [old, new]:
+            if (each is not None):
+                pages.add(each//size+1)
+                if (old != new and (shift is None or each < shift)):
+                    shift = each
+    if (counts[0] != counts[1] and (shift is None or min(counts) < shift)):
+        shift = min(counts)
+    first, last = sorted([PageCount(counts[0], size), PageCount(counts[1], size)])
+    if (shift is not None):
+        pages.update(range(shift//size+1, last+1))
+    if (first != last):
+        pages.update(range(max(first, 1), last+1))
+    return pages
+
+# Method: Excerpt
+# Purpose: Cut the excerpt shown on the blog, archives, and feed out of a
+# post's rendered article: the first paragraph of an original article, or
+# the entire linkpost.
+# Parameters:
+# - article: Rendered article, from the title to the closing article tag (String)
+# - post_type: "original" or "linkpost" (String)
+# Return: Excerpt, wrapped in article tags (String)
+def Excerpt(article,post_type):
+    lines = [x.strip() for x in article.split("\n")]
+    if (post_type == "original"):
+        return "<article>\n"+"\n".join(lines[0:5])+"\n</article>\n"
+    return "<article>\n"+"\n".join(lines[0:lines.index("</article>", 4)+1])+"\n"
+
+# Method: FindDirty
+# Purpose: Find the aggregate pages a set of changed posts appear on, before
+# or after the change.
+# Parameters:
+# - changed: Names of new, edited, and deleted content files (Set)
+# - before: Catalog records of the changed posts before this build (Dict)
+# - after: Post records of the changed posts from this build (Dict)
+# - newest_before: Content files on the blog page before this build (List)
+# - newest_after: Content files on the blog page after this build (List)
+# - feed_before: Content files in the feeds before this build (List)
+# - feed_after: Content files in the feeds after this build (List)
+# Return: {"years": Set, "months": Set, "categories": Set, "blog": Boolean,
+# "archives": Boolean, "feed": Boolean} (Dict)
+def FindDirty(changed,before,after,newest_before,newest_after,feed_before,feed_after):
+    from Catalog import CategoryFile # Category page names
+
+    dirty = {"years":set(), "months":set(), "categories":set(), "blog":False, "archives":False, "feed":False}
+
+    # A post dirties its year, month, and category, both where it was and
+    # where it is now.
+    for file in changed:
+        for each in [before.get(file), after.get(file)]:
+            if (each is None): continue
+            dirty["years"].add(each["datetime"][0:4])
+            dirty["months"].add((each["datetime"][0:4], each["datetime"][5:7]))
+            dirty["categories"].add(CategoryFile(each["category"]))
+
+    # The blog page holds the newest posts, and the archives the rest. If a
+    # post moved across that boundary, both change. Otherwise only the one
+    # each changed post falls on does.
+    if (set(newest_before) != set(newest_after)):
+        dirty["blog"] = dirty["archives"] = True
+    else:
+        for file in changed:
+            if (file in newest_after): dirty["blog"] = True
+            else: dirty["archives"] = True
+
+    # The feeds hold the newest posts. They change if a changed post was in
+    # them, or is now.
+    feed = set(feed_before) | set(feed_after)
+    dirty["feed"] = any(file in feed for file in changed)
+    return dirty
+
+# Worker state: each thread that builds posts gets its own parser and render
+# cache connection (worker.md, worker.render_cache).
+worker = local()
+
+# Method: Initialize
+# Purpose: Set up a worker thread or process: load the template, config,
+# parser, and render cache every task it runs uses, once.
+# Parameters:
+# - page_template: Main template halves, after config replacements (List)
+# - site_config: Config.json keys and values (Dict)
+# - cache_scope: Scope of the render cache, from RenderCache (String)
+# - output_dir: Directory to write pages to: HTML_DIR, or a staging
+#   directory during a full rebuild (String)
+# Return: none
+def Initialize(page_template,site_config,cache_scope,output_dir):
+    from Markdown import Markdown # Markdown parser
+    from RenderCache import RenderCache # Paragraph-level render cache
+    from Output import Precompress, Minify # Gzipped copies, minified pages
+    from Minify import MinifyCache # Minified pages
+    global template, config, output
+    template = page_template
+    config = site_config
+    output = output_dir
+    Precompress(config["gzip"] == "yes")
+    Minify(MinifyCache(output) if config["minify"] == "yes" else None)
+    worker.md = Markdown(config["meta_baseurl"])
+    worker.render_cache = RenderCache(cache_scope)
 
 # Method: Migrate
 # Purpose: For files without the header information in their first five lines, generate
@@ -180,26 +331,78 @@ def Migrate(content_file):
     del fd, article_content, article_title, article_url
     utime(content_file, (mtime,mtime))
 
+# Method: PageCount
+# Purpose: Count the pages a paginated listing needs.
+# Parameters:
+# - count: Number of posts in the listing (Int)
+# - size: Posts per page (Int)
+# Return: Number of pages (Int)
+def PageCount(count,size):
+    return (count+size-1)//size
+
+# Method: Pagination
+# Purpose: Link a page of a paginated listing to the pages on either side.
+# Parameters:
+# - base: Listing name, like "archives" or "tech" (String)
+# - page: Page number, or 0 for an unpaginated listing (Int)
+# - pages: Number of pages in the listing (Int)
+# - newer: Link past the newest page, or None (String)
+# Return: Links, wrapped in article tags, or nothing (String)
+def Pagination(base,page,pages,newer):
+    if (page == 0):
+        return ""
+    links = []
+    if (page > 1):
+        links.append(f"<a href=\"/{base}/{page-1}.html\">Older posts</a>")
+    if (page < pages):
+        links.append(f"<a href=\"/{base}/{page+1}.html\">Newer posts</a>")
+    elif (newer is not None):
+        links.append(f"<a href=\"{newer}\">Newer posts</a>")
+    if (len(links) == 0):
+        return ""
+    return f"<article>\n    <p class='pagination'>{' | '.join(links)}</p>\n</article>\n"
+
+# Method: Positions
+# Purpose: Find where a set of posts fall in the paginated listings--the
+# archive, and each post's category--counting from the oldest post.
+# Parameters:
+# - catalog: Post catalog (Catalog)
+# - files: Content file names (Set)
+# Return: [{listing: {content file name: position}}, {listing: number of
+# posts}] (List), where listing is "archives" or a category page file name
+def Positions(catalog,files):
+    counts = catalog.counts()
+    counts["archives"] = max(0, catalog.count()-BLOG_POSTS)
+    positions = {"archives":{}}
+    for file in files:
+        record = catalog.get(file)
+        if (record is None): continue
+        rank = catalog.rank(file)
+        if (rank < counts["archives"]):
+            positions["archives"][file] = rank
+        positions.setdefault(record["category_file"], {})[file] = catalog.rank(file, record["category_file"])
+    return [positions, counts]
+
 # Method: TestAndBuild
-# Purpose: Test for existence and equivalence of content and structure files,
-# and (re)build the structure file if necessary.
+# Purpose: (Re)build the structure file for a content file that BuildState
+# found new or changed, and describe the post for the aggregate pages.
 # Parameters:
-# - content_file: Name of file to check (String)
-# - mtime: Modtime of file to check (Int)
-# Return: True (No change), False (File rebuilt)
+# - content_file: Name of file to build (String)
+# - mtime: Publication time of file to build (Int)
+# Return: [content digest, structure digest, series index files, record]
+# (List), where record is {"type", "title", "link", "pubdate", "category",
+# "author", "output", "excerpt", "datetime"} (Dict)
 def TestAndBuild(content_file,mtime):
-    md = Markdown(config["meta_baseurl"])
+    from BuildState import Digest # Change detection
+    from Output import WriteIfChanged # Output files
+
     # Transform content file name into structure file name
     structure_file = content_file.lower().replace(" ", "-")[0:-3]+"html"
 
-    # (Re)build structure files that either do not exist, or whose mod time does
-    # not match that of their corresponding content file
-    if ((isfile(f"./html/blog/{structure_file}")) and (mtime == stat(f"./html/blog/{structure_file}").st_mtime)): return True
-
-    # Open input (content_fd), then open and clear output (structure_fd) file.
+    # Open input (content_fd), and collect the output (structure_fd) to save
+    # in one write.
     content_fd = open(f"{BASE_DIR}content/{content_file}", "r", encoding=ENCODING)
-    open(f"./html/blog/{structure_file}", "w", encoding=ENCODING).close()
-    structure_fd = open(f"./html/blog/{structure_file}", "a", encoding=ENCODING)
+    structure_fd = []
 
     # Add header if necessary, with Revert()
     header = {}
@@ -222,59 +425,111 @@ def TestAndBuild(content_file,mtime):
 
     # Conver to struct_time to include timestamp
     mtime = localtime(mtime)
-
-    # Enumerate rest of each content file
-    for i,line in enumerate(content_fd):
-        if (i == 0): # First paragraph in file.
-            structure_fd.write(template[0].replace("{{META_DESC}}", line.strip().replace("\"", "&#8243;")).replace("{{TITLE}}", header["title"], 2))
-            if (header["type"] == "original"):
-                structure_fd.write(f"""<article>\n<h2 id='article_title'>\n<a class=\"original\" href=\"/blog/{structure_file}\">{header["title"]}</a>\n</h2>\n""")
-            else:
-                structure_fd.write("<article>\n<h2 id='article_title'>\n<a class=\"linkpost\" href=\""+header["link"]+"\">"+header["title"]+"</a>\n</h2>\n")
-            structure_fd.write(f"""<time id='article_time' datetime="{mtime.tm_year}-{mtime.tm_mon:02}-{mtime.tm_mday:02} {mtime.tm_hour:02}:{mtime.tm_min:02}:{mtime.tm_sec:02}-0400" pubdate="pubdate">By <link rel="author">{header["author"]}</link> on <a href="/blog/{mtime.tm_year}.html">{mtime.tm_year}</a>/<a href="/blog/{mtime.tm_year}-{mtime.tm_mon:02}.html">{mtime.tm_mon:02}</a>/{mtime.tm_mday:02} {mtime.tm_hour:02}:{mtime.tm_min:02}:{mtime.tm_sec:02} EST in <a href='/{header['category'].lower().replace(" ", "-")}.html'>{header['category']}</a></time>\n""")
-            structure_fd.write(md.html(line)+"\n")
-        else:
-            structure_fd.write(md.html(line)+"\n")
-    else:
-        structure_fd.write("\n"+md.html("{EOF}"))
-
-    # Write closing HTML tags and close files
-    structure_fd.write(f"\n</article>\n<p>\n<a href=\"/blog/{structure_file}\">Permalink.</a>\n</p>\n{template[1]}")
+    datetime = f"{mtime.tm_year}-{mtime.tm_mon:02}-{mtime.tm_mday:02} {mtime.tm_hour:02}:{mtime.tm_min:02}:{mtime.tm_sec:02}-0400"
+    post_type = "original" if header["type"] == "original" else "linkpost"
+    link = f"/blog/{structure_file}" if post_type == "original" else header["link"]
+
+    # The first paragraph in the file describes the page, and starts the
+    # article with its title (heading).
+    heading = ""
+    first = content_fd.readline()
+    if (first != ""):
+        heading = f"""<h2 id='article_title'>\n<a class=\"{post_type}\" href=\"{link}\">{header["title"]}</a>\n</h2>\n<time id='article_time' datetime="{datetime}" pubdate="pubdate">By <link rel="author">{header["author"]}</link> on <a href="/blog/{mtime.tm_year}.html">{mtime.tm_year}</a>/<a href="/blog/{mtime.tm_year}-{mtime.tm_mon:02}.html">{mtime.tm_mon:02}</a>/{mtime.tm_mday:02} {mtime.tm_hour:02}:{mtime.tm_min:02}:{mtime.tm_sec:02} EST in <a href='/{header['category'].lower().replace(" ", "-")}.html'>{header['category']}</a></time>\n"""
+        structure_fd.append(template[0].replace("{{META_DESC}}", first.strip().replace("\"", "&#8243;")).replace("{{TITLE}}", header["title"], 2)+"<article>\n"+heading)
+
+    # Stream the rest of the content file through the parser. Keep as much of
+    # the rendered Markdown (body) as the excerpt needs: all of a linkpost,
+    # or the first line of an original article, which ends the first chunk.
+    body = []
+    for chunk in worker.md.render(chain([first], content_fd) if first != "" else content_fd, cache=worker.render_cache):
+        structure_fd.append(chunk)
+        if (post_type == "linkpost" or len(body) == 0):
+            body.append(chunk)
+
+    # Write closing HTML tags, close the content file, and save the output
+    structure_fd.append(f"\n</article>\n<p>\n<a href=\"/blog/{structure_file}\">Permalink.</a>\n</p>\n{template[1]}")
     content_fd.close()
-    structure_fd.close()
+    WriteIfChanged(f"{output}/blog/{structure_file}", "".join(structure_fd), ENCODING)
 
     # Convert back to seconds since the epoch for setting mod time, then set
     mtime = mktime(mtime)
-    utime(f"./html/blog/{structure_file}", (mtime, mtime))
-
-    # Cleanup and return
-    del structure_file, content_fd, structure_fd, header
-    return False
-
-# If run as a standalone script, build the website
-if (__name__ == "__main__"):
-    ActivateInterface()
-
-    # Record start time
-    t1 = datetime.now()
-
-    # Check and, if necessary, mend directory structure. See README for info.
-    if (not isdir("./templates")):
-        mkdir("./templates")
-    if (not isdir("./html")):
-        mkdir("./html")
-    if (not isdir("./html/blog")):
-        mkdir("./html/blog")
-
-    # Check for key files, i.e. those listed above. Exit on fail.
-    for each in ["./Config.json", "./templates/main.html", "./html/assets/main.css"]:
-        if (not isfile(each)):
-            print(f"{c.FAIL}Error:{c.ENDC} {each} does not exist.")
-            exit(0)
-    # Check for additional key files listed above. Warn on fail.
-    for each in ["./html/assets/manifest.json", "./html/assets/images/favicon.ico"]:
-        if (not isfile(each)):
-            print(f"{c.WARNING}Warning:{c.ENDC} {each} does not exist.")
+    utime(f"{output}/blog/{structure_file}", (mtime, mtime))
+
+    # Describe the post for the aggregate pages, so they never have to read
+    # the structure file back.
+    body = "".join(body)
+    record = {"type":post_type, "title":header["title"], "link":link, "pubdate":header.get("pubdate", ""), "category":header["category"], "author":header["author"], "output":structure_file, "excerpt":Excerpt(heading+body+"\n</article>", post_type), "datetime":datetime}
+
+    # Cleanup and return digests of both files, for the build state, and the
+    # record. Hash the content file after the build, since Migrate() may have
+    # rewritten it.
+    del content_fd, structure_fd, header
+    return [Digest(f"{BASE_DIR}content/{content_file}"), Digest(f"{output}/blog/{structure_file}"), worker.md.includes(), record]
+
+# Method: BuildPost
+# Purpose: Run TestAndBuild for one post in a chunk of them, and say which
+# post the results belong to.
+# Parameters:
+# - content_file: Name of file to build (String)
+# - mtime: Publication time of file to build (Int)
+# Return: [content_file, mtime] plus TestAndBuild's results (List)
+def BuildPost(content_file,mtime):
+    return [content_file, mtime]+TestAndBuild(content_file, mtime)
+
+# Method: WritePage
+# Purpose: Write a page of a listing: the main page (name.html) for an
+# unpaginated listing, or a numbered page (name/page.html), which is also the
+# main page if it is the newest.
+# Parameters:
+# - name: Listing name, like "archives" or "tech" (String)
+# - page: Page number, or 0 for an unpaginated listing (Int)
+# - pages: Number of pages in the listing (Int)
+# - html: Page contents (String)
+# Return: none
+def WritePage(name,page,pages,html):
+    from Output import WriteIfChanged # Output files
+
+    paths = []
+    if (page != 0):
+        makedirs(f"{output}/{name}", exist_ok=True)
+        paths.append(f"{output}/{name}/{page}.html")
+    if (page == pages):
+        paths.append(f"{output}/{name}.html")
+    for path in paths:
+        WriteIfChanged(path, html, ENCODING)
+
+# Method: Build
+# Purpose: Build the website: render new and changed posts, then rebuild the
+# pages they appear on.
+# Parameters:
+# - snapshot: Stat data of every input, from Snapshot, taken before the
+#   build, to save as the manifest once it succeeds, with the stat data of
+#   the post pages it leaves behind (String)
+# - options: {"rebuild": Render into a staging directory and swap it in
+#   (Boolean), "deterministic": Pin down the build date and explore page
+#   (Boolean), "jobs": Worker limit (Int), "kinds": Backends, from ParseKinds
+#   (Dict)} (Dict)
+# - warm: Executor from the last build, and the arguments its workers were
+#   set up with, or None ([Executor, Tuple])
+# Return: [warm, for the next build, {"seen": Publication time of each post
+# (Dict), "rendered": Posts rendered (Int), "updated": Whether anything
+# changed (Boolean), "executors": Backend each stage ran on (Dict)}] (List)
+def Build(snapshot,options,warm=None):
+    from Markdown import Markdown # Markdown parser
+    from BuildState import BuildState # Change detection
+    from Catalog import Catalog # Post catalog
+    from RenderCache import RenderCache # Paragraph-level render cache
+    from random import Random # Explore page
+    from re import findall # Template dependencies
+    from hashlib import sha1 # Template and config dependencies
+    from sys import modules # Parser dependency
+    from os import walk, environ, rmdir # Static assets, build date, emptied listings
+    from Feed import WriteFeeds, FEED_ITEMS # RSS and Atom feeds
+    from Output import WriteIfChanged, Precompress, Minify, CompressAsset, RemoveOutput, COMPRESSIBLE # Output files
+    from Minify import MinifyCache, InlineCSS # Minified pages and stylesheets
+    from Stage import Prepare, Swap # Full rebuilds
+    from Assets import Fingerprints # Fingerprinted assets
+    global template, config, output
 
     # Load main template file
     # template[0]: Opening HTML tags up to opening article tag, inclusive.
@@ -282,6 +537,7 @@ if (__name__ == "__main__"):
     fd = open("./templates/main.html", "r", encoding=ENCODING)
     template = fd.read().split("<!-- DIVIDER -->")
     fd.close()
+    raw_template = list(template)
 
     # Read Config.json file into config dictionary
     config = {}
@@ -291,141 +547,431 @@ if (__name__ == "__main__"):
         config[each[0].replace("\"", "")] = each[1].rstrip(",").replace("\"", "")
     fd.close()
 
+    # Posts per page of the archive and category pages, or 0 to put each on
+    # one page
+    per_page = config.get("posts_per_page", "0")
+    if (not per_page.isdigit()):
+        raise ValueError("posts_per_page in Config.json must be a whole number")
+    per_page = int(per_page)
+
+    # Posts in the feeds, or "all" for every post
+    feed_items = config.get("feed_items", str(FEED_ITEMS))
+    if (feed_items != "all" and not feed_items.isdigit()):
+        raise ValueError("feed_items in Config.json must be a whole number, or \"all\"")
+    feed_items = -1 if feed_items == "all" else int(feed_items)
+
+    # Keep a gzipped copy of each text file, if told to
+    config.setdefault("gzip", "no")
+    if (config["gzip"] not in ["yes", "no"]):
+        raise ValueError("gzip in Config.json must be \"yes\" or \"no\"")
+    Precompress(config["gzip"] == "yes")
+
+    # Minify pages and the stylesheet, and inline the rules the top of each
+    # page needs, if told to
+    for key in ["minify", "inline_css"]:
+        config.setdefault(key, "no")
+        if (config[key] not in ["yes", "no"]):
+            raise ValueError(f"{key} in Config.json must be \"yes\" or \"no\"")
+
+    # In deterministic mode, date the build from SOURCE_DATE_EPOCH, if set,
+    # rather than the clock
+    epoch = environ.get("SOURCE_DATE_EPOCH", "")
+    if (options["deterministic"] and epoch != "" and not epoch.isdigit()):
+        raise ValueError("SOURCE_DATE_EPOCH must be a whole number of seconds")
+
     # Make replacements in template based on config file
     template[0] = template[0].replace("{{byline}}", config["byline"], 5).replace("{{meta_appname}}", config["meta_appname"], 1).replace("{{meta_keywords}}", config["meta_keywords"], 1).replace("{{meta_baseurl}}", config["meta_baseurl"], 1).replace("{{full_name}}", config["full_name"], 1)
     template[1] = template[1].replace("{{twitter_url}}", config["twitter_url"], 1).replace("{{insta_url}}", config["insta_url"], 1).replace("{{full_name}}", config["full_name"], 1)
 
-    # Build list of files (files), track stats (stats), and track success
-    # or failure of generator function (results)
-    files = {}
-    stats = {}
-    stats["total_count"] = 0
+    # Point each {{/assets/...}} placeholder at the asset's fingerprinted
+    # copy, or at the asset itself if it is missing
+    fingerprints = Fingerprints(f"{HTML_DIR}/assets", config["minify"] == "yes")
+    linked = {}
+    for name in sorted(set(findall("{{/assets/([^}]+)}}", "".join(raw_template)))):
+        linked[name] = fingerprints.get(name) or name
+        template = [x.replace("{{/assets/"+name+"}}", "/assets/"+linked[name]) for x in template]
+    if (config["inline_css"] == "yes"):
+        template[0] = InlineCSS(template[0], HTML_DIR)
+
+    # Track success or failure of generator function (results)
     results = []
 
-    # Instantiate the multiprocessing orchestrator to use at most MAX_PROCESSES
-    pool = Pool(processes=MAX_PROCESSES)
+    # Load the build state, which records each content file's size, mtime, and
+    # digest from the last build. Track the files rebuilt this time (rebuilt),
+    # and every post's publication time (seen).
+    state = BuildState()
+    rebuilt = []
+    seen = {}
+
+    # Digest each global input, so the build state can find the outputs built
+    # from an older version of it. Each half of the main template, and each
+    # config key, is its own input.
+    inputs = {}
+    inputs["templates/main.html:head"] = sha1(raw_template[0].encode(ENCODING)).hexdigest()
+    inputs["templates/main.html:foot"] = sha1(raw_template[1].encode(ENCODING)).hexdigest()
+    for key in config:
+        inputs[f"Config.json:{key}"] = sha1(config[key].encode(ENCODING)).hexdigest()
+    inputs["Markdown.py"] = state.digest(modules[Markdown.__module__].__file__)
+    if (isdir("./Content/System")):
+        for file in listdir("./Content/System"):
+            inputs[f"Content/System/{file}"] = state.digest(f"./Content/System/{file}")
+    for file in listdir("./templates/"):
+        if (file != "main.html"):
+            inputs[f"templates/{file}"] = state.digest(f"./templates/{file}")
+    for name in linked:
+        inputs[f"Assets:{name}"] = linked[name]
+    state.inputs(inputs)
+
+    # Blocks of rendered Markdown stay reusable until the parser or the base
+    # URL changes. Each process opens the cache when it first renders a post.
+    cache_scope = inputs["Markdown.py"]+config["meta_baseurl"]
+    render_cache = RenderCache(cache_scope)
+
+    # Record which inputs each kind of output depends on: every page uses both
+    # halves of the main template, the config keys and assets they reference,
+    # whether it gets a gzipped copy, and whether it is minified; posts also
+    # use the parser and the base URL; aggregate pages and the feed use the
+    # byline and base URL.
+    page_deps = ["templates/main.html:head", "templates/main.html:foot", "Config.json:gzip", "Config.json:minify", "Config.json:inline_css"]+[f"Config.json:{key}" for key in set(findall("{{(\\w+)}}", "".join(raw_template))) if key in config]+[f"Assets:{x}" for x in linked]
+    post_deps = page_deps+["Markdown.py", "Config.json:meta_baseurl"]
+    aggregate_deps = page_deps+["Config.json:byline", "Config.json:meta_baseurl", "Config.json:posts_per_page", "Config.json:feed_items"]
+
+    # Write pages to the live output directory, or, for a full rebuild, to a
+    # staging directory beside it, which replaces it once the build finishes.
+    output = Prepare(HTML_DIR) if options["rebuild"] else HTML_DIR
+    minify_cache = MinifyCache(output) if config["minify"] == "yes" else None
+    Minify(minify_cache)
+
+    # Instantiate the executor, which runs each stage serially, or on at most
+    # jobs threads or processes, each set up once by Initialize. Reuse the
+    # last build's, unless its workers were set up with something else.
+    initargs = (template, config, cache_scope, output)
+    if (warm is not None and warm[1] != initargs):
+        warm[0].close()
+        warm = None
+    if (warm is None):
+        warm = [Executor(options["jobs"], Initialize, initargs, options["kinds"]), initargs]
+    executor = warm[0]
     
     # Enumerate the "content" directory
     for file in listdir(BASE_DIR+"content"):
         if (file[-4:] != ".txt"): continue # Exclude non-text files
-        stats["total_count"] += 1 # Increment total count
-        
-        # Get mod time, then test for existence and equivalence of structure
-        # file with TestAndBuild. Multiprocessed.
-        mtime = stat(f"{BASE_DIR}content/{file}").st_mtime
-        results.append(pool.apply_async(TestAndBuild,(file,mtime)))
-
-        # Convert mtime to YYYY/MM/DD/HH:MM:SS format for dictionary indexing 
-        mtime = strftime("%Y/%m/%d/%H:%M:%S", localtime(mtime)).split("/")
-
-        # Build files dictionary {year: {month: {day: {time ...} ...} ...} ...}
-        if (mtime[0] not in files):
-            stats[mtime[0]] = {"count":0}
-            files[mtime[0]] = {}
-        if (mtime[1] not in files[mtime[0]]):
-            stats[mtime[0]][mtime[1]] = {"count":0}
-            files[mtime[0]][mtime[1]] = {}
-        if (mtime[2] not in files[mtime[0]][mtime[1]]):
-            stats[mtime[0]][mtime[1]][mtime[2]] = {"count":0}
-            files[mtime[0]][mtime[1]][mtime[2]] = {}
-        if (mtime[3] not in files[mtime[0]][mtime[1]][mtime[2]]):
-            files[mtime[0]][mtime[1]][mtime[2]][mtime[3]] = {}
-        stats[mtime[0]]["count"] += 1 # Add one to year count
-        stats[mtime[0]][mtime[1]]["count"] += 1 # Add one to month count
-        stats[mtime[0]][mtime[1]][mtime[2]]["count"] += 1 # Add one to day count
-        files[mtime[0]][mtime[1]][mtime[2]][mtime[3]] = file
+
+        # Compare the file's stat data, and its digest if that differs, to the
+        # build state, and check that its page wasn't deleted or edited. Queue
+        # new and changed files for TestAndBuild.
+        mtime, changed = state.check(file, f"{BASE_DIR}content/{file}", stat(f"{BASE_DIR}content/{file}"), output)
+        seen[file] = mtime
+        if (changed):
+            rebuilt.append([file, mtime])
     
-    # Wait for all article pages to build before proceeding
-    [x.wait() for x in results]
-
-    # Don't rebuild if nothing has changed
-    if (not all([x.get() for x in results])):
-        # Build index, projects, and disclaimers pages based on template files
-        for file in listdir("./templates/"):
-            if (file != "main.html"): # Exclude main template file
-                results.append(pool.apply_async(BuildFromTemplate,(file,file.split(".")[0].title())))
-
-        # Build all year and month indexes
-        for year in files:
-            results.append(pool.apply_async(BuildByYear,(year,stats,files)))
-
-        # Build blog and archives pages, and RSS feed
-        paragraphs = []
-        for year in sorted(files, reverse=True):
-            for month in sorted(files[year], reverse=True):
-                for day in sorted(files[year][month], reverse=True):
-                    for time in sorted(files[year][month][day], reverse=True):
-                        paragraphs.append(pool.apply_async(GetContent, args=(files[year][month][day][time])))
-
-        # Clear blog, archives, and feed files, then write opening tags
-        open("./html/blog.html", "w", encoding=ENCODING).close()
-        blog_fd = open("./html/blog.html", "a", encoding=ENCODING)
-        blog_fd.write(template[0].replace("{{META_DESC}}", f"{config['byline']}'s Blog").replace("{{TITLE}}", "Blog", 2).replace("{{BODYID}}", "blog", 1))
-        open("./html/archives.html", "w", encoding=ENCODING).close()
-        archives_fd = open("./html/archives.html", "a", encoding=ENCODING)
-        archives_fd.write(template[0].replace("{{META_DESC}}", f"{config['byline']}'s Post Archive").replace("{{TITLE}}", "Post Archive", 2).replace("{{BODYID}}", "postarchives", 1))
-        # Clear and initialize the RSS feed
-        open("./html/rss.xml", "w", encoding=ENCODING).close()
-        feed_fd = open("./html/rss.xml", "a", encoding=ENCODING)
-        feed_fd.write(f"""<?xml version='1.0' encoding='ISO-8859-1' ?>\n<rss version="2.0" xmlns:sy="http://purl.org/rss/1.0/modules/syndication/" xmlns:atom="http://www.w3.org/2005/Atom">\n<channel>\n    <title>{config['byline']}</title>\n    <link>{config['meta_baseurl']}</link>\n    <description>RSS feed for {config['byline']}'s website, found at {config['meta_baseurl']}/</description>\n    <language>en-us</language>\n    <copyright>Copyright 2012-2020, {config['byline']}. All rights reserved.</copyright>\n    <atom:link href="{config['meta_baseurl']}rss.xml" rel="self" type="application/rss+xml" />\n    <lastBuildDate>{datetime.utcnow().strftime("%a, %d %b %Y %I:%M:%S")} GMT</lastBuildDate>\n    <ttl>5</ttl>\n    <generator>First Crack</generator>\n""")
-        
-        # Ensure conditions are set to build blog and archives pages, and feed
-        [x.wait() for x in paragraphs]
-
-        # Add the first 32 posts to the home page, and the rest to the archive.
-        # Create individual category pages based on the posts' contents.
-        closeout = []
-        for i,each in enumerate(paragraphs):
-            each = each.get()
-            # Conver to struct_time to include timestamp
-            mtime = strptime(each[2], '%Y-%m-%d %H:%M:%S-0400')
-
-            if (f"./html/{each[3]}" not in closeout):
-                closeout.append(f"./html/{each[3]}")
-                fd = open(f"./html/{each[3]}", "w", encoding=ENCODING)
-                fd.write(template[0].replace("{{META_DESC}}", f"{each[3][:-5]} Posts").replace("{{TITLE}}", f"{each[3][:-5].replace('-', ' ').title()} Posts", 2).replace("{{BODYID}}", each[3][:-5], 1)+"\n"+f"<article>\n    <h2>{each[3][:-5].replace('-', ' ').title()} Posts</h2>\n</article>\n")
-                fd.close()
-            else:
-                fd = open(f"./html/{each[3]}", "a", encoding=ENCODING)
-                fd.write(f"<article>\n    <p><a href=\"/blog/{mtime.tm_year}.html\">{mtime.tm_year}</a>/<a href=\"/blog/{mtime.tm_year}-{mtime.tm_mon:02}.html\">{mtime.tm_mon:02}</a>/{mtime.tm_mday:02} {mtime.tm_hour:02}:{mtime.tm_min:02}:{mtime.tm_sec:02} EST: <a href=\"/blog/{each[4]}\">{each[0]}</a></p>\n</article>\n")
-                fd.close()
-
-            if (i < 32):
-                blog_fd.write(each[-1].replace("</article>", f"<p><a class='read_more_link' href='/blog/{each[4]}'>Read more</a><span class='logo'>&#x24E9;</span></p>\n</article>"))
-            else:
-                archives_fd.write(each[-1].replace("</article>", f"<p><a class='read_more_link' href='/blog/{each[4]}'>Read more</a><span class='logo'>&#x24E9;</span></p>\n</article>"))
-            
-            each = [x.replace("&", "&amp;") for x in each]
-            # Add all posts to the feed
-            feed_fd.write(f"{' '*8}<item>\n{' '*12}<title>{each[0]}</title>\n{' '*12}<link>{each[1] if each[1][0] != '/' else config['meta_baseurl']+each[1][1:]}</link>\n{' '*12}<guid isPermaLink='true'>{each[1] if each[1][0] != '/' else config['meta_baseurl']+each[1][1:]}</guid>\n{' '*12}<pubDate>{strftime('%a, %d %b %Y %H:%M:%S',gmtime(mktime(mtime)))} GMT</pubDate>\n{' '*12}<description>\n")
-            if ("<html>" in each[-1]): feed_fd.write(f"{' '*16}&lt;p&gt;This post must be viewed online.&lt;/p&gt;\n")
-            else: feed_fd.write(f"{' '*16}"+'\n'.join(each[-1].split('\n')[5:-2]).replace('href=\"/','href=\"'+config["meta_baseurl"]).replace('src=\'/','src=\''+config["meta_baseurl"]).replace('<', '&lt;').replace('>', '&gt;')+f"\n{' '*16}<p><a href=\"{config['meta_baseurl']}blog/{each[3]}\">Permalink.</a></p>\n".replace('<', '&lt;').replace('>', '&gt;'))
-            feed_fd.write(f"{' '*12}</description>\n{' '*8}</item>\n")
-
-        # Write closing HTML/XML and close the files
-        for each in closeout:
-            fd = open(each, "a", encoding=ENCODING)
-            fd.write(template[1])
-            fd.close()
-        blog_fd.write(template[1])
-        blog_fd.close()
-        archives_fd.write(template[1])
-        archives_fd.close()
-        feed_fd.write("""\n</channel>\n</rss>""")
-        feed_fd.close()
-
-        # Finally, build Explore page
-        fd = open("./html/explore.html", "w", encoding=ENCODING).close()
-        fd = open("./html/explore.html", "a", encoding=ENCODING)
-        fd.write(template[0].replace("{{META_DESC}}", f"{config['byline']}'s Explore Page").replace("{{TITLE}}", "Explore", 2).replace("{{BODYID}}","explore",1))
-        for each in choices(paragraphs, k=3):
-            each = each.get()
-            fd.write(each[-1])
-        fd.write(template[1])
-        fd.close()
+    # Forget files that were deleted since the last build. Don't rebuild the
+    # aggregate pages if nothing has changed.
+    removed = state.prune(seen)
+    aggregates = state.stale("aggregates", aggregate_deps)
+    update = (len(rebuilt) != 0 or len(removed) != 0 or aggregates)
+
+    # Open the catalog of posts from the last build. Render posts missing from
+    # it, too, since the aggregate pages need every post's record. Note where
+    # the changed posts were, and which posts were on the blog page, before
+    # updating it.
+    if (update):
+        catalog = Catalog()
+        known = catalog.files()
+        rendering = set([x[0] for x in rebuilt])
+        for file in seen:
+            if (file not in known and file not in rendering):
+                rebuilt.append([file, seen[file]])
+        changed = set([x[0] for x in rebuilt]+removed)
+        before = {}
+        for file in changed:
+            if (file in known):
+                before[file] = catalog.get(file)
+        newest_before = [x["content"] for x in catalog.posts(BLOG_POSTS)]
+        feed_before = catalog.newest(feed_items)
+        if (per_page != 0):
+            positions_before, counts_before = Positions(catalog, changed)
+        for file in removed:
+            catalog.remove(file)
+
+    # Build the queued article pages, a chunk of posts per task, so a build
+    # with thousands of small posts doesn't pay for a round trip to a worker
+    # for each one. Record each post in the build state and the catalog as it
+    # finishes, and wait for all of them before proceeding.
+    after = {}
+    for file, mtime, digest, structure, includes, record in executor.run("posts", BuildPost, rebuilt):
+        state.record(file, stat(f"{BASE_DIR}content/{file}"), digest, structure, mtime, post_deps+[f"Content/System/{x}" for x in includes], f"blog/{record['output']}", output)
+        catalog.update(file, record, mtime)
+        after[file] = record
+    if (update):
+        catalog.commit()
+
+        # Delete the pages of deleted posts, and the old page of a post whose
+        # link changed, unless another post writes to it now.
+        written = set(x["output"] for x in after.values())
+        for record in before.values():
+            if (record["output"] not in written):
+                RemoveOutput(f"{output}/blog/{record['output']}")
+
+    # Build index, projects, and disclaimers pages based on template files, if
+    # they or the main template changed.
+    pages = []
+    for file in listdir("./templates/"):
+        if (file != "main.html" and state.stale(file, page_deps+[f"templates/{file}"])): # Exclude main template file
+            pages.append([file, file.split(".")[0].title()])
+            state.built(file, page_deps+[f"templates/{file}"])
+    results.append(executor.run("pages", BuildFromTemplate, pages))
+
+    # Bring the gzipped copies of the stylesheet and other text assets in
+    # step with them.
+    assets = []
+    for root, dirs, files in walk(f"{output}/assets"):
+        assets.extend([join(root, x)] for x in files if x.endswith(COMPRESSIBLE))
+    results.append(executor.run("assets", CompressAsset, assets))
+
+    # Rebuild the aggregate pages the changed posts appear on
+    if (update):
+        # Find the year, month, and category pages the changed posts appear
+        # on, and whether the blog, archives, and feed include them. If a
+        # global input changed, every aggregate page is dirty.
+        newest = catalog.posts(BLOG_POSTS)
+        dirty = FindDirty(changed, before, after, newest_before, [x["content"] for x in newest], feed_before, catalog.newest(feed_items))
+
+        # Note the years, months, and categories the changed posts were in
+        # that have no posts left, to delete their pages.
+        indexes = {year:set(x[0] for x in catalog.months(year)) for year, _ in catalog.years()}
+        kept = set(catalog.category_files())
+        emptied = [f"blog/{x}.html" for x in sorted(dirty["years"]) if x not in indexes]
+        emptied += [f"blog/{x}-{y}.html" for x, y in sorted(dirty["months"]) if y not in indexes.get(x, set())]
+        emptied += [x for x in sorted(dirty["categories"]) if x not in kept]
+        if (aggregates):
+            dirty = {"years":None, "months":None, "categories":None, "blog":True, "archives":True, "feed":True}
+
+        # Find the archive and category pages the changed posts appear on,
+        # if they are paginated: each listing's newest page or two, unless a
+        # post moved within it.
+        if (per_page != 0):
+            positions_after, counts_after = Positions(catalog, changed)
+            dirty["pages"] = {}
+            for listing in set(counts_before) | set(counts_after):
+                count = [counts_before.get(listing, 0), counts_after.get(listing, 0)]
+                if (aggregates):
+                    # Include pages left over from a different page size.
+                    name = "archives" if listing == "archives" else listing[:-5]
+                    dirty["pages"][listing] = set(range(1, PageCount(count[1], per_page)+1))
+                    if (isdir(f"{output}/{name}")):
+                        dirty["pages"][listing].update(int(x[:-5]) for x in listdir(f"{output}/{name}") if x[:-5].isdigit())
+                else:
+                    files = set(positions_before.get(listing, {})) | set(positions_after.get(listing, {}))
+                    dirty["pages"][listing] = DirtyPages([positions_before.get(listing, {}).get(x) for x in files], [positions_after.get(listing, {}).get(x) for x in files], count, per_page)
+
+        # Build the dirty year and month indexes
+        years = []
+        for year, count in catalog.years():
+            if (dirty["years"] is None or year in dirty["years"]):
+                years.append([year, None if dirty["months"] is None else set(x[1] for x in dirty["months"] if x[0] == year)])
+        results.append(executor.run("years", BuildByYear, years))
+
+        # Add the first 32 posts to the blog page, and the rest to the archive.
+        # If the archive is paginated, link to it from the blog page.
+        if (dirty["blog"]):
+            blog_fd = [template[0].replace("{{META_DESC}}", f"{config['byline']}'s Blog").replace("{{TITLE}}", "Blog", 2).replace("{{BODYID}}", "blog", 1)]
+            for each in newest:
+                blog_fd.append(each["excerpt"].replace("</article>", f"<p><a class='read_more_link' href='/blog/{each['output']}'>Read more</a><span class='logo'>&#x24E9;</span></p>\n</article>"))
+            if (per_page != 0 and counts_after["archives"] != 0):
+                blog_fd.append("<article>\n    <p class='pagination'><a href=\"/archives.html\">Older posts</a></p>\n</article>\n")
+            blog_fd.append(template[1])
+            WriteIfChanged(f"{output}/blog.html", "".join(blog_fd), ENCODING)
+
+        # Build the dirty archive and category pages, each in one pass over
+        # its posts. Delete pages left over from a longer listing.
+        archives = []
+        categories = []
+        if (per_page == 0):
+            if (dirty["archives"]):
+                archives.append([0, 0, 0])
+            for each in (catalog.category_files() if dirty["categories"] is None else sorted(dirty["categories"])):
+                categories.append([each, 0, 0, 0])
+        else:
+            for listing in sorted(dirty["pages"]):
+                name = "archives" if listing == "archives" else listing[:-5]
+                total = PageCount(counts_after.get(listing, 0), per_page)
+                for page in sorted(dirty["pages"][listing]):
+                    if (page > total):
+                        RemoveOutput(f"{output}/{name}/{page}.html")
+                    elif (listing == "archives"):
+                        archives.append([page, total, per_page])
+                    else:
+                        categories.append([listing, page, total, per_page])
+                if (listing == "archives" and total == 0 and (len(dirty["pages"][listing]) != 0 or aggregates)):
+                    archives.append([0, 0, per_page])
+        results.append(executor.run("archives", BuildArchives, archives))
+        results.append(executor.run("categories", BuildCategory, categories))
+
+        # Delete the pages of the years, months, and categories left with no
+        # posts, and the directory of an emptied paginated category.
+        for each in emptied:
+            RemoveOutput(f"{output}/{each}")
+            if (isdir(f"{output}/{each[:-5]}") and len(listdir(f"{output}/{each[:-5]}")) == 0):
+                rmdir(f"{output}/{each[:-5]}")
+
+        # Write the RSS and Atom feeds. In deterministic mode, date them from
+        # SOURCE_DATE_EPOCH or the newest post, so they only change when a
+        # post does.
+        if (dirty["feed"]):
+            if (not options["deterministic"]): built = time()
+            elif (epoch != ""): built = int(epoch)
+            else: built = max(seen.values(), default=0)
+            WriteFeeds(catalog, config, feed_items, built, f"{output}/rss.xml", f"{output}/atom.xml")
+
+        # Finally, build Explore page. In deterministic mode, pick its posts
+        # with a generator seeded from the list of posts, so it only changes
+        # when they do. A site with no posts gets an empty Explore page.
+        picker = Random(sha1("\n".join(sorted(seen)).encode("utf-8", "surrogateescape")).digest()) if options["deterministic"] else Random()
+        fd = [template[0].replace("{{META_DESC}}", f"{config['byline']}'s Explore Page").replace("{{TITLE}}", "Explore", 2).replace("{{BODYID}}","explore",1)]
+        for each in (picker.choices(sorted(seen), k=3) if len(seen) != 0 else []):
+            fd.append(catalog.get(each)["excerpt"])
+        fd.append(template[1])
+        WriteIfChanged(f"{output}/explore.html", "".join(fd), ENCODING)
+        catalog.close()
 
         # Ensure year and month indexes finished building before finishing.
-        [x.wait() for x in results]
+        [list(x) for x in results]
+        state.built("aggregates", aggregate_deps)
+
+    # Wait for template pages, then write the asset manifest, delete copies of
+    # assets no page links to anymore, save the build state and the manifest,
+    # with the post pages as this build left them, and close the minify cache
+    # and trim the render cache.
+    [list(x) for x in results]
+    fingerprints.save(f"{output}/assets")
+    if (options["rebuild"]):
+        Swap(HTML_DIR)
+    state.save()
+    SaveManifest(snapshot+"\n"+Snapshot(OUTPUTS))
+    if (minify_cache is not None):
+        minify_cache.close()
+    if (len(rebuilt) != 0):
+        render_cache.evict()
+        render_cache.close()
+    return [warm, {"seen":seen, "rendered":len(rebuilt), "updated":update, "executors":executor.used()}]
+
+# Method: Watch
+# Purpose: Serve the site for preview, and rebuild it whenever its inputs
+# change, keeping the workers and the main template and config they were set
+# up with from one build to the next.
+# Parameters:
+# - paths: Files and directories the build reads, for Snapshot (List)
+# - options: Build options, as for Build (Dict)
+# - public: Serve to the whole network, rather than localhost (Boolean)
+# - server: Preview server engine, from Server.ENGINES (String)
+# Return: none
+def Watch(paths,options,public,server):
+    from threading import Thread # Web server
+    from time import sleep # Polling
+    from webbrowser import open_new_tab # Preview
+    from Server import PreviewServer # Web server
+
+    httpd = PreviewServer(public, server)
+    Thread(target=httpd.serve_forever, daemon=True).start()
+    warm = None
+    last = None
+    try:
+        while (True):
+            # Compare the stat data of every input to the last build's. Wait
+            # for a change to settle before building.
+            snapshot = Snapshot(paths)
+            if (snapshot == last):
+                sleep(WATCH_INTERVAL)
+                continue
+            sleep(WATCH_DEBOUNCE)
+            if (Snapshot(paths) != snapshot):
+                continue
+
+            # Rebuild what changed. Report a broken input and keep watching,
+            # so fixing it triggers the next build.
+            t1 = datetime.now()
+            try:
+                warm, stats = Build(snapshot, options, warm)
+                print(f"Rebuilt in {c.BOLD}{(datetime.now()-t1).total_seconds()}s{c.ENDC}: {stats['rendered']} {'post' if stats['rendered'] == 1 else 'posts'} rendered.")
+            except Exception as e:
+                print(f"{c.FAIL}Error:{c.ENDC} {e}.")
+            if (last is None):
+                print(f"Watching for changes. Use {c.BOLD}CTRL-C{c.ENDC} to exit.")
+                open_new_tab("http://localhost:8000")
+            last = snapshot
+            options["rebuild"] = False
+    except KeyboardInterrupt:
+        print(f"\r{c.OKGREEN}Exiting.{c.ENDC}")
+    finally:
+        httpd.shutdown()
+        if (warm is not None):
+            warm[0].close()
+
+# If run as a standalone script, build the website
+if (__name__ == "__main__"):
+    jobs = GetOption("--jobs", MAX_PROCESSES)
+    try:
+        kinds = ParseKinds(GetOption("--executor", "auto"))
+    except ValueError as e:
+        print(f"{c.FAIL}Error:{c.ENDC} {e}.")
+        exit(0)
+    server = GetOption("--server", "thread")
+    if (server not in ["thread", "async"]):
+        print(f"{c.FAIL}Error:{c.ENDC} Unknown server engine: {server}.")
+        exit(0)
+    deterministic = GetFlag("--deterministic")
+    watch = GetFlag("--watch")
+    public = watch and GetFlag("-P")
+    if (watch): GetFlag("-p")
+    rebuild = ActivateInterface(server)
+
+    # Record start time
+    t1 = datetime.now()
+
+    # Check and, if necessary, mend directory structure. See README for info.
+    if (not isdir("./templates")):
+        mkdir("./templates")
+    if (not isdir(HTML_DIR)):
+        mkdir(HTML_DIR)
+    if (not isdir(f"{HTML_DIR}/blog")):
+        mkdir(f"{HTML_DIR}/blog")
+
+    # Check for key files, i.e. those listed above. Exit on fail.
+    for each in ["./Config.json", "./templates/main.html", "./html/assets/main.css"]:
+        if (not isfile(each)):
+            print(f"{c.FAIL}Error:{c.ENDC} {each} does not exist.")
+            exit(0)
+    # Check for additional key files listed above. Warn on fail.
+    for each in ["./html/assets/manifest.json", "./html/assets/images/favicon.ico"]:
+        if (not isfile(each)):
+            print(f"{c.WARNING}Warning:{c.ENDC} {each} does not exist.")
+
+    # Take stock of every file the build reads: content files, templates,
+    # series indexes, the config file, and First Crack's own scripts. If none
+    # changed since the last build, the post pages are as it left them, and
+    # no parameters call for more, stop here, before loading anything else.
+    code = dirname(abspath(__file__))
+    paths = [BASE_DIR+"content", "./templates", "./Content/System", "./Config.json", f"{HTML_DIR}/assets"]+[join(code, x) for x in listdir(code) if x[-3:] == ".py"]
+    snapshot = Snapshot(paths)
+    if (not watch and len(argv) == 1 and Unchanged(snapshot+"\n"+Snapshot(OUTPUTS))):
+        print(f"Execution time: {c.BOLD}{(datetime.now()-t1).total_seconds()}s{c.ENDC}")
+        exit(0)
+
+    # In watch mode, build now and again after every change, until the user
+    # issues an interrupt.
+    options = {"rebuild":rebuild, "deterministic":deterministic, "jobs":jobs, "kinds":kinds}
+    if (watch):
+        Watch(paths, options, public, server)
+        exit(0)
+
+    # Something changed. Build the website.
+    try:
+        warm, stats = Build(snapshot, options)
+    except ValueError as e:
+        print(f"{c.FAIL}Error:{c.ENDC} {e}.")
+        exit(0)
+    warm[0].close()
 
     # Record end time
     t2 = datetime.now()
@@ -433,9 +979,19 @@ if (__name__ == "__main__"):
     # Output execution time, and if run with verbose flag "-v", output stats
     print(f"Execution time: {c.BOLD}{(t2-t1).total_seconds()}s{c.ENDC}")
     if ("-v" in argv):
-        print(f"-- Years: {len(stats.keys())-1}")
-        print(f"-- Months: {sum([len(files[x]) for x in files])}")
-        print(f"-- Days: {sum([sum(z) for z in [[len(files[x][y]) for y in files[x]] for x in files]])}")
-        print(f"-- Posts: {stats['total_count']}")
-        if (all([x.get() for x in results])): print(f"{c.OKGREEN}No update necessary.{c.ENDC}")
+        from Catalog import Catalog # Post counts
+
+        # Count the years and months with posts in the catalog, and the days
+        # from each post's publication time.
+        catalog = Catalog()
+        years = catalog.years()
+        months = [[year, month] for year, _ in years for month, _ in catalog.months(year)]
+        print(f"-- Years: {len(years)}")
+        print(f"-- Months: {len(months)}")
+        print(f"-- Days: {len(set(localtime(x)[:3] for x in stats['seen'].values()))}")
+        print(f"-- Posts: {catalog.count()}")
+        catalog.close()
+        print(f"-- Rendered: {stats['rendered']}")
+        print(f"-- Executors: {', '.join(f'{x}={y}' for x,y in stats['executors'].items())}")
+        if (not stats["updated"]): print(f"{c.OKGREEN}No update necessary.{c.ENDC}")
         else: print(f"{c.WARNING}Site updated and rebuilt.{c.ENDC}")
\ No newline at end of file
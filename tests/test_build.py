@@ -0,0 +1,392 @@
+# Purpose: Build small sites from scratch in temporary directories, and check
+# the pages First Crack writes for them. Each build runs blog.py in its own
+# process, the way `make` does.
+
+# Import methods
+from unittest import TestCase, main # Test cases
+from tempfile import mkdtemp # Site directories
+from shutil import rmtree, copytree, copy # Site directories
+from subprocess import run # Builds
+from sys import executable # Builds
+from time import mktime, strptime # Publication dates
+from os import makedirs, remove, listdir, walk, utime, stat # Site directories, content files
+from os.path import dirname, abspath, join, isfile, isdir, relpath # Site directories
+
+# Constants
+## ROOT: First Crack's directory (String)
+## CONFIG: Config.json for the test sites (String)
+ROOT = dirname(dirname(abspath(__file__)))
+CONFIG = """{
+    "meta_baseurl" : "https://example.com/",
+    "byline" : "Tester",
+    "full_name" : "Test Author",
+    "meta_keywords" : "test",
+    "meta_appname" : "Test",
+    "twitter_url" : "https://twitter.com/",
+    "insta_url" : "https://instagram.com/"
+}
+"""
+
+class SiteTest(TestCase):
+    # Method: setUp
+    # Purpose: Lay out an empty site: the templates, the stylesheet, and the
+    # config file, with no posts.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    def setUp(self):
+        self.site = mkdtemp()
+        copytree(join(ROOT, "templates"), join(self.site, "templates"))
+        makedirs(join(self.site, "html", "assets"))
+        copy(join(ROOT, "html", "assets", "main.css"), join(self.site, "html", "assets"))
+        makedirs(join(self.site, "content"))
+        with open(join(self.site, "Config.json"), "w", encoding="utf-8") as fd:
+            fd.write(CONFIG)
+
+    # Method: tearDown
+    # Purpose: Delete the site.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    def tearDown(self):
+        rmtree(self.site)
+
+    # Method: post
+    # Purpose: Add a post to the site, with its mod time set to its
+    # publication date, as `make timestamp` would.
+    # Parameters:
+    # - self: Class namespace
+    # - title: Post title (String)
+    # - pubdate: Publication date, like "2020/01/01 00:00:00" (String)
+    # - category: Post category (String)
+    # Return: none
+    def post(self, title, pubdate="2020/01/01 00:00:00", category="Tech"):
+        with open(join(self.site, "content", f"{title}.txt"), "w", encoding="utf-8") as fd:
+            fd.write(f"Type: original\nTitle: {title}\nLink: {title.lower()}.html\nPubdate: {pubdate}\nCategory: {category}\nAuthor: Tester\n\nFirst paragraph of {title}.\n\nSecond paragraph.\n")
+        pubtime = mktime(strptime(pubdate, "%Y/%m/%d %H:%M:%S"))
+        utime(join(self.site, "content", f"{title}.txt"), (pubtime, pubtime))
+
+    # Method: build
+    # Purpose: Build the site, and fail the test if the build fails.
+    # Parameters:
+    # - self: Class namespace
+    # - args: Command line arguments for blog.py (List)
+    # Return: Build output (String)
+    def build(self, *args):
+        result = run([executable, join(ROOT, "blog.py"), *args], cwd=self.site, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stdout+result.stderr)
+        self.assertNotIn("Traceback", result.stdout+result.stderr)
+        return result.stdout
+
+    # Method: read
+    # Purpose: Read an output file.
+    # Parameters:
+    # - self: Class namespace
+    # - path: Path to the file, relative to the output directory (String)
+    # - root: Output directory, relative to the site (String)
+    # Return: File contents (String)
+    def read(self, path, root="html"):
+        with open(join(self.site, root, path), "r", encoding="utf-8") as fd:
+            return fd.read()
+
+    # Method: pages
+    # Purpose: List the pages in the output directory.
+    # Parameters:
+    # - self: Class namespace
+    # - root: Output directory, relative to the site (String)
+    # Return: Paths relative to the output directory (List)
+    def pages(self, root="html"):
+        return sorted(relpath(join(x, y), join(self.site, root)) for x, _, files in walk(join(self.site, root)) for y in files if y.endswith(".html"))
+
+    # Method: files
+    # Purpose: Read every file in a site's output directory.
+    # Parameters:
+    # - self: Class namespace
+    # - site: Site directory (String)
+    # Return: Each file's contents, by path relative to the output directory
+    # (Dict)
+    def files(self, site):
+        files = {}
+        for root, _, names in walk(join(site, "html")):
+            for name in names:
+                with open(join(root, name), "rb") as fd:
+                    files[relpath(join(root, name), join(site, "html"))] = fd.read()
+        return files
+
+    # Method: assertFresh
+    # Purpose: Build a copy of the site's inputs from scratch, and check that
+    # it gives the same files the site's own builds left behind.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    def assertFresh(self):
+        site = mkdtemp()
+        try:
+            for each in ["templates", "content"]:
+                copytree(join(self.site, each), join(site, each))
+            makedirs(join(site, "html", "assets"))
+            copy(join(self.site, "html", "assets", "main.css"), join(site, "html", "assets"))
+            copy(join(self.site, "Config.json"), site)
+            result = run([executable, join(ROOT, "blog.py"), "--deterministic"], cwd=site, capture_output=True, text=True)
+            self.assertEqual(result.returncode, 0, result.stdout+result.stderr)
+            built, fresh = self.files(self.site), self.files(site)
+            self.assertEqual(sorted(built), sorted(fresh))
+            for path in fresh:
+                self.assertEqual(built[path], fresh[path], path)
+        finally:
+            rmtree(site)
+
+    # Method: changes
+    # Purpose: Build a site of 36 posts, then add, edit, delete, and move
+    # posts, build it again, and check it against a fresh build.
+    # Parameters:
+    # - self: Class namespace
+    # - per_page: Posts per archive and category page, or "0" (String)
+    # Return: none
+    def changes(self, per_page):
+        with open(join(self.site, "Config.json"), "w", encoding="utf-8") as fd:
+            fd.write(CONFIG.replace("\n}", f",\n    \"posts_per_page\" : \"{per_page}\"\n}}"))
+        for i in range(36):
+            self.post(f"Post {i}", f"2019/{i%12+1:02}/{i//12+1:02} 00:00:00", ["Tech", "Life"][i%2])
+        self.build("--deterministic")
+        self.post("New", "2020/06/01 00:00:00")
+        self.post("Old", "2018/01/01 00:00:00", "Life")
+        with open(join(self.site, "content", "Post 5.txt"), "a", encoding="utf-8") as fd:
+            fd.write("\nAn added paragraph.\n")
+        remove(join(self.site, "content", "Post 7.txt"))
+        self.post("Post 9", "2019/11/15 00:00:00", "Travel")
+        self.build("--deterministic")
+        self.assertFresh()
+
+    def test_empty_site(self):
+        self.build()
+        for page in ["index.html", "blog.html", "archives.html", "explore.html", "rss.xml", "atom.xml"]:
+            self.assertTrue(isfile(join(self.site, "html", page)), page)
+        self.assertNotIn("<article", self.read("explore.html"))
+
+    def test_empty_paginated_site(self):
+        with open(join(self.site, "Config.json"), "w", encoding="utf-8") as fd:
+            fd.write(CONFIG.replace("\n}", ",\n    \"posts_per_page\" : \"2\"\n}"))
+        self.build()
+        self.assertTrue(isfile(join(self.site, "html", "archives.html")))
+        self.assertTrue(isfile(join(self.site, "html", "explore.html")))
+
+    def test_pagination(self):
+        with open(join(self.site, "Config.json"), "w", encoding="utf-8") as fd:
+            fd.write(CONFIG.replace("\n}", ",\n    \"posts_per_page\" : \"2\"\n}"))
+        for i in range(5):
+            self.post(f"Post {i}", f"2020/01/{i+1:02} 00:00:00")
+        self.build()
+        self.assertEqual(["tech/1.html", "tech/2.html", "tech/3.html"], [x for x in self.pages() if x.startswith("tech/")])
+        for page, posts in [["tech/1.html", [0, 1]], ["tech/2.html", [2, 3]], ["tech/3.html", [4]]]:
+            for i in range(5):
+                self.assertEqual(i in posts, f"/blog/post-{i}.html" in self.read(page), page)
+        self.assertEqual(self.read("tech/3.html"), self.read("tech.html"))
+        older = {x:stat(join(self.site, "html", x)).st_mtime_ns for x in ["tech/1.html", "tech/2.html"]}
+        pages = {x:self.read(x) for x in older}
+        self.post("Post 5", "2020/01/06 00:00:00")
+        self.build()
+        for page in older:
+            self.assertEqual(pages[page], self.read(page), page)
+            self.assertEqual(older[page], stat(join(self.site, "html", page)).st_mtime_ns, page)
+        self.assertIn("/blog/post-5.html", self.read("tech/3.html"))
+        self.assertEqual(self.read("tech/3.html"), self.read("tech.html"))
+
+    def test_gzip(self):
+        self.build()
+        self.assertFalse(isfile(join(self.site, "html", "index.html.gz")))
+        with open(join(self.site, "Config.json"), "w", encoding="utf-8") as fd:
+            fd.write(CONFIG.replace("\n}", ",\n    \"gzip\" : \"yes\"\n}"))
+        self.build()
+        self.assertTrue(isfile(join(self.site, "html", "index.html.gz")))
+
+    def test_delete_every_post(self):
+        self.post("One")
+        self.post("Two")
+        self.build()
+        self.assertIn("First paragraph of One.", self.read("blog.html"))
+        for file in listdir(join(self.site, "content")):
+            remove(join(self.site, "content", file))
+        self.build()
+        self.assertNotIn("First paragraph of", self.read("blog.html"))
+        self.assertNotIn("<article", self.read("explore.html"))
+        self.assertNotIn("<item>", self.read("rss.xml"))
+
+    def test_incremental(self):
+        self.changes("0")
+
+    def test_incremental_paginated(self):
+        self.changes("2")
+
+    def test_touched_post(self):
+        self.post("One")
+        self.post("Two", "2020/01/02 00:00:00")
+        self.build()
+        blog = self.read("blog.html")
+        utime(join(self.site, "content", "One.txt"))
+        self.assertIn("-- Rendered: 0", self.build("-v"))
+        self.assertEqual(blog, self.read("blog.html"))
+
+    def test_edit_keeping_mtime(self):
+        self.post("One")
+        self.build()
+        info = stat(join(self.site, "content", "One.txt"))
+        with open(join(self.site, "content", "One.txt"), "a", encoding="utf-8") as fd:
+            fd.write("\nAn added paragraph.\n")
+        utime(join(self.site, "content", "One.txt"), ns=(info.st_atime_ns, info.st_mtime_ns))
+        self.build()
+        self.assertIn("An added paragraph.", self.read("blog/one.html"))
+
+    def test_edited_template(self):
+        self.post("One")
+        self.post("Two", "2019/05/01 00:00:00", "Life")
+        self.build()
+        with open(join(self.site, "templates", "main.html"), "r", encoding="utf-8") as fd:
+            template = fd.read()
+        with open(join(self.site, "templates", "main.html"), "w", encoding="utf-8") as fd:
+            fd.write(template.replace("</head>", "<meta name=\"generation\" content=\"new\">\n</head>"))
+        self.build()
+        for page in self.pages():
+            self.assertIn("content=\"new\"", self.read(page), page)
+
+    def test_edited_config(self):
+        self.post("One")
+        self.post("Two", "2019/05/01 00:00:00", "Life")
+        self.build()
+        with open(join(self.site, "Config.json"), "w", encoding="utf-8") as fd:
+            fd.write(CONFIG.replace("\"Test\"", "\"Renamed\"").replace("\n}", ",\n    \"unused\" : \"yes\"\n}"))
+        self.assertIn("-- Rendered: 2", self.build("-v"))
+        for page in self.pages():
+            self.assertIn("content=\"Renamed\"", self.read(page), page)
+        with open(join(self.site, "Config.json"), "w", encoding="utf-8") as fd:
+            fd.write(CONFIG.replace("\"Test\"", "\"Renamed\"").replace("\n}", ",\n    \"unused\" : \"no\"\n}"))
+        self.assertIn("-- Rendered: 0", self.build("-v"))
+
+    def test_deleted_page(self):
+        self.post("One")
+        self.build()
+        remove(join(self.site, "html", "blog", "one.html"))
+        self.build()
+        self.assertIn("First paragraph of One.", self.read("blog/one.html"))
+
+    def test_edited_page(self):
+        self.post("One")
+        self.build()
+        with open(join(self.site, "html", "blog", "one.html"), "a", encoding="utf-8") as fd:
+            fd.write("<p>Edited by hand.</p>\n")
+        self.build()
+        self.assertNotIn("Edited by hand.", self.read("blog/one.html"))
+
+    def test_deleted_post(self):
+        self.post("One")
+        self.post("Two", "2019/05/01 00:00:00", "Life")
+        self.build()
+        for page in ["blog/two.html", "blog/2019.html", "blog/2019-05.html", "life.html"]:
+            self.assertTrue(isfile(join(self.site, "html", page)), page)
+        remove(join(self.site, "content", "Two.txt"))
+        self.build()
+        for page in ["blog/two.html", "blog/2019.html", "blog/2019-05.html", "life.html"]:
+            self.assertFalse(isfile(join(self.site, "html", page)), page)
+        for page in ["blog/one.html", "blog/2020.html", "blog/2020-01.html", "tech.html"]:
+            self.assertTrue(isfile(join(self.site, "html", page)), page)
+
+    def test_moved_post(self):
+        self.post("One")
+        self.post("Two", "2020/01/02 00:00:00")
+        self.build()
+        remove(join(self.site, "content", "Two.txt"))
+        self.post("Second", "2020/02/01 00:00:00", "Life")
+        self.build()
+        self.assertFalse(isfile(join(self.site, "html", "blog", "two.html")))
+        for page in ["blog/second.html", "blog/2020-01.html", "blog/2020-02.html", "life.html", "tech.html"]:
+            self.assertTrue(isfile(join(self.site, "html", page)), page)
+        self.post("One", "2020/03/01 00:00:00", "Life")
+        self.build()
+        for page in ["blog/2020-01.html", "tech.html"]:
+            self.assertFalse(isfile(join(self.site, "html", page)), page)
+        self.assertTrue(isfile(join(self.site, "html", "blog", "2020-03.html")))
+
+    def test_emptied_paginated_category(self):
+        with open(join(self.site, "Config.json"), "w", encoding="utf-8") as fd:
+            fd.write(CONFIG.replace("\n}", ",\n    \"posts_per_page\" : \"1\"\n}"))
+        self.post("One")
+        self.post("Two", "2020/01/02 00:00:00", "Life")
+        self.post("Three", "2020/01/03 00:00:00", "Life")
+        self.build()
+        self.assertTrue(isfile(join(self.site, "html", "life", "2.html")))
+        remove(join(self.site, "content", "Two.txt"))
+        remove(join(self.site, "content", "Three.txt"))
+        self.build()
+        self.assertFalse(isfile(join(self.site, "html", "life.html")))
+        self.assertFalse(isdir(join(self.site, "html", "life")))
+        self.assertTrue(isfile(join(self.site, "html", "tech.html")))
+
+    def test_no_op(self):
+        self.post("One")
+        self.build()
+        manifest = stat(join(self.site, ".cache", "manifest")).st_mtime_ns
+        self.build()
+        self.assertEqual(manifest, stat(join(self.site, ".cache", "manifest")).st_mtime_ns)
+        with open(join(self.site, "templates", "index.html"), "a", encoding="utf-8") as fd:
+            fd.write("<p>Edited home page.</p>\n")
+        self.build()
+        self.assertIn("Edited home page.", self.read("index.html"))
+        page = self.read("blog/one.html")
+        with open(join(self.site, "html", "assets", "main.css"), "a", encoding="utf-8") as fd:
+            fd.write("\nbody { margin: 0; }\n")
+        self.build()
+        self.assertNotEqual(page, self.read("blog/one.html"))
+
+    def test_edited_favicon(self):
+        makedirs(join(self.site, "html", "assets", "images"))
+        with open(join(self.site, "html", "assets", "images", "favicon.ico"), "wb") as fd:
+            fd.write(b"old")
+        self.build()
+        self.build()
+        before = self.read("index.html")
+        with open(join(self.site, "html", "assets", "images", "favicon.ico"), "wb") as fd:
+            fd.write(b"new icon")
+        self.build()
+        self.assertNotEqual(before, self.read("index.html"))
+
+    def test_swap(self):
+        self.post("One")
+        self.build()
+        old = self.pages()
+        with open(join(self.site, "templates", "main.html"), "r", encoding="utf-8") as fd:
+            template = fd.read()
+        with open(join(self.site, "templates", "main.html"), "w", encoding="utf-8") as fd:
+            fd.write(template.replace("</head>", "<meta name=\"generation\" content=\"new\">\n</head>"))
+        self.build("-R")
+        self.assertFalse(isdir(join(self.site, "html.next")))
+        self.assertEqual(old, self.pages("html.prev"))
+        self.assertEqual(old, self.pages())
+        for root, new in [["html", True], ["html.prev", False]]:
+            self.assertTrue(isfile(join(self.site, root, "assets", "main.css")), root)
+            for page in self.pages(root):
+                self.assertEqual(new, "content=\"new\"" in self.read(page, root), f"{root}/{page}")
+        self.build("-U", "--exit")
+        for root, new in [["html", False], ["html.prev", True]]:
+            for page in self.pages(root):
+                self.assertEqual(new, "content=\"new\"" in self.read(page, root), f"{root}/{page}")
+        self.build("-U", "--exit")
+        for page in self.pages():
+            self.assertIn("content=\"new\"", self.read(page), page)
+
+    def test_rollback(self):
+        self.post("One")
+        self.build()
+        with open(join(self.site, "templates", "main.html"), "r", encoding="utf-8") as fd:
+            template = fd.read()
+        with open(join(self.site, "templates", "main.html"), "w", encoding="utf-8") as fd:
+            fd.write(template.replace("</head>", "<meta name=\"generation\" content=\"new\">\n</head>"))
+        self.build("-R")
+        self.build("-U", "--exit")
+        self.build()
+        pages = self.pages()
+        self.assertIn("blog/one.html", pages)
+        for page in pages:
+            self.assertIn("content=\"new\"", self.read(page), page)
+
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,48 @@
+# Purpose: Check that the render cache evicts the blocks used least recently,
+# even when one cache object serves several builds, as it does in a worker
+# kept warm in watch mode.
+
+# Import methods
+from unittest import TestCase, main # Test cases
+from tempfile import mkdtemp # Cache directory
+from shutil import rmtree # Cache directory
+from time import sleep # Last use
+from sys import path # First Crack's modules
+from os.path import dirname, abspath, join # First Crack's modules
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+from RenderCache import RenderCache # Render cache
+
+class RenderCacheTest(TestCase):
+    # Method: setUp
+    # Purpose: Create a cache with room for one block.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.cache = RenderCache("scope", join(self.dir, "render.db"), 4)
+
+    # Method: tearDown
+    # Purpose: Delete the cache.
+    # Parameters:
+    # - self: Class namespace
+    # Return: none
+    def tearDown(self):
+        self.cache.close()
+        rmtree(self.dir)
+
+    def test_evict_least_recently_used(self):
+        old, new = self.cache.key(["old"]), self.cache.key(["new"])
+        self.cache.store([[old, "", "<p>", ""]])
+        self.cache.commit()
+        sleep(0.01)
+        self.cache.store([[new, "", "<p>", ""]])
+        sleep(0.01)
+        self.cache.touch([[old, ""]])
+        self.cache.commit()
+        self.assertEqual(self.cache.evict(), 1)
+        self.assertEqual(list(self.cache.fetch([old, new])), [old])
+
+if (__name__ == "__main__"):
+    main()